@@ -1,25 +1,15 @@
-import argparse
-from flask import Flask
-from flask_restx import Api
-from src.api.resources import api_namespace
-from src.api.utils import set_api_key
+import os
 
-parser = argparse.ArgumentParser(description="Start Flask application.")
-parser.add_argument("--api-key", type=str, required=True, help="OpenWeatherMap API key")
-args = parser.parse_args()
-set_api_key(args.api_key)
+from src.api.app import build_parser, configure, create_app
 
-# Create the Api
-app = Flask(__name__)
-api = Api(
-    app,
-    version="1.0",
-    title="SnowbirdAPI",
-    description="An API for sunseekers",
-)
+args = build_parser("Start Flask application.").parse_args()
+# The debug reloader runs this file twice: in a process that only watches the source files
+# and in the server it (re)starts, which has WERKZEUG_RUN_MAIN set. Only the server prefetches.
+if __name__ == "__main__" and os.environ.get("WERKZEUG_RUN_MAIN") != "true":
+    args.prefetch_top = 0
+configure(args)
 
-# Add the resources from the namespace
-api.add_namespace(api_namespace, path="/api")
+app = create_app()
 
 if __name__ == "__main__":
     app.run(debug=True)  # Debug would be false in production
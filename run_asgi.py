@@ -0,0 +1,14 @@
+import uvicorn
+from src.api.app import build_parser, configure
+from src.api.asgi import create_asgi_app
+
+parser = build_parser("Start the ASGI application.")
+parser.add_argument("--host", type=str, default="127.0.0.1", help="Interface to bind")
+parser.add_argument("--port", type=int, default=5000, help="Port to listen on")
+args = parser.parse_args()
+configure(args)
+
+app = create_asgi_app()
+
+if __name__ == "__main__":
+    uvicorn.run(app, host=args.host, port=args.port)
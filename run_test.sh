@@ -18,4 +18,4 @@ pip install --upgrade pip
 pip install -r requirements.txt
 
 # Run tests
-python -m src.test.test_api
+python -m unittest discover -s src/test -t .
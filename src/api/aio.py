@@ -0,0 +1,299 @@
+import asyncio
+
+import httpx
+
+from src.api import fanout, gazetteer, metrics, quota, resolver, utils
+from src.api.cache import Negative, MISSING, normalize_key
+from src.api.singleflight import AsyncSingleFlight
+from src.api.upstream import (
+    RETRY_STATUSES,
+    CircuitBreaker,
+    CircuitOpenError,
+    backoff_delay,
+)
+
+# Non-blocking counterparts of the lookups in `utils`, used by the ASGI serving mode.
+# They share the caches and the gazetteer with `utils`, only the upstream I/O differs.
+
+
+class AsyncUpstream:
+    """Non-blocking counterpart of `upstream.Upstream`, built on a pooled httpx client."""
+
+    def __init__(
+        self,
+        name: str,
+        pool_size: int = 100,
+        connect_timeout: float = 3.05,
+        read_timeout: float = 10,
+        retries: int = 2,
+        backoff: float = 0.25,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30,
+    ):
+        self.name = name
+        self.pool_size = pool_size
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._client = None
+
+    # The client is created lazily so it binds to the event loop of the server
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.pool_size,
+                    max_keepalive_connections=self.pool_size,
+                ),
+            )
+        return self._client
+
+    async def get(self, url: str, params: dict = None) -> httpx.Response:
+        """Send a GET request, retrying 429/5xx responses and connection errors. Every
+        attempt goes through the upstream's rate limiter when it has one."""
+        if not self.breaker.allow():
+            metrics.upstream_rejected(self.name)
+            raise CircuitOpenError(
+                f"Circuit open for upstream {self.name}", self.breaker.retry_after()
+            )
+
+        client = self._get_client()
+        governor = quota.governor(self.name)
+        for attempt in range(self.retries + 1):
+            key, call_params = None, params
+            if governor is not None:
+                key, wait = governor.reserve()
+                await asyncio.sleep(wait)
+                call_params = governor.params(params, key)
+            started = metrics.upstream_started(self.name)
+            try:
+                response = await client.get(url, params=call_params)
+            except httpx.TransportError as err:
+                metrics.upstream_finished(self.name, started, error=err)
+                if attempt == self.retries:
+                    self.breaker.record_failure()
+                    raise
+                await asyncio.sleep(backoff_delay(self.backoff, attempt))
+                continue
+
+            metrics.upstream_finished(self.name, started, response.status_code)
+            if response.status_code == 429 and governor is not None:
+                governor.throttled(key, response.headers.get("Retry-After"))
+            if response.status_code in RETRY_STATUSES and attempt < self.retries:
+                retry_after = response.headers.get("Retry-After")
+                await asyncio.sleep(backoff_delay(self.backoff, attempt, retry_after))
+                continue
+            break
+
+        if response.status_code in RETRY_STATUSES:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+_upstreams = {
+    "restcountries": AsyncUpstream("restcountries"),
+    "openweathermap": AsyncUpstream("openweathermap"),
+}
+
+# Concurrent requests for the same region, country or coordinates share one upstream call
+upstream_flight = AsyncSingleFlight("upstream_async")
+
+
+# Replaces the upstream clients, e.g. to change timeouts or the number of retries
+def configure(**options):
+    for name in _upstreams:
+        _upstreams[name] = AsyncUpstream(name, **options)
+
+
+async def close():
+    for client in _upstreams.values():
+        await client.aclose()
+
+
+async def countries_by_continent(continent_name: str) -> list:
+    continent_name = continent_name.title()
+
+    if continent_name not in utils.continents():
+        valid_continents = ", ".join(utils.continents())
+        raise ValueError(
+            f"Invalid continent: {continent_name}. Valid continents are: {valid_continents}"
+        )
+
+    index = gazetteer.current()
+    if index is not None:
+        countries = index.region(continent_name)
+        if countries is None:
+            raise Exception(f"An error occurred: Region not found: {continent_name}")
+        return countries
+
+    cached = utils.continent_cache.get(continent_name)
+    if isinstance(cached, Negative):
+        raise Exception(cached.message)
+    if cached is not MISSING:
+        return list(cached)
+
+    return await upstream_flight.do(
+        ("region", continent_name), lambda: _fetch_region(continent_name)
+    )
+
+
+async def _fetch_region(continent_name: str) -> list:
+    REGION_URL = f"{utils.REST_COUNTRIES_URL}/region/{continent_name}"
+    try:
+        response = await _upstreams["restcountries"].get(REGION_URL)
+        response.raise_for_status()
+        countries = [country["name"]["common"] for country in response.json()]
+        utils.continent_cache.set(continent_name, countries)
+        return list(countries)
+    except httpx.HTTPStatusError as http_err:
+        message = f"HTTP error occurred: {http_err}"
+        if http_err.response.status_code == 404:
+            utils.continent_cache.set_negative(continent_name, message)
+        raise Exception(message)
+    except Exception as err:
+        raise Exception(f"An error occurred: {err}")
+
+
+async def country_info(country_name: str) -> dict:
+    # The resolver's dataset is downloaded in a worker thread, not on the event loop
+    if resolver.current(utils.country_cache.ttl, download=False) is None:
+        try:
+            await asyncio.to_thread(resolver.current, utils.country_cache.ttl)
+        except Exception:
+            pass  # Looked up through REST Countries' /name below
+    country_name, record = utils.resolve_country(country_name, download=False)
+    if record is not None:
+        return utils.country_details(record, country_name)
+
+    cached = utils.country_cache.get(country_name)
+    if isinstance(cached, Negative):
+        raise Exception(cached.message)
+    if cached is not MISSING:
+        return dict(cached)
+
+    return await upstream_flight.do(
+        ("country", normalize_key(country_name)), lambda: _fetch_country(country_name)
+    )
+
+
+async def _fetch_country(country_name: str) -> dict:
+    COUNTRY_URL = f"{utils.REST_COUNTRIES_URL}/name/{country_name}"
+    try:
+        response = await _upstreams["restcountries"].get(COUNTRY_URL)
+        response.raise_for_status()
+        info = utils.country_details(response.json()[0], country_name)
+        utils.country_cache.set(country_name, info)
+        return dict(info)
+    except httpx.HTTPStatusError as http_err:
+        message = f"HTTP error occurred: {http_err}"
+        if http_err.response.status_code == 404:
+            utils.country_cache.set_negative(country_name, message)
+        raise Exception(message)
+    except Exception as err:
+        raise Exception(f"An error occurred: {err}")
+
+
+# Calls an OpenWeatherMap endpoint for the coordinates of a country, going through the
+# weather cache shared with `utils`
+async def _weather_data(endpoint: str, country_name: str) -> dict:
+    details = await country_info(country_name)
+    lat, lon = utils.grid_point(details["latitude"], details["longitude"])
+    utils.weather_popularity.record((endpoint, lat, lon))
+
+    data, stale = utils.weather_cache_for(endpoint).get_stale((lat, lon))
+    if data is not MISSING:
+        if stale:
+            _refresh_in_background(endpoint, lat, lon)
+        return data
+
+    return await upstream_flight.do(
+        (endpoint, lat, lon), lambda: _fetch_weather_data(endpoint, lat, lon)
+    )
+
+
+async def _fetch_weather_data(endpoint: str, lat: float, lon: float) -> dict:
+    params = {"lat": lat, "lon": lon, "appid": utils.API_KEY, "units": "metric"}
+    response = await _upstreams["openweathermap"].get(
+        f"{utils.OPENWEATHERMAP_URL}/{endpoint}", params
+    )
+    response.raise_for_status()
+    data = response.json()
+    if endpoint == "forecast":
+        data = utils.forecast_series(data)
+    utils.weather_cache_for(endpoint).set((lat, lon), data)
+    return data
+
+
+# Background refreshes are kept referenced until they finish
+_refresh_tasks = set()
+
+
+def _refresh_in_background(endpoint: str, lat: float, lon: float):
+    async def refresh():
+        try:
+            await upstream_flight.do(
+                (endpoint, lat, lon), lambda: _fetch_weather_data(endpoint, lat, lon)
+            )
+        except Exception:
+            pass  # The stale entry keeps being served until its window ends
+
+    task = asyncio.ensure_future(refresh())
+    _refresh_tasks.add(task)
+    task.add_done_callback(_refresh_tasks.discard)
+
+
+async def temperature(country_name: str, allow_nowcast: bool = False) -> float:
+    if allow_nowcast:
+        return utils.nowcast_temperature(await _weather_data("forecast", country_name))
+    data = await _weather_data("weather", country_name)
+    return data["main"]["temp"]
+
+
+async def forecast(country_name: str, days: int) -> list:
+    data = await _weather_data("forecast", country_name)
+    return utils.forecast_entries(data, days)
+
+
+# Async counterpart of `utils.continent_temperatures_iter`: an unknown continent raises,
+# otherwise an async iterator yields each country's result as soon as it is ready
+async def continent_temperatures_iter(continent_name: str):
+    countries = await countries_by_continent(continent_name)
+    return _temperatures_as_completed(countries)
+
+
+async def _temperatures_as_completed(countries: list):
+    semaphore = asyncio.Semaphore(fanout.MAX_WORKERS)
+
+    async def bounded_temperature(country):
+        async with semaphore:
+            try:
+                return country, await temperature(country), None
+            except Exception as err:
+                return country, None, err
+
+    for result in asyncio.as_completed([bounded_temperature(c) for c in countries]):
+        yield utils.temperature_item(*await result)
+
+
+async def continent_temperatures(continent_name: str, top: int = None) -> dict:
+    temperatures = []
+    errors = []
+    async for item in await continent_temperatures_iter(continent_name):
+        (errors if "error" in item else temperatures).append(item)
+
+    # Sorted on the name too, the lookups finish in any order
+    temperatures.sort(key=lambda t: (-t["temperature"], t["country"]))
+    errors.sort(key=lambda e: e["country"])
+    if top is not None:
+        temperatures = temperatures[:top]
+
+    return {"temperatures": temperatures, "errors": errors}
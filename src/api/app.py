@@ -0,0 +1,276 @@
+import argparse
+from flask import Flask, g, request
+from flask_restx import Api
+from src.api.resources import api_namespace
+from src.api import (
+    aio,
+    charts,
+    encoding,
+    fanout,
+    gazetteer,
+    metrics,
+    prefetch,
+    quota,
+    upstream,
+)
+from src.api.utils import (
+    set_api_key,
+    configure_cache,
+    configure_favorites,
+    configure_weather_cache,
+    set_upstream_urls,
+)
+
+
+# The command line options shared by the Flask (run.py) and ASGI (run_asgi.py) entry points
+def build_parser(description: str) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument(
+        "--api-key",
+        type=str,
+        nargs="+",
+        required=True,
+        help="OpenWeatherMap API key, or several to rotate over",
+    )
+    parser.add_argument(
+        "--cache-ttl", type=float, default=86400, help="Seconds to cache country data"
+    )
+    parser.add_argument(
+        "--cache-size", type=int, default=512, help="Maximum number of cached countries"
+    )
+    parser.add_argument(
+        "--shared-cache",
+        type=str,
+        metavar="PATH",
+        help="Keep the country and weather caches, and the locally rendered charts, in a "
+        "SQLite file shared by all workers",
+    )
+    parser.add_argument(
+        "--weather-grid",
+        type=float,
+        default=0.1,
+        help="Size in degrees of the lat/lon grid cells weather is cached for",
+    )
+    parser.add_argument(
+        "--weather-ttl",
+        type=float,
+        default=600,
+        help="Seconds to cache current weather",
+    )
+    parser.add_argument(
+        "--forecast-ttl", type=float, default=10800, help="Seconds to cache forecasts"
+    )
+    parser.add_argument(
+        "--weather-stale",
+        type=float,
+        default=1800,
+        help="Seconds past its TTL current weather is served while being refreshed",
+    )
+    parser.add_argument(
+        "--forecast-stale",
+        type=float,
+        default=10800,
+        help="Seconds past its TTL a forecast is served while being refreshed",
+    )
+    parser.add_argument(
+        "--chart-renderer",
+        choices=charts.RENDERERS,
+        default="quickchart",
+        help="Link forecast charts to quickchart.io or render them locally",
+    )
+    parser.add_argument(
+        "--favorites-db",
+        type=str,
+        metavar="PATH",
+        help="Keep favorites in a SQLite file shared by all workers instead of memory",
+    )
+    parser.add_argument(
+        "--gazetteer",
+        type=str,
+        metavar="SNAPSHOT",
+        help="Answer country lookups offline from a JSON snapshot (downloaded if missing)",
+    )
+    parser.add_argument(
+        "--fanout-workers",
+        type=int,
+        default=16,
+        help="Maximum concurrent upstream calls per continent-wide request",
+    )
+    parser.add_argument(
+        "--connect-timeout", type=float, default=3.05, help="Upstream connect timeout"
+    )
+    parser.add_argument(
+        "--read-timeout", type=float, default=10, help="Upstream read timeout"
+    )
+    parser.add_argument(
+        "--retries", type=int, default=2, help="Retries on upstream 429/5xx responses"
+    )
+    parser.add_argument(
+        "--weather-rate",
+        type=float,
+        default=60,
+        help="OpenWeatherMap calls per minute per API key (0 disables rate limiting)",
+    )
+    parser.add_argument(
+        "--weather-burst",
+        type=float,
+        default=None,
+        help="OpenWeatherMap calls per API key that can be made at once (default: the "
+        "per-minute rate, as the provider counts calls per minute)",
+    )
+    parser.add_argument(
+        "--countries-rate",
+        type=float,
+        default=0,
+        help="REST Countries calls per minute (0 disables rate limiting)",
+    )
+    parser.add_argument(
+        "--quota-wait",
+        type=float,
+        default=2,
+        help="Seconds a call may wait for the rate limiter before it is refused with a 429",
+    )
+    parser.add_argument(
+        "--prefetch-top",
+        type=int,
+        default=0,
+        help="Warm the caches at startup and keep the weather of the N most requested "
+        "locations fresh in the background (0 disables prefetching)",
+    )
+    parser.add_argument(
+        "--prefetch-budget",
+        type=int,
+        default=30,
+        help="Upstream calls per minute prefetching may spend (mind the OpenWeatherMap quota)",
+    )
+    parser.add_argument(
+        "--prefetch-interval",
+        type=float,
+        default=30,
+        help="Seconds between two prefetch rounds",
+    )
+    parser.add_argument(
+        "--rest-countries-url",
+        type=str,
+        default=None,
+        help="Base URL of REST Countries (default https://restcountries.com/v3.1)",
+    )
+    parser.add_argument(
+        "--openweathermap-url",
+        type=str,
+        default=None,
+        help="Base URL of OpenWeatherMap (default http://api.openweathermap.org/data/2.5)",
+    )
+    parser.add_argument(
+        "--json-backend",
+        choices=encoding.JSON_BACKENDS,
+        default=encoding.JSON_BACKEND,
+        help="Library encoding JSON responses (orjson when installed)",
+    )
+    parser.add_argument(
+        "--compress-min-size",
+        type=int,
+        default=encoding.MIN_SIZE,
+        help="Smallest response in bytes compressed with brotli or gzip",
+    )
+    parser.add_argument(
+        "--server-timing",
+        action="store_true",
+        help="Add a Server-Timing header with upstream and total durations to responses",
+    )
+    return parser
+
+
+# Applies the parsed command line options to the api modules
+def configure(args):
+    set_api_key(args.api_key)
+    set_upstream_urls(args.rest_countries_url, args.openweathermap_url)
+    configure_cache(ttl=args.cache_ttl, maxsize=args.cache_size, path=args.shared_cache)
+    configure_favorites(args.favorites_db)
+    configure_weather_cache(
+        grid=args.weather_grid,
+        weather_ttl=args.weather_ttl,
+        forecast_ttl=args.forecast_ttl,
+        weather_stale=args.weather_stale,
+        forecast_stale=args.forecast_stale,
+        path=args.shared_cache,
+    )
+    upstream_options = {
+        "connect_timeout": args.connect_timeout,
+        "read_timeout": args.read_timeout,
+        "retries": args.retries,
+    }
+    upstream.configure(**upstream_options)
+    aio.configure(**upstream_options)
+    quota.configure(
+        "openweathermap",
+        per_minute=args.weather_rate or None,
+        burst=args.weather_burst,
+        keys=args.api_key,
+        key_param="appid",
+        max_wait=args.quota_wait,
+    )
+    if args.countries_rate > 0:
+        quota.configure(
+            "restcountries", per_minute=args.countries_rate, max_wait=args.quota_wait
+        )
+    fanout.set_max_workers(args.fanout_workers)
+    charts.set_renderer(args.chart_renderer)
+    charts.configure_store(args.shared_cache)
+    metrics.set_server_timing(args.server_timing)
+    encoding.configure(json_backend=args.json_backend, min_size=args.compress_min_size)
+    if args.gazetteer:
+        gazetteer.load(args.gazetteer)
+    if args.prefetch_top > 0:
+        prefetch.start(
+            top=args.prefetch_top,
+            budget=args.prefetch_budget,
+            interval=args.prefetch_interval,
+        )
+
+
+def create_app() -> Flask:
+    # Create the Api
+    app = Flask(__name__)
+    # 404s carry their own suggestions for unknown countries instead of route hints
+    app.config["ERROR_404_HELP"] = False
+    api = Api(
+        app,
+        version="1.0",
+        title="SnowbirdAPI",
+        description="An API for sunseekers",
+    )
+
+    # Add the resources from the namespace
+    api.add_namespace(api_namespace, path="/api")
+    # Faster JSON, MessagePack and compressed bodies, see `encoding`
+    encoding.register(api)
+    app.after_request(encoding.compress_response)
+
+    # Time every request by route, the rule rather than the path keeps the labels bounded
+    @app.before_request
+    def start_timing():
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        g.timing = metrics.start_request(route, request.method)
+
+    # Streamed bodies are produced after the teardown, their timing ends once the response
+    # is closed. Their headers are sent first, so they get no Server-Timing.
+    @app.after_request
+    def add_server_timing(response):
+        timing = g.get("timing")
+        if timing is not None:
+            timing.status = response.status_code
+            if response.is_streamed:
+                g.pop("timing")
+                response.call_on_close(lambda: metrics.finish_request(timing))
+            elif metrics.SERVER_TIMING:
+                response.headers["Server-Timing"] = metrics.server_timing(timing)
+        return response
+
+    @app.teardown_request
+    def finish_timing(error=None):
+        timing = g.pop("timing", None)
+        if timing is not None:
+            metrics.finish_request(timing)
+
+    return app
@@ -0,0 +1,334 @@
+import asyncio
+import logging
+import re
+from collections import namedtuple
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+from flask_restx import inputs
+
+from src.api import aio, charts, encoding, lookups, metrics, streaming, utils
+from src.api.app import create_app
+from src.api.http_cache import early_not_modified, validated_headers
+
+logger = logging.getLogger(__name__)
+
+# ASGI serving mode. The read-only lookups below await non-blocking upstream calls, so a
+# single process can hold many requests that are waiting on REST Countries or
+# OpenWeatherMap. Every other path (Swagger UI, swagger.json, favorites, status, metrics) is served
+# by the regular Flask app, which keeps all routes and models identical to run.py.
+# Argument checks, error statuses, caching headers and encoding are shared with the Flask
+# resources (see `lookups`, `http_cache` and `encoding`). What would block the event loop,
+# the SQLite reads behind Last-Modified, rendering charts and encoding bodies, runs in a
+# worker thread.
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str, headers: dict = None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+# Counts a failed lookup, returns the error to answer with (see `lookups.failure`)
+def _lookup_error(error: Exception, message: str = None) -> HTTPError:
+    status, message, retry_after = lookups.failure(error, message)
+    headers = {"Retry-After": str(retry_after)} if retry_after else {}
+    return HTTPError(status, message, headers)
+
+
+# Runs an argument check from `lookups`, returns its value or raises a 400
+def _checked(check, *args):
+    try:
+        return check(*args)
+    except ValueError as e:
+        raise HTTPError(400, str(e))
+
+
+# Returned by a handler to stream the items of an async iterator instead of one payload
+Stream = namedtuple("Stream", "items fmt")
+
+
+async def continent(continent_name, query, scope):
+    try:
+        countries = await aio.countries_by_continent(continent_name)
+        return {"continent": continent_name, "countries": countries}
+    except Exception as e:
+        raise _lookup_error(e)
+
+
+async def continent_temperatures(continent_name, query, scope):
+    top = _checked(lookups.check_top, _int_arg(query, "top", None))
+    fmt = _checked(
+        lookups.stream_format,
+        query.get("stream", [None])[0],
+        _header(scope, b"accept"),
+        top,
+    )
+    try:
+        if fmt is not None:
+            return Stream(await aio.continent_temperatures_iter(continent_name), fmt)
+        result = await aio.continent_temperatures(continent_name, top)
+        return {"continent": continent_name, **result}
+    except Exception as e:
+        raise _lookup_error(e)
+
+
+async def country(country_name, query, scope):
+    try:
+        return await aio.country_info(country_name)
+    except Exception as e:
+        raise _lookup_error(e)
+
+
+async def temperature(country_name, query, scope):
+    allow_nowcast = _bool_arg(query, "nowcast")
+    try:
+        return {"temperature": await aio.temperature(country_name, allow_nowcast)}
+    except Exception as e:
+        raise _lookup_error(e)
+
+
+async def forecast(country_name, query, scope):
+    days = _checked(lookups.check_days, _int_arg(query, "days", 1))
+    renderer = _checked(
+        lookups.check_renderer, query.get("render", [charts.RENDERER])[0]
+    )
+    try:
+        forecasts = await aio.forecast(country_name, days)
+        config = charts.chart_config(country_name, days, forecasts)
+        if renderer == "local":
+            chart_hash = await asyncio.to_thread(charts.store_chart, config)
+            chart_url = f"{_base_url(scope)}/api/charts/{chart_hash}"
+        else:
+            chart_url = charts.quickchart_url(config)
+        return {"forecast_url": chart_url}
+    except Exception as e:
+        raise _lookup_error(e)
+
+
+Route = namedtuple("Route", "rule pattern handler max_age last_modified")
+
+
+def _route(rule: str, handler, max_age, last_modified=None) -> Route:
+    pattern = re.compile("^" + re.sub(r"<string:\w+>", "([^/]+)", rule) + "$")
+    return Route(rule, pattern, handler, max_age, last_modified)
+
+
+# Each route has the Flask rule it mirrors (also its label in the metrics), its handler,
+# the max-age of its responses and what Last-Modified is derived from, like the
+# `conditional` decorators in resources.py
+ROUTES = [
+    _route(
+        "/api/continents/<string:continent_name>",
+        continent,
+        lambda: utils.continent_cache.ttl,
+        lambda name, query: utils.data_timestamp("continent", name),
+    ),
+    _route(
+        "/api/continents/<string:continent_name>/temperatures",
+        continent_temperatures,
+        lambda: utils.weather_cache.ttl,
+    ),
+    _route(
+        "/api/countries/<string:country_name>",
+        country,
+        lambda: utils.country_cache.ttl,
+        lambda name, query: utils.data_timestamp("country", name),
+    ),
+    _route(
+        "/api/countries/<string:country_name>/temperature",
+        temperature,
+        lambda: utils.weather_cache.ttl,
+        lambda name, query: (
+            None
+            if _bool_arg(query, "nowcast")
+            else utils.data_timestamp("weather", name)
+        ),
+    ),
+    _route(
+        "/api/countries/<string:country_name>/forecast",
+        forecast,
+        lambda: utils.forecast_cache.ttl,
+        lambda name, query: utils.data_timestamp("forecast", name),
+    ),
+]
+
+
+# Mirrors Flask's `request.args.get(name, default, type=int)`, invalid values give the default
+def _int_arg(query: dict, name: str, default):
+    try:
+        return int(query[name][0])
+    except (KeyError, ValueError):
+        return default
+
+
+# The request headers by lowercase name, like Flask's case-insensitive `request.headers`
+def _headers(scope: dict) -> dict:
+    return {
+        name.decode().lower(): value.decode()
+        for name, value in scope.get("headers", [])
+    }
+
+
+def _header(scope: dict, name: bytes) -> str:
+    return _headers(scope).get(name.decode(), "")
+
+
+# The scheme and host the request was made to, like Flask's `request.host_url`
+def _base_url(scope: dict) -> str:
+    host = _header(scope, b"host")
+    if not host and scope.get("server"):
+        host = "%s:%s" % scope["server"]
+    return f"{scope.get('scheme', 'http')}://{host}"
+
+
+def _bool_arg(query: dict, name: str) -> bool:
+    try:
+        return inputs.boolean(query[name][0])
+    except (KeyError, ValueError):
+        return False
+
+
+# Sends the payload encoded, and compressed, as the request accepts (see `encoding`)
+async def _send_payload(send, scope: dict, status: int, payload, headers: dict):
+    body = b""
+    if status != 304:
+        body, body_headers = await asyncio.to_thread(
+            encoding.encode_response,
+            payload,
+            status,
+            encoding.negotiate_type(_header(scope, b"accept")),
+            _header(scope, b"accept-encoding"),
+            headers.get("ETag"),
+        )
+        headers = {**headers, **body_headers}
+    else:
+        headers = {**headers, "Vary": encoding.VARY}
+    response_headers = [(b"content-length", str(len(body)).encode())]
+    for name, value in headers.items():
+        response_headers.append((name.lower().encode(), value.encode()))
+    await send(
+        {"type": "http.response.start", "status": status, "headers": response_headers}
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+# Runs the handler of a route, returns the status, payload and headers of the response.
+# A request holding the ETag of the data's version is answered without running it.
+async def _respond(route: Route, name: str, scope: dict) -> tuple:
+    query_string = scope.get("query_string", b"").decode()
+    query = parse_qs(query_string)
+    url = f"{_base_url(scope)}{scope['path']}?{query_string}"
+    request_headers = _headers(scope)
+    try:
+        before = await _last_modified(route, name, query)
+        if before is not None:
+            headers = early_not_modified(
+                before, route.max_age(), False, url, request_headers
+            )
+            if headers is not None:
+                return 304, None, headers
+        payload = await route.handler(name, query, scope)
+    except HTTPError as e:
+        return e.status, {"message": str(e)}, dict(e.headers)
+    except Exception:
+        # Logged like Flask logs the unhandled exceptions of its views
+        logger.exception("Exception on %s [%s]", scope["path"], scope["method"])
+        return (
+            500,
+            {
+                "message": "The server encountered an internal error and was unable to complete your request."
+            },
+            {},
+        )
+
+    if isinstance(payload, Stream):
+        return 200, payload, streaming.headers(payload.fmt)
+
+    modified = await _last_modified(route, name, query)
+    # Hashes the payload when its data has no version, off the event loop too
+    headers, not_modified = await asyncio.to_thread(
+        validated_headers,
+        payload,
+        before,
+        modified,
+        route.max_age(),
+        False,
+        url,
+        request_headers,
+    )
+    if not_modified:
+        return 304, None, headers
+    return 200, payload, headers
+
+
+# The route's Last-Modified timestamp, read from the caches in a worker thread
+async def _last_modified(route: Route, name: str, query: dict):
+    if route.last_modified is None:
+        return None
+    return await asyncio.to_thread(route.last_modified, name, query)
+
+
+# Sends every item as its own body chunk, as soon as the iterator yields it
+async def _send_stream(send, stream: Stream, headers: dict):
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+        }
+    )
+    count = 0
+    async for item in stream.items:
+        count += 1
+        body = streaming.encode_item(item, stream.fmt).encode()
+        await send({"type": "http.response.body", "body": body, "more_body": True})
+    body = streaming.encode_end(count, stream.fmt).encode()
+    await send({"type": "http.response.body", "body": body})
+
+
+def create_asgi_app(flask_app=None):
+    flask_app = flask_app or create_app()
+    wsgi_app = WsgiToAsgi(flask_app)
+    # Flask's routes without variables, e.g. /api/countries/query, take precedence over
+    # the routes above that would match them, like they do in Flask
+    static_paths = {
+        rule.rule for rule in flask_app.url_map.iter_rules() if not rule.arguments
+    }
+
+    async def app(scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await aio.close()
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+
+        if (
+            scope["type"] == "http"
+            and scope["method"] == "GET"
+            and scope["path"] not in static_paths
+        ):
+            for route in ROUTES:
+                match = route.pattern.match(scope["path"])
+                if match is None:
+                    continue
+                timing = metrics.start_request(route.rule, "GET")
+                status, payload, headers = await _respond(route, match.group(1), scope)
+                # Streamed bodies take longer than the headers they follow
+                if metrics.SERVER_TIMING and not isinstance(payload, Stream):
+                    headers["Server-Timing"] = metrics.server_timing(timing)
+                if isinstance(payload, Stream):
+                    await _send_stream(send, payload, headers)
+                else:
+                    await _send_payload(send, scope, status, payload, headers)
+                metrics.finish_request(timing, status)
+                return
+
+        await wsgi_app(scope, receive, send)
+
+    return app
@@ -0,0 +1,181 @@
+import heapq
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+# Returned by `TTLCache.get` when a key is absent or expired
+MISSING = object()
+
+# Stored in place of a value when an upstream lookup is known to fail (e.g. unknown country)
+Negative = namedtuple("Negative", ["message"])
+
+
+# Normalizes string keys so "belgium", "Belgium " and "BELGIUM" share one entry
+def normalize_key(key):
+    if isinstance(key, str):
+        return " ".join(key.split()).casefold()
+    return key
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after a time-to-live.
+
+    With a `stale_ttl`, expired entries are kept that much longer so `get_stale` can still
+    serve them while they are being refreshed (stale-while-revalidate).
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: float = 86400,
+        negative_ttl: float = 300,
+        stale_ttl: float = 0,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.stale_ttl = stale_ttl
+        # key -> (value, expires_at, stale_until, stored_at), stored_at is wall-clock time
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=MISSING):
+        """Return the cached value (or a `Negative`), `default` if absent or expired."""
+        value, stale = self.get_stale(key, default, allow_stale=False)
+        return value
+
+    def get_stale(self, key, default=MISSING, allow_stale: bool = True) -> tuple:
+        """Return (value, is_stale); expired entries are returned while in their stale window."""
+        key = normalize_key(key)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default, False
+            value, expires_at, stale_until, stored_at = entry
+            now = time.monotonic()
+            if stale_until <= now:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default, False
+            stale = expires_at <= now
+            if stale and not allow_stale:
+                self.misses += 1
+                return default, False
+            self._data.move_to_end(key)  # Mark as most recently used
+            if isinstance(value, Negative):
+                self.negative_hits += 1
+            elif stale:
+                self.stale_hits += 1
+            else:
+                self.hits += 1
+            return value, stale
+
+    def set(self, key, value, ttl: float = None):
+        """Store a value, evicting the least recently used entry when full."""
+        if self.maxsize <= 0:
+            return
+        key = normalize_key(key)
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl
+        stale_until = (
+            expires_at if isinstance(value, Negative) else expires_at + self.stale_ttl
+        )
+        with self._lock:
+            self._data[key] = (value, expires_at, stale_until, time.time())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def peek(self, key) -> tuple:
+        """Return (value, stored_at) without counting a hit or refreshing the LRU order."""
+        with self._lock:
+            entry = self._data.get(normalize_key(key))
+        if entry is None or entry[2] <= time.monotonic():
+            return MISSING, None
+        return entry[0], entry[3]
+
+    def expires_in(self, key):
+        """Seconds until the entry expires (negative once stale), None if absent."""
+        with self._lock:
+            entry = self._data.get(normalize_key(key))
+        now = time.monotonic()
+        if entry is None or entry[2] <= now:
+            return None
+        return entry[1] - now
+
+    def set_negative(self, key, message: str):
+        """Remember that a lookup failed, for the (shorter) negative TTL."""
+        self.set(key, Negative(message), ttl=self.negative_ttl)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "negative_hits": self.negative_hits,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class Popularity:
+    """Thread-safe access counts that fade over time, to find the most requested keys.
+
+    `decay` scales every count down, so keys that stop being requested drop out of `top`.
+    When more than `maxsize` keys are tracked the least requested half is forgotten.
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def record(self, key, weight: float = 1):
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + weight
+            if len(self._counts) > self.maxsize:
+                keep = heapq.nlargest(
+                    self.maxsize // 2, self._counts.items(), key=lambda kv: kv[1]
+                )
+                self._counts = dict(keep)
+
+    def top(self, n: int) -> list:
+        """The n most requested keys, most requested first."""
+        with self._lock:
+            return [
+                key
+                for key, count in heapq.nlargest(
+                    n, self._counts.items(), key=lambda kv: kv[1]
+                )
+            ]
+
+    def decay(self, factor: float, floor: float = 0.05):
+        with self._lock:
+            self._counts = {
+                key: count * factor
+                for key, count in self._counts.items()
+                if count * factor >= floor
+            }
+
+    def __len__(self):
+        return len(self._counts)
@@ -0,0 +1,136 @@
+import hashlib
+import json
+from urllib.parse import urlencode
+from xml.sax.saxutils import escape
+
+from src.api.cache import TTLCache, MISSING
+from src.api.shared_cache import create_cache
+
+# How forecast charts are rendered: "quickchart" links to quickchart.io, "local" renders an
+# SVG in-process and links to the /charts endpoint
+RENDERERS = ("quickchart", "local")
+RENDERER = "quickchart"
+
+# Rendered charts by content hash. The same series always renders to the same image,
+# so entries never go stale, they are only evicted when the cache is full.
+chart_store = TTLCache(maxsize=256, ttl=7 * 86400)
+
+WIDTH, HEIGHT = 800, 400
+MARGIN_LEFT, MARGIN_RIGHT, MARGIN_TOP, MARGIN_BOTTOM = 60, 20, 50, 70
+
+
+# Replaces the chart store. With a `path` it is kept in that SQLite file, so a chart linked to
+# by one worker can be served by any other one, and after a restart.
+def configure_store(path: str = None, maxsize: int = 256):
+    global chart_store
+    chart_store = create_cache(path, "charts", maxsize=maxsize, ttl=7 * 86400)
+
+
+def set_renderer(renderer: str):
+    global RENDERER
+    if renderer not in RENDERERS:
+        raise ValueError(
+            f"Invalid renderer: {renderer}. Valid renderers are: {', '.join(RENDERERS)}"
+        )
+    RENDERER = renderer
+
+
+# The Chart.js configuration plotting the 3-hourly forecast temperatures
+def chart_config(country_name: str, days: int, forecasts: list) -> dict:
+    labels = [f["time"] for f in forecasts]
+    temps = [f["temperature"] for f in forecasts]
+
+    return {
+        "type": "line",
+        "data": {
+            "labels": labels,
+            "datasets": [
+                {
+                    "label": f"3-Hourly Temperature Forecast for {days} Day(s)",
+                    "data": temps,
+                    "fill": 0,
+                    "borderColor": "rgb(75, 192, 192)",
+                    "tension": 0.1,
+                }
+            ],
+        },
+        "options": {
+            "title": {
+                "display": 1,
+                "text": f"Temperature Forecast for {country_name.title()}",
+            }
+        },
+    }
+
+
+def _to_json(config: dict) -> str:
+    return json.dumps(config, separators=(",", ":"), sort_keys=True)
+
+
+def quickchart_url(config: dict) -> str:
+    return f"https://quickchart.io/chart?{urlencode({'c': _to_json(config)})}"
+
+
+def chart_hash(config: dict) -> str:
+    return hashlib.sha256(_to_json(config).encode()).hexdigest()[:32]
+
+
+# Draws a line chart as SVG: title, y axis with 5 ticks, every 8th label (one per day) on x
+def render_svg(config: dict) -> bytes:
+    labels = config["data"]["labels"]
+    dataset = config["data"]["datasets"][0]
+    temps = dataset["data"]
+    title = config["options"]["title"]["text"]
+
+    plot_width = WIDTH - MARGIN_LEFT - MARGIN_RIGHT
+    plot_height = HEIGHT - MARGIN_TOP - MARGIN_BOTTOM
+    low, high = (min(temps), max(temps)) if temps else (0, 1)
+    if high - low < 1:
+        low, high = low - 0.5, high + 0.5
+
+    def x(i):
+        return MARGIN_LEFT + plot_width * (i / max(len(temps) - 1, 1))
+
+    def y(t):
+        return MARGIN_TOP + plot_height * (1 - (t - low) / (high - low))
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{WIDTH}" height="{HEIGHT}" '
+        f'viewBox="0 0 {WIDTH} {HEIGHT}" font-family="sans-serif" font-size="11">',
+        f'<rect width="{WIDTH}" height="{HEIGHT}" fill="white"/>',
+        f'<text x="{WIDTH / 2}" y="22" text-anchor="middle" font-size="15">{escape(title)}</text>',
+        f'<text x="{WIDTH / 2}" y="38" text-anchor="middle" fill="#666">{escape(dataset["label"])}</text>',
+    ]
+    for step in range(5):
+        t = low + (high - low) * step / 4
+        parts.append(
+            f'<line x1="{MARGIN_LEFT}" x2="{WIDTH - MARGIN_RIGHT}" y1="{y(t):.1f}" '
+            f'y2="{y(t):.1f}" stroke="#e5e5e5"/>'
+            f'<text x="{MARGIN_LEFT - 6}" y="{y(t) + 4:.1f}" text-anchor="end">{t:.1f}</text>'
+        )
+    for i in range(0, len(labels), 8):
+        parts.append(
+            f'<text x="{x(i):.1f}" y="{HEIGHT - MARGIN_BOTTOM + 16}" '
+            f'text-anchor="middle">{escape(str(labels[i]))}</text>'
+        )
+    points = " ".join(f"{x(i):.1f},{y(t):.1f}" for i, t in enumerate(temps))
+    parts.append(
+        f'<polyline points="{points}" fill="none" stroke="{dataset["borderColor"]}" '
+        f'stroke-width="2"/>'
+    )
+    parts.append("</svg>")
+    return "".join(parts).encode()
+
+
+# Renders a chart unless an identical one is already stored, returns its content hash
+def store_chart(config: dict) -> str:
+    key = chart_hash(config)
+    if chart_store.get(key) is MISSING:
+        chart_store.set(key, render_svg(config))
+    return key
+
+
+# Returns the rendered SVG for a content hash, None if unknown or evicted
+def get_chart(key: str):
+    image = chart_store.get(key)
+    return None if image is MISSING else image
@@ -0,0 +1,130 @@
+import threading
+import time
+
+import numpy as np
+
+from src.api import gazetteer, utils
+from src.api.cache import normalize_key
+
+# Column-oriented copy of the full country dataset for analytical queries. Every field is
+# one NumPy array, so filters and sorts run over all ~250 countries at once instead of
+# one upstream lookup per country. Missing numbers are NaN, and "Unknown" in responses.
+
+STRING_FIELDS = ("name", "capital", "region", "subregion")
+NUMERIC_FIELDS = ("population", "area", "latitude", "longitude")
+FIELDS = STRING_FIELDS + NUMERIC_FIELDS
+
+
+def _number(value) -> float:
+    return float(value) if isinstance(value, (int, float)) else np.nan
+
+
+class CountryTable:
+    """The countries of the REST Countries dataset, one array per field."""
+
+    def __init__(self, records: list, built_at: float = None):
+        self.built_at = time.time() if built_at is None else built_at
+        details = []
+        for record in records:
+            name = record["name"]["common"]
+            info = utils.country_details(record, name)
+            info["region"] = record.get("region") or "Unknown"
+            info["subregion"] = record.get("subregion") or "Unknown"
+            details.append(info)
+
+        self.columns = {
+            field: np.array([d[field] for d in details], dtype=str)
+            for field in STRING_FIELDS
+        }
+        for field in NUMERIC_FIELDS:
+            self.columns[field] = np.array(
+                [_number(d[field]) for d in details], dtype=np.float64
+            )
+        # Lowercase copies for case-insensitive region matching
+        self._regions = np.array(
+            [normalize_key(d["region"]) for d in details], dtype=str
+        )
+        self._subregions = np.array(
+            [normalize_key(d["subregion"]) for d in details], dtype=str
+        )
+
+    def __len__(self):
+        return len(self.columns["name"])
+
+    def query(
+        self,
+        fields=FIELDS,
+        region: str = None,
+        ranges: dict = None,
+        sort: str = None,
+        descending: bool = False,
+        offset: int = 0,
+        limit: int = None,
+    ) -> tuple:
+        """Returns (total number of matches, the requested page of rows).
+
+        `region` matches a region or subregion, `ranges` maps numeric fields to inclusive
+        (low, high) bounds (either may be None) and excludes countries where it is unknown.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if region is not None:
+            key = normalize_key(region)
+            mask &= (self._regions == key) | (self._subregions == key)
+        for field, (low, high) in (ranges or {}).items():
+            column = self.columns[field]
+            if low is not None:
+                mask &= column >= low
+            if high is not None:
+                mask &= column <= high
+
+        rows = np.flatnonzero(mask)
+        if sort is not None:
+            keys = self.columns[sort][rows]
+            if sort in NUMERIC_FIELDS:
+                # Negating keeps the countries where the field is unknown (NaN) last
+                order = np.argsort(-keys if descending else keys, kind="stable")
+            else:
+                order = np.argsort(keys, kind="stable")
+                if descending:
+                    order = order[::-1]
+            rows = rows[order]
+
+        page = rows[offset : None if limit is None else offset + limit]
+        return len(rows), [self.row(index, fields) for index in page]
+
+    def row(self, index: int, fields) -> dict:
+        row = {}
+        for field in fields:
+            value = self.columns[field][index]
+            if field in STRING_FIELDS:
+                row[field] = str(value)
+            elif np.isnan(value):
+                row[field] = "Unknown"
+            elif field == "population":
+                row[field] = int(value)
+            else:
+                row[field] = float(value)
+        return row
+
+
+# The table and the records it was built from
+_table = None
+_source = None
+_lock = threading.Lock()
+
+
+# The table for the current data: built from the gazetteer when one is loaded, otherwise
+# from a download of the full dataset that is repeated once the country cache TTL passed
+def table() -> CountryTable:
+    global _table, _source
+    records, produced_at = gazetteer.dataset(utils.country_cache.ttl)
+    with _lock:
+        if _table is None or _source is not records:
+            _table = CountryTable(records, produced_at)
+            _source = records
+        return _table
+
+
+# When the data behind the table was produced, None before it is first built
+def built_at():
+    return _table.built_at if _table is not None else None
@@ -0,0 +1,253 @@
+import gzip
+import json
+
+from flask import make_response, request
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header, parse_list_header
+
+from src.api.cache import MISSING, TTLCache
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Response bodies: JSON through orjson when it is installed (or the standard library),
+# MessagePack for clients asking for it with `Accept: application/msgpack`, compressed
+# with brotli or gzip when the client accepts it and the body is at least `MIN_SIZE` bytes.
+# Bodies of responses with an ETag only depend on it, the media type and the compression,
+# so they are encoded and compressed once and reused until evicted. Every media type and
+# coding of a response is a representation of its own, with the ETag suffixed to match.
+
+JSON = "application/json"
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack")
+MEDIA_TYPES = (JSON, *MSGPACK_TYPES) if msgpack is not None else (JSON,)
+
+# The request headers a response body depends on
+VARY = "Accept, Accept-Encoding" if len(MEDIA_TYPES) > 1 else "Accept-Encoding"
+
+JSON_BACKENDS = ("orjson", "json")
+JSON_BACKEND = "orjson" if orjson is not None else "json"
+
+# Content codings by preference, brotli compresses JSON ~15% better than gzip
+CODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+# Smallest body worth compressing, below it the headers outweigh the savings
+MIN_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # Of 11: close to the best ratio at a fraction of the CPU
+
+_COMPRESSIBLE = (JSON, *MSGPACK_TYPES, "image/svg+xml")
+
+# Encoded and compressed bodies by (ETag, media type, coding)
+body_cache = TTLCache(maxsize=1024, ttl=86400)
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def configure(json_backend: str = None, min_size: int = MIN_SIZE, cache_size=1024):
+    global JSON_BACKEND, MIN_SIZE, body_cache
+    if json_backend is not None:
+        if json_backend not in JSON_BACKENDS:
+            raise ValueError(
+                f"Invalid JSON backend: {json_backend}. Valid backends are: "
+                f"{', '.join(JSON_BACKENDS)}"
+            )
+        if json_backend == "orjson" and orjson is None:
+            raise ValueError("The orjson JSON backend needs the orjson package")
+        JSON_BACKEND = json_backend
+    MIN_SIZE = min_size
+    body_cache = TTLCache(maxsize=cache_size, ttl=86400)
+
+
+# Values neither encoder handles natively: named tuples (orjson) and numpy scalars (json)
+def _default(value):
+    if isinstance(value, tuple):
+        return list(value)
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+
+def dumps_json(payload) -> bytes:
+    if JSON_BACKEND == "orjson":
+        options = _ORJSON_OPTIONS | orjson.OPT_APPEND_NEWLINE
+        return orjson.dumps(payload, default=_default, option=options)
+    body = json.dumps(payload, default=_default, separators=(",", ":"))
+    return (body + "\n").encode()
+
+
+# The same bytes for the same data whatever the key order, the input of ETags
+def canonical(payload) -> bytes:
+    if JSON_BACKEND == "orjson":
+        options = _ORJSON_OPTIONS | orjson.OPT_SORT_KEYS
+        return orjson.dumps(payload, default=_default, option=options)
+    body = json.dumps(payload, default=_default, sort_keys=True, separators=(",", ":"))
+    return body.encode()
+
+
+def encode(payload, media_type: str = JSON) -> bytes:
+    if media_type in MSGPACK_TYPES:
+        return msgpack.packb(payload, default=_default, use_bin_type=True)
+    return dumps_json(payload)
+
+
+def compress(body: bytes, coding: str) -> bytes:
+    if coding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, GZIP_LEVEL, mtime=0)
+
+
+# The media type to answer an Accept header with, JSON unless MessagePack is preferred
+def negotiate_type(accept: str) -> str:
+    return parse_accept_header(accept, MIMEAccept).best_match(MEDIA_TYPES, JSON)
+
+
+# The preferred content coding an Accept-Encoding header allows, None for no compression
+def negotiate_coding(accept_encoding: str):
+    weights = {}
+    for item in parse_list_header(accept_encoding or ""):
+        coding, _, params = item.partition(";")
+        weight = 1.0
+        if params.strip().startswith("q="):
+            try:
+                weight = float(params.strip()[2:])
+            except ValueError:
+                weight = 0.0
+        weights[coding.strip().lower()] = weight
+    default = weights.get("*", 0.0)
+    accepted = [c for c in CODINGS if weights.get(c, default) > 0]
+    return max(accepted, key=lambda c: weights.get(c, default), default=None)
+
+
+def compressible(media_type: str) -> bool:
+    return media_type in _COMPRESSIBLE or media_type.startswith("text/")
+
+
+def _suffixed(etag: str, suffix: str) -> str:
+    return f'{etag[:-1]}-{suffix}"'
+
+
+# The ETag of a response's body in a media type and coding: '"abc"' is the JSON body,
+# '"abc-msgpack-br"' the brotli compressed MessagePack one
+def variant_etag(etag: str, media_type: str = JSON, coding: str = None) -> str:
+    if etag is None:
+        return None
+    if media_type != JSON:
+        etag = _suffixed(etag, media_type.split("/")[-1])
+    if coding is not None:
+        etag = _suffixed(etag, coding)
+    return etag
+
+
+# The ETags a request can be answered with: compressed as it accepts when the body is large
+# enough, or not
+def variant_etags(etag: str, accept: str, accept_encoding: str) -> list:
+    media_type = negotiate_type(accept)
+    etags = [variant_etag(etag, media_type)]
+    coding = negotiate_coding(accept_encoding)
+    if coding is not None and compressible(media_type):
+        etags.insert(0, variant_etag(etag, media_type, coding))
+    return etags
+
+
+# Builds a body, or reuses the one built earlier for the same ETag
+def _cached(key, build) -> bytes:
+    if key[0] is None:
+        return build()
+    body = body_cache.get(key)
+    if body is MISSING:
+        body = build()
+        body_cache.set(key, body)
+    return body
+
+
+def render(payload, media_type: str = JSON, etag: str = None) -> bytes:
+    return _cached((etag, media_type, None), lambda: encode(payload, media_type))
+
+
+# The body compressed for the client, with the coding used (None if left as it is)
+def compressed(body: bytes, media_type: str, accept_encoding: str, etag=None) -> tuple:
+    if len(body) < MIN_SIZE or not compressible(media_type):
+        return body, None
+    coding = negotiate_coding(accept_encoding)
+    if coding is None:
+        return body, None
+    return _cached((etag, media_type, coding), lambda: compress(body, coding)), coding
+
+
+# The body of a payload in `media_type`, compressed as the request accepts when the status
+# is 200, with its Content-Type, Content-Encoding, Vary and variant ETag headers. `etag` is
+# the payload's ETag, if it has one.
+def encode_response(
+    payload, status: int, media_type: str, accept_encoding: str, etag: str = None
+) -> tuple:
+    etag = etag if status == 200 else None
+    body = render(payload, media_type, etag)
+    coding = None
+    if status == 200:
+        body, coding = compressed(body, media_type, accept_encoding, etag)
+    headers = {"Content-Type": media_type, "Vary": VARY}
+    if coding is not None:
+        headers["Content-Encoding"] = coding
+    if etag is not None:
+        headers["ETag"] = variant_etag(etag, media_type, coding)
+    return body, headers
+
+
+# Flask-RESTX representation for a media type, see `register`
+def _representation(media_type: str):
+    def output(data, code, headers=None):
+        body, body_headers = encode_response(
+            data,
+            code,
+            media_type,
+            request.headers.get("Accept-Encoding"),
+            (headers or {}).get("ETag"),
+        )
+        response = make_response(body, code)
+        response.headers.extend(headers or {})
+        for name, value in body_headers.items():
+            response.headers[name] = value
+        return response
+
+    return output
+
+
+# Encodes the api's responses as above instead of with Flask-RESTX's json
+def register(api):
+    api.representations = {t: _representation(t) for t in MEDIA_TYPES}
+
+
+# Flask after_request hook compressing the responses of every other route
+def compress_response(response):
+    if (
+        response.status_code != 200
+        or response.direct_passthrough
+        or response.is_streamed
+        or "Content-Encoding" in response.headers
+        or not compressible(response.mimetype)
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+    etag = response.headers.get("ETag")
+    body, coding = compressed(
+        response.get_data(),
+        response.mimetype,
+        request.headers.get("Accept-Encoding"),
+        etag,
+    )
+    if coding is not None:
+        response.set_data(body)
+        response.headers["Content-Encoding"] = coding
+        if etag is not None:
+            response.headers["ETag"] = _suffixed(etag, coding)
+    return response
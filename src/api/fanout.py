@@ -0,0 +1,42 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Upper bound on the number of upstream calls a single request runs concurrently
+MAX_WORKERS = 16
+
+
+def set_max_workers(max_workers: int):
+    global MAX_WORKERS
+    MAX_WORKERS = max(1, max_workers)
+
+
+# Calls `func` for every item on a bounded thread pool and yields (item, result, error)
+# tuples as soon as each call finishes. Exactly one of result and error is None.
+def fan_out_iter(func, items, max_workers: int = None):
+    items = list(items)
+    if not items:
+        return
+    workers = min(max_workers or MAX_WORKERS, len(items))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Each call runs in a copy of the caller's context, so the upstream calls it makes
+        # are timed as part of the caller's request
+        futures = {
+            executor.submit(contextvars.copy_context().run, func, item): item
+            for item in items
+        }
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as err:
+                yield futures[future], None, err
+
+
+# Same as `fan_out_iter`, but waits for every call and keeps the order of `items`
+def fan_out(func, items, max_workers: int = None) -> list:
+    items = list(items)
+    results = [None] * len(items)
+    for (index, item), result, error in fan_out_iter(
+        lambda pair: func(pair[1]), enumerate(items), max_workers
+    ):
+        results[index] = (item, result, error)
+    return results
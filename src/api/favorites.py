@@ -0,0 +1,124 @@
+import os
+import sqlite3
+import threading
+import time
+from itertools import islice
+
+from src.api.cache import normalize_key
+
+DEFAULT_USER = "default"
+
+
+class MemoryFavoritesStore:
+    """Favorites kept in the memory of one process, lost when it restarts."""
+
+    def __init__(self):
+        # user -> {normalized country name -> country name}, in the order they were added
+        self._favorites = {}
+        self._lock = threading.Lock()
+
+    def add(self, user: str, country: str) -> bool:
+        """Add a favorite, returns False if it was already there."""
+        with self._lock:
+            countries = self._favorites.setdefault(user, {})
+            key = normalize_key(country)
+            if key in countries:
+                return False
+            countries[key] = country
+            return True
+
+    def remove(self, user: str, country: str) -> bool:
+        """Remove a favorite, returns False if it was not there."""
+        with self._lock:
+            return (
+                self._favorites.get(user, {}).pop(normalize_key(country), None)
+                is not None
+            )
+
+    def list(self, user: str, offset: int = 0, limit: int = None) -> list:
+        end = None if limit is None else offset + limit
+        with self._lock:
+            return list(islice(self._favorites.get(user, {}).values(), offset, end))
+
+    def count(self, user: str) -> int:
+        with self._lock:
+            return len(self._favorites.get(user, {}))
+
+
+class SQLiteFavoritesStore:
+    """Favorites in a SQLite file, shared by every worker process on the host.
+
+    The database runs in WAL mode, so readers never block the (short) writes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()  # One connection per thread and process
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS favorites ("
+                " user TEXT NOT NULL,"
+                " country_key TEXT NOT NULL,"
+                " country TEXT NOT NULL,"
+                " added_at REAL NOT NULL,"
+                " PRIMARY KEY (user, country_key)"
+                ") WITHOUT ROWID"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS favorites_by_user"
+                " ON favorites (user, added_at)"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        # Connections are not carried over into forked workers
+        pid = os.getpid()
+        if getattr(self._local, "pid", None) != pid:
+            connection = sqlite3.connect(self.path, timeout=10)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection, self._local.pid = connection, pid
+        return self._local.connection
+
+    def add(self, user: str, country: str) -> bool:
+        """Add a favorite, returns False if it was already there."""
+        with self._connection() as connection:
+            cursor = connection.execute(
+                "INSERT OR IGNORE INTO favorites VALUES (?, ?, ?, ?)",
+                (user, normalize_key(country), country, time.time()),
+            )
+            return cursor.rowcount == 1
+
+    def remove(self, user: str, country: str) -> bool:
+        """Remove a favorite, returns False if it was not there."""
+        with self._connection() as connection:
+            cursor = connection.execute(
+                "DELETE FROM favorites WHERE user = ? AND country_key = ?",
+                (user, normalize_key(country)),
+            )
+            return cursor.rowcount == 1
+
+    def list(self, user: str, offset: int = 0, limit: int = None) -> list:
+        rows = self._connection().execute(
+            "SELECT country FROM favorites WHERE user = ?"
+            " ORDER BY added_at, country_key LIMIT ? OFFSET ?",
+            (user, -1 if limit is None else limit, offset),
+        )
+        return [country for (country,) in rows]
+
+    def count(self, user: str) -> int:
+        (count,) = (
+            self._connection()
+            .execute("SELECT COUNT(*) FROM favorites WHERE user = ?", (user,))
+            .fetchone()
+        )
+        return count
+
+
+# Returns the SQLite store for a path, or the in-memory store without one
+def create_store(path: str = None):
+    if path is None:
+        return MemoryFavoritesStore()
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    return SQLiteFavoritesStore(path)
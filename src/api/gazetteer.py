@@ -0,0 +1,169 @@
+import argparse
+import json
+import os
+import threading
+import time
+
+from src.api import upstream
+from src.api.cache import normalize_key
+
+# REST Countries only serves the full dataset when the fields are listed (at most 10)
+ALL_FIELDS = (
+    "name,capital,population,area,latlng,region,subregion,altSpellings,cca2,cca3"
+)
+ALL_URL = f"https://restcountries.com/v3.1/all?fields={ALL_FIELDS}"
+DEFAULT_SNAPSHOT = "countries.json"
+
+# Seconds before a failed download of the full dataset is tried again
+DOWNLOAD_RETRY = 60
+
+# The gazetteer used by `utils`, None means every lookup goes to REST Countries
+_gazetteer = None
+
+# Without a gazetteer: the last download of the full dataset as (records, downloaded at),
+# and when a download last failed
+_download = None
+_download_failed_at = None
+_download_lock = threading.Lock()
+# A cache shared by the worker processes (see `shared_cache`) the download is also kept in,
+# so only one of them downloads the dataset
+_shared = None
+
+
+class Gazetteer:
+    """In-memory index over the full REST Countries dataset."""
+
+    def __init__(self, records: list, loaded_at: float = None):
+        self.records = records
+        # When the data was downloaded, used as Last-Modified of responses built from it
+        self.loaded_at = time.time() if loaded_at is None else loaded_at
+        self._by_region = {}  # normalized region or subregion -> list of common names
+
+        for record in records:
+            regions = {record.get("region"), record.get("subregion")} - {None, ""}
+            for region in {normalize_key(region) for region in regions}:
+                self._by_region.setdefault(region, []).append(record["name"]["common"])
+
+    def region(self, name: str):
+        """Return the common names of all countries in a region or subregion."""
+        countries = self._by_region.get(normalize_key(name))
+        return list(countries) if countries is not None else None
+
+    def __len__(self):
+        return len(self.records)
+
+
+# Points the full dataset download at another REST Countries deployment
+def set_base_url(base_url: str):
+    global ALL_URL, _download, _download_failed_at
+    ALL_URL = f"{base_url}/all?fields={ALL_FIELDS}"
+    _download = _download_failed_at = None
+
+
+# Shares the downloaded dataset through a cache, None keeps it in this process only
+def set_shared_cache(cache):
+    global _shared, _download
+    _shared = cache
+    _download = None
+
+
+# The download another worker kept in the shared cache, if it is at most `max_age` old
+def _shared_download(max_age: float):
+    if _shared is None:
+        return None
+    shared = _shared.get(ALL_URL, None)
+    if shared is None or time.time() - shared[1] > max_age:
+        return None
+    return shared
+
+
+# Downloads the full dataset from REST Countries
+def fetch_all() -> list:
+    response = upstream.get("restcountries", ALL_URL)
+    response.raise_for_status()
+    return response.json()
+
+
+# The full dataset and when it was produced, as (records, unix timestamp): the loaded
+# gazetteer's, otherwise a download that is repeated once it is older than `max_age`
+# seconds. With `download` False None is returned instead of downloading.
+def dataset(max_age: float, download: bool = True):
+    global _download, _download_failed_at
+    index = current()
+    if index is not None:
+        return index.records, index.loaded_at
+    last = _download
+    if last is not None and time.time() - last[1] <= max_age:
+        return last
+    shared = _shared_download(max_age)
+    if shared is not None:
+        _download = shared
+        return shared
+    if not download:
+        return None
+
+    with _download_lock:
+        if _download is not None and time.time() - _download[1] <= max_age:
+            return _download  # Downloaded while waiting for the lock
+        failed_at = _download_failed_at
+        if failed_at is not None and time.time() - failed_at < DOWNLOAD_RETRY:
+            raise Exception("Country dataset unavailable, download failed recently")
+        try:
+            _download = (fetch_all(), time.time())
+        except Exception:
+            _download_failed_at = time.time()
+            raise
+        _download_failed_at = None
+        if _shared is not None:
+            _shared.set(ALL_URL, _download, ttl=max_age)
+        return _download
+
+
+def load_snapshot(path: str) -> list:
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def save_snapshot(records: list, path: str):
+    # Write to a temporary file first so a running server never reads a partial snapshot
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(records, file, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+# Downloads the dataset again and rewrites the snapshot
+def refresh(path: str = DEFAULT_SNAPSHOT) -> Gazetteer:
+    records = fetch_all()
+    save_snapshot(records, path)
+    return use(Gazetteer(records))
+
+
+# Loads the gazetteer from a snapshot, downloading it first if it does not exist
+def load(path: str = DEFAULT_SNAPSHOT) -> Gazetteer:
+    if path is None or not os.path.exists(path):
+        records = fetch_all()
+        if path is not None:
+            save_snapshot(records, path)
+        return use(Gazetteer(records))
+    return use(Gazetteer(load_snapshot(path), os.path.getmtime(path)))
+
+
+# Installs (or with None, removes) the gazetteer used for lookups
+def use(gazetteer):
+    global _gazetteer
+    _gazetteer = gazetteer
+    return gazetteer
+
+
+def current():
+    return _gazetteer
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the country snapshot.")
+    parser.add_argument(
+        "--snapshot", type=str, default=DEFAULT_SNAPSHOT, help="Snapshot file to write"
+    )
+    args = parser.parse_args()
+    print(f"Wrote {len(refresh(args.snapshot))} countries to {args.snapshot}")
@@ -0,0 +1,166 @@
+import hashlib
+from email.utils import formatdate, parsedate_to_datetime
+from functools import wraps
+
+from flask import Response, request
+
+from src.api.encoding import canonical, variant_etags
+
+# Conditional requests and caching headers. Validators are derived from when the underlying
+# data was produced (Last-Modified), and from that version and the URL (ETag) when there is
+# one or from the response payload otherwise, so a repeat request answered from the caches
+# returns 304 without calling any upstream. Each media type and content coding of a
+# response has its own ETag, see `encoding.variant_etag`.
+
+
+# Without a version the payload is serialized to be hashed, with one it is not: bodies
+# cached under the ETag are reused without serializing anything
+def etag_for(payload, version=None, url: str = None) -> str:
+    if version is not None:
+        digest = hashlib.sha1(f"{url} {version!r}".encode())
+    else:
+        digest = hashlib.sha1(canonical(payload))
+    return '"%s"' % digest.hexdigest()
+
+
+def http_date(timestamp: float) -> str:
+    return formatdate(timestamp, usegmt=True)
+
+
+def cache_control(max_age: int, private: bool = False) -> str:
+    if max_age <= 0:
+        return "private, no-cache" if private else "no-cache"
+    return f"{'private' if private else 'public'}, max-age={int(max_age)}"
+
+
+# If-None-Match takes precedence over If-Modified-Since (RFC 9110, 13.2.2)
+def is_not_modified(
+    etag: str, last_modified: float, if_none_match: str, if_modified_since: str
+) -> bool:
+    if if_none_match:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        weak_etag = f"W/{etag}"
+        return "*" in tags or etag in tags or weak_etag in tags
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(last_modified) <= since
+    return False
+
+
+# The ETag to answer 304 with, of the variants the request can be answered with (see
+# `encoding.variant_etags`), None when the client has no fresh copy of any of them
+def not_modified_etag(
+    etags: list, last_modified: float, if_none_match: str, if_modified_since: str
+):
+    for etag in etags:
+        if is_not_modified(etag, last_modified, if_none_match, if_modified_since):
+            return etag
+    return None
+
+
+# Builds the validator and caching headers for a successful response, `version` is that of
+# the data the payload was built from at `url`, if known
+def cache_headers(
+    payload,
+    max_age: int,
+    last_modified: float = None,
+    private=False,
+    version=None,
+    url: str = None,
+):
+    headers = {
+        "ETag": etag_for(payload, version, url),
+        "Cache-Control": cache_control(max_age, private),
+    }
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+# The headers to answer 304 with before building the payload, from the data's `version`,
+# None if the request needs a full response. `request_headers` are looked up by lowercase
+# name. Only If-None-Match is looked at: an ETag is only handed out with a 200 for the same
+# URL, so a matching one proves the request valid, a date does not.
+def early_not_modified(version, max_age: int, private, url: str, request_headers):
+    if not request_headers.get("if-none-match"):
+        return None
+    headers = cache_headers(None, max_age, version, private, version, url)
+    etag = not_modified_etag(
+        variant_etags(
+            headers["ETag"],
+            request_headers.get("accept"),
+            request_headers.get("accept-encoding"),
+        ),
+        None,
+        request_headers.get("if-none-match"),
+        None,
+    )
+    return None if etag is None else {**headers, "ETag": etag}
+
+
+# Returns (headers, not modified) for a payload built from the data at version `modified`,
+# which was `before` when the lookup started. Unless the data was replaced in between, the
+# ETag is derived from its version.
+def validated_headers(
+    payload, before, modified, max_age: int, private, url: str, request_headers
+) -> tuple:
+    version = modified if before in (None, modified) else None
+    headers = cache_headers(payload, max_age, modified, private, version, url)
+    etag = not_modified_etag(
+        variant_etags(
+            headers["ETag"],
+            request_headers.get("accept"),
+            request_headers.get("accept-encoding"),
+        ),
+        modified,
+        request_headers.get("if-none-match"),
+        request_headers.get("if-modified-since"),
+    )
+    if etag is None:
+        return headers, False
+    return {**headers, "ETag": etag}, True
+
+
+def conditional(max_age, last_modified=None, private: bool = False):
+    """Add ETag, Last-Modified and Cache-Control to a resource method's 200 responses and
+    answer matching If-None-Match / If-Modified-Since requests with 304.
+
+    `max_age` is a number of seconds or a callable returning one, `last_modified` a callable
+    receiving the method's arguments and returning a unix timestamp or None. When it returns
+    one, a request holding the ETag of that version is answered before calling the method.
+    """
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(resource, *args, **kwargs):
+            before = last_modified(*args, **kwargs) if last_modified else None
+            if before is not None:
+                age = max_age() if callable(max_age) else max_age
+                headers = early_not_modified(
+                    before, age, private, request.url, request.headers
+                )
+                if headers is not None:
+                    return Response(status=304, headers=headers)
+
+            result = method(resource, *args, **kwargs)
+            if not isinstance(result, tuple):  # A ready-made (e.g. streamed) response
+                return result
+            payload, status = result[0], result[1]
+            if status != 200:
+                return result
+
+            modified = last_modified(*args, **kwargs) if last_modified else None
+            age = max_age() if callable(max_age) else max_age
+            headers, not_modified = validated_headers(
+                payload, before, modified, age, private, request.url, request.headers
+            )
+            if not_modified:
+                return Response(status=304, headers=headers)
+            return payload, status, headers
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,50 @@
+from src.api import charts, metrics, streaming
+from src.api.upstream import overload
+
+# What the Flask resources and the ASGI handlers share about the lookups they serve: the
+# checks of their arguments, which raise ValueError with the message to answer 400 with,
+# and the status a failed lookup is answered with.
+
+MAX_DAYS = 5
+
+
+def check_top(top: int) -> int:
+    if top is not None and top < 1:
+        raise ValueError("Top must be greater than or equal to 1")
+    return top
+
+
+# `days` may come from a JSON body: bool is a subclass of int, but true is not a number of days
+def check_days(days) -> int:
+    if not isinstance(days, int) or isinstance(days, bool) or not 1 <= days <= MAX_DAYS:
+        raise ValueError(
+            f"Days must be greater than or equal to 1 and less than or equal to {MAX_DAYS}"
+        )
+    return days
+
+
+def check_renderer(renderer: str) -> str:
+    if renderer not in charts.RENDERERS:
+        raise ValueError(f"Render must be one of {', '.join(charts.RENDERERS)}")
+    return renderer
+
+
+# The requested streaming format (see `streaming.requested_format`), which cannot be
+# combined with `top`
+def stream_format(stream: str, accept: str, top: int = None) -> str:
+    fmt = streaming.requested_format(stream, accept)
+    if fmt is not None and top is not None:
+        raise ValueError("Top cannot be combined with streaming")
+    return fmt
+
+
+# Counts a failed lookup, returns (status, message, Retry-After) to answer it with: 404, or
+# 429 (our quota is used up) or 503 (circuit open, upstream rate limited) with the seconds
+# to retry after when an overloaded upstream turned it away
+def failure(error: Exception, message: str = None) -> tuple:
+    metrics.record_error(error)
+    overloaded = overload(error)
+    if overloaded is not None:
+        status, retry_after = overloaded
+        return status, str(error), retry_after
+    return 404, message or str(error), None
@@ -0,0 +1,403 @@
+import contextvars
+import threading
+import time
+
+import httpx
+import requests
+
+# Latency and error instrumentation, exposed in the Prometheus text format on /api/metrics.
+# Requests and upstream calls are timed into histograms, failed lookups are counted by
+# cause. With `SERVER_TIMING` enabled every response also carries a Server-Timing header
+# splitting its duration between the upstreams and our own code.
+
+# Upper bounds in seconds of the latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SERVER_TIMING = False
+
+_registry = []
+
+
+def set_server_timing(enabled: bool):
+    global SERVER_TIMING
+    SERVER_TIMING = enabled
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value) -> str:
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def _format_labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(v)}"' for name, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, description: str, labels: tuple = ()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def render(self) -> list:
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        with self._lock:
+            items = sorted(self._values.items())
+        for values, value in items:
+            lines.append(
+                f"{self.name}{_format_labels(self.labels, values)} {_number(value)}"
+            )
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            # Bucket counts, then sum and count
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [0] * (len(BUCKETS) + 2)
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list:
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        names = self.labels + ("le",)
+        for values, series in items:
+            for bound, count in zip(BUCKETS + ("+Inf",), series[:-2] + series[-1:]):
+                labels = _format_labels(names, values + (bound,))
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.labels, values)
+            lines.append(f"{self.name}_sum{labels} {_number(series[-2])}")
+            lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+request_duration = Histogram(
+    "snowbird_request_duration_seconds",
+    "Time spent handling requests",
+    ("route", "method", "status"),
+)
+requests_in_flight = Gauge(
+    "snowbird_requests_in_flight", "Requests being handled", ("route",)
+)
+lookup_errors = Counter(
+    "snowbird_lookup_errors_total",
+    "Failed lookups by route and cause",
+    ("route", "cause"),
+)
+upstream_duration = Histogram(
+    "snowbird_upstream_request_duration_seconds",
+    "Time spent on upstream calls, per attempt",
+    ("upstream", "outcome"),
+)
+upstream_in_flight = Gauge(
+    "snowbird_upstream_requests_in_flight", "Upstream calls in progress", ("upstream",)
+)
+upstream_errors = Counter(
+    "snowbird_upstream_errors_total",
+    "Failed upstream calls by cause, per attempt",
+    ("upstream", "cause"),
+)
+quota_calls = Counter(
+    "snowbird_quota_calls_total",
+    "Upstream calls let through by the rate limiter, per API key",
+    ("upstream", "key"),
+)
+quota_wait = Histogram(
+    "snowbird_quota_wait_seconds",
+    "Time upstream calls were queued by the rate limiter",
+    ("upstream",),
+)
+quota_shed = Counter(
+    "snowbird_quota_shed_total",
+    "Upstream calls refused because the quota was used up",
+    ("upstream",),
+)
+upstream_throttled = Counter(
+    "snowbird_upstream_throttled_total",
+    "429 responses from an upstream, per API key",
+    ("upstream", "key"),
+)
+
+
+class RequestTiming:
+    """Time spent by one request, in total and per upstream."""
+
+    def __init__(self, route: str, method: str):
+        self.route = route
+        self.method = method
+        self.started = time.perf_counter()
+        self.status = 500  # Until a response is sent
+        self.upstreams = {}  # name -> [calls, seconds]
+        self._lock = threading.Lock()
+
+    def add_upstream(self, name: str, seconds: float):
+        with self._lock:
+            totals = self.upstreams.setdefault(name, [0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+
+
+# The request being handled. Fan-out threads and asyncio tasks inherit it, so upstream
+# calls made on behalf of a request are attributed to it.
+_current = contextvars.ContextVar("snowbird_request", default=None)
+
+
+def start_request(route: str, method: str) -> RequestTiming:
+    timing = RequestTiming(route, method)
+    timing.token = _current.set(timing)
+    requests_in_flight.inc(route)
+    return timing
+
+
+def finish_request(timing: RequestTiming, status: int = None):
+    requests_in_flight.dec(timing.route)
+    status = timing.status if status is None else status
+    request_duration.observe(
+        time.perf_counter() - timing.started, timing.route, timing.method, str(status)
+    )
+    try:
+        _current.reset(timing.token)
+    except ValueError:  # Finished from another context than it was started in
+        _current.set(None)
+
+
+def current_request():
+    return _current.get()
+
+
+# Yields the chunks of a streamed response with `timing` as the current request: they are
+# produced after the view returned, outside of the context the request was started in
+def stream_request(timing: RequestTiming, chunks):
+    token = _current.set(timing)
+    try:
+        yield from chunks
+    finally:
+        try:
+            _current.reset(token)
+        except ValueError:  # Closed from another context
+            pass
+
+
+# The Server-Timing header value of a request, durations are in milliseconds
+def server_timing(timing: RequestTiming) -> str:
+    entries = [
+        f'{name};dur={seconds * 1000:.1f};desc="{calls} call(s)"'
+        for name, (calls, seconds) in sorted(timing.upstreams.items())
+    ]
+    entries.append(f"total;dur={(time.perf_counter() - timing.started) * 1000:.1f}")
+    return ", ".join(entries)
+
+
+def upstream_started(name: str) -> float:
+    upstream_in_flight.inc(name)
+    return time.perf_counter()
+
+
+# Records one upstream attempt, that either got a response status or raised `error`
+def upstream_finished(name: str, started: float, status: int = None, error=None):
+    seconds = time.perf_counter() - started
+    upstream_in_flight.dec(name)
+    if error is not None:
+        outcome = error_cause(error)
+        upstream_errors.inc(name, outcome)
+    else:
+        outcome = str(status)
+        if status >= 400:
+            upstream_errors.inc(name, f"http_{status}")
+    upstream_duration.observe(seconds, name, outcome)
+    timing = _current.get()
+    if timing is not None:
+        timing.add_upstream(name, seconds)
+
+
+def upstream_rejected(name: str):
+    upstream_errors.inc(name, "circuit_open")
+
+
+# Why a lookup failed: "not_found", "timeout", "connection", "circuit_open",
+# "quota_exceeded", "upstream_http_<status>", "invalid" or "other". Follows the chain of
+# exceptions, since `utils` wraps the upstream errors into plain exceptions.
+def error_cause(err: BaseException) -> str:
+    # Both modules import this one
+    from src.api.quota import QuotaExceededError
+    from src.api.upstream import CircuitOpenError
+
+    cause = err
+    while cause is not None:
+        if isinstance(cause, CircuitOpenError):
+            return "circuit_open"
+        if isinstance(cause, QuotaExceededError):
+            return "quota_exceeded"
+        if isinstance(cause, (requests.exceptions.Timeout, httpx.TimeoutException)):
+            return "timeout"
+        if isinstance(
+            cause, (requests.exceptions.ConnectionError, httpx.TransportError)
+        ):
+            return "connection"
+        if isinstance(cause, (requests.exceptions.HTTPError, httpx.HTTPStatusError)):
+            if cause.response is not None:
+                status = cause.response.status_code
+                return "not_found" if status == 404 else f"upstream_http_{status}"
+        cause = cause.__cause__ or cause.__context__
+
+    message = str(err).lower()
+    if "not found" in message:  # Also the negatively cached upstream 404s
+        return "not_found"
+    if isinstance(err, ValueError):
+        return "invalid"
+    return "other"
+
+
+# Counts a failed lookup against the route of the current request
+def record_error(err: BaseException):
+    timing = _current.get()
+    lookup_errors.inc(timing.route if timing is not None else "", error_cause(err))
+
+
+def _snapshot(name: str, kind: str, description: str, samples: list) -> list:
+    lines = [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        lines.append(f"{name}{_format_labels(*zip(*labels.items()))} {_number(value)}")
+    return lines
+
+
+# Renders every metric in the Prometheus text format, along with the counters kept by the
+# caches, single-flight groups, upstream clients and rate limiters (as returned by
+# /api/status)
+def render(
+    caches: dict = None,
+    coalescing: dict = None,
+    upstreams: dict = None,
+    quotas: dict = None,
+):
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+
+    caches = caches or {}
+    for field in ("hits", "stale_hits", "negative_hits", "misses", "evictions"):
+        lines.extend(
+            _snapshot(
+                f"snowbird_cache_{field}_total",
+                "counter",
+                f"Cache {field.replace('_', ' ')}",
+                [({"cache": name}, stats[field]) for name, stats in caches.items()],
+            )
+        )
+    lines.extend(
+        _snapshot(
+            "snowbird_cache_size",
+            "gauge",
+            "Entries in the cache",
+            [({"cache": name}, stats["size"]) for name, stats in caches.items()],
+        )
+    )
+    ratios = []
+    for name, stats in caches.items():
+        served = stats["hits"] + stats["stale_hits"] + stats["negative_hits"]
+        lookups = served + stats["misses"]
+        ratios.append(({"cache": name}, served / lookups if lookups else 0))
+    lines.extend(
+        _snapshot(
+            "snowbird_cache_hit_ratio",
+            "gauge",
+            "Share of lookups answered from the cache",
+            ratios,
+        )
+    )
+
+    coalescing = coalescing or {}
+    for field in ("calls", "coalesced"):
+        lines.extend(
+            _snapshot(
+                f"snowbird_singleflight_{field}_total",
+                "counter",
+                f"Single-flight {field}",
+                [({"group": name}, stats[field]) for name, stats in coalescing.items()],
+            )
+        )
+
+    upstreams = upstreams or {}
+    lines.extend(
+        _snapshot(
+            "snowbird_upstream_circuit_open",
+            "gauge",
+            "1 while the circuit breaker of an upstream is open",
+            [
+                ({"upstream": name}, int(stats["circuit"] == "open"))
+                for name, stats in upstreams.items()
+            ],
+        )
+    )
+
+    quotas = quotas or {}
+    lines.extend(
+        _snapshot(
+            "snowbird_quota_tokens",
+            "gauge",
+            "Calls an API key can make right away, negative while calls are queued",
+            [
+                ({"upstream": name, "key": key}, bucket["tokens"])
+                for name, stats in quotas.items()
+                for key, bucket in stats["keys"].items()
+                if bucket["tokens"] is not None
+            ],
+        )
+    )
+    lines.extend(
+        _snapshot(
+            "snowbird_quota_resting_seconds",
+            "gauge",
+            "Seconds an API key is rested for after a 429",
+            [
+                ({"upstream": name, "key": key}, bucket["resting"])
+                for name, stats in quotas.items()
+                for key, bucket in stats["keys"].items()
+            ],
+        )
+    )
+    return "\n".join(lines) + "\n"
@@ -38,20 +38,174 @@ def register_models(api_namespace):
         {"temperature": fields.Float(description="Current temperature in Celsius")},
     )
 
+    country_temperature_model = api_namespace.model(
+        "CountryTemperature",
+        {
+            "country": fields.String(description="The name of the country"),
+            "temperature": fields.Float(description="Current temperature in Celsius"),
+        },
+    )
+
+    country_error_model = api_namespace.model(
+        "CountryError",
+        {
+            "country": fields.String(description="The name of the country"),
+            "error": fields.String(description="Why the lookup failed"),
+        },
+    )
+
+    continent_temperatures_model = api_namespace.model(
+        "ContinentTemperatures",
+        {
+            "continent": fields.String(
+                required=True, description="The name of the continent"
+            ),
+            "temperatures": fields.List(
+                fields.Nested(country_temperature_model),
+                description="Temperatures of the countries, warmest first",
+            ),
+            "errors": fields.List(
+                fields.Nested(country_error_model),
+                description="Countries for which no temperature was found",
+            ),
+        },
+    )
+
     forecast_model = api_namespace.model(
         "Forecast",
         {"forecast_url": fields.String(description="Url to the generated graph")},
     )
 
+    forecast_entry_model = api_namespace.model(
+        "ForecastEntry",
+        {
+            "time": fields.String(description="Start of the 3-hour interval"),
+            "temperature": fields.Float(description="Temperature in Celsius"),
+        },
+    )
+
+    batch_request_model = api_namespace.model(
+        "BatchRequest",
+        {
+            "names": fields.List(
+                fields.String,
+                required=True,
+                description="The countries to look up",
+                example=["Belgium", "Brazil"],
+            ),
+            "include": fields.List(
+                fields.String(enum=["info", "temperature", "forecast"]),
+                description="The fields to include for every country (default: info)",
+                example=["info", "temperature"],
+            ),
+            "days": fields.Integer(
+                description="Number of days to forecast (between 1 and 5)",
+                default=1,
+                min=1,
+                max=5,
+            ),
+        },
+    )
+
+    batch_item_model = api_namespace.model(
+        "BatchItem",
+        {
+            "name": fields.String(description="The country as requested"),
+            "info": fields.Nested(country_model, skip_none=True),
+            "temperature": fields.Float(description="Current temperature in Celsius"),
+            "forecast": fields.List(fields.Nested(forecast_entry_model)),
+            "errors": fields.Raw(description="Why a field is missing, by field name"),
+        },
+    )
+
+    batch_model = api_namespace.model(
+        "BatchResult",
+        {"results": fields.List(fields.Nested(batch_item_model))},
+    )
+
     favorite_model = api_namespace.model(
         "Favorites",
         {"country": fields.String(required=True, description="The country favorited")},
     )
 
+    favorite_list_model = api_namespace.model(
+        "FavoriteList",
+        {
+            "favorites": fields.List(
+                fields.String, description="The favorite countries on this page"
+            ),
+            "page": fields.Integer(description="The page returned"),
+            "per_page": fields.Integer(description="Favorites per page"),
+            "total": fields.Integer(description="Total number of favorites"),
+        },
+    )
+
+    country_row_model = api_namespace.model(
+        "CountryRow",
+        {
+            "name": fields.String(description="The name of the country"),
+            "capital": fields.String(description="Capital city"),
+            "region": fields.String(description="Region", example="Europe"),
+            "subregion": fields.String(
+                description="Subregion", example="Western Europe"
+            ),
+            "population": fields.Integer(description="Population count"),
+            "area": fields.Float(description="Area of the country"),
+            "latitude": fields.Float(description="Latitude"),
+            "longitude": fields.Float(description="Longitude"),
+        },
+    )
+
+    country_query_model = api_namespace.model(
+        "CountryQuery",
+        {
+            "total": fields.Integer(description="Number of countries matching"),
+            "offset": fields.Integer(description="Matches skipped"),
+            "limit": fields.Integer(description="Maximum number of countries returned"),
+            "countries": fields.List(
+                fields.Nested(country_row_model),
+                description="The matching countries, with the requested fields only",
+            ),
+        },
+    )
+
+    nearby_country_model = api_namespace.model(
+        "NearbyCountry",
+        {
+            "name": fields.String(description="The name of the country"),
+            "latitude": fields.Float(description="Latitude"),
+            "longitude": fields.Float(description="Longitude"),
+            "distance_km": fields.Float(description="Distance from the point in km"),
+            "temperature": fields.Float(
+                description="Current temperature in Celsius (warmest queries only)"
+            ),
+        },
+    )
+
+    nearby_countries_model = api_namespace.model(
+        "NearbyCountries",
+        {
+            "countries": fields.List(
+                fields.Nested(nearby_country_model),
+                description="Nearest first, or warmest first for warmest queries",
+            ),
+            "errors": fields.List(
+                fields.Nested(country_error_model),
+                description="Countries whose temperature could not be looked up",
+            ),
+        },
+    )
+
     return {
+        "batch_model": batch_model,
+        "batch_request_model": batch_request_model,
         "continent_model": continent_model,
+        "continent_temperatures_model": continent_temperatures_model,
         "country_model": country_model,
+        "country_query_model": country_query_model,
+        "favorite_list_model": favorite_list_model,
         "favorite_model": favorite_model,
+        "nearby_countries_model": nearby_countries_model,
         "forecast_model": forecast_model,
         "temperature_model": temperature_model,
     }
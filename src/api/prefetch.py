@@ -0,0 +1,158 @@
+import threading
+import time
+from collections import deque
+
+from src.api import gazetteer, resolver, utils
+
+# Background warm-up. At startup the country resolver and the continent cache are filled
+# from a single download of the full dataset, then the most requested weather cells are
+# refreshed shortly before they expire, spending at most `budget` upstream calls per minute
+# so the OpenWeatherMap quota is left to the requests themselves.
+
+
+class CallBudget:
+    """Allows at most `per_minute` calls in any sliding minute."""
+
+    def __init__(self, per_minute: int):
+        self.per_minute = per_minute
+        self._calls = deque()
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float):
+        while self._calls and self._calls[0] <= now - 60:
+            self._calls.popleft()
+
+    def acquire(self) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            if len(self._calls) >= self.per_minute:
+                return False
+            self._calls.append(now)
+            return True
+
+    def remaining(self) -> int:
+        with self._lock:
+            self._expire(time.monotonic())
+            return self.per_minute - len(self._calls)
+
+
+class Prefetcher:
+    """Warms the caches at startup and keeps the `top` most requested weather cells fresh.
+
+    Every `interval` seconds, cells that expire within `lead` seconds (or already did) are
+    fetched again, most requested first. Request counts halve every `half_life` seconds.
+    """
+
+    def __init__(
+        self,
+        top: int = 50,
+        budget: int = 30,
+        interval: float = 30,
+        lead: float = 60,
+        half_life: float = 3600,
+    ):
+        self.top = top
+        self.budget = CallBudget(budget)
+        self.interval = interval
+        self.lead = max(lead, interval)  # Otherwise cells expire between two rounds
+        self.half_life = half_life
+        self.warmed_countries = 0
+        self.warmed_continents = 0
+        self.refreshed = 0
+        self.deferred = 0
+        self.failed = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def warm(self):
+        """Load the country resolver and fill the continent cache from one download of the
+        full dataset, unless a gazetteer already answers them."""
+        if gazetteer.current() is not None:
+            return
+        try:
+            countries = resolver.current(utils.country_cache.ttl)
+            index = gazetteer.Gazetteer(countries.records)
+            self.warmed_countries = len(countries)
+        except Exception:
+            index = None  # Fall back to one region call per continent below
+            self.failed += 1
+
+        for continent in utils.continents():
+            if index is None:
+                try:
+                    utils.countries_by_continent(continent)
+                    self.warmed_continents += 1
+                except Exception:
+                    self.failed += 1
+                continue
+            countries = index.region(continent)
+            if countries is not None:
+                utils.continent_cache.set(continent, countries)
+                self.warmed_continents += 1
+
+    def run_once(self):
+        """Refresh the popular weather cells that are about to expire, within the budget."""
+        utils.weather_popularity.decay(0.5 ** (self.interval / self.half_life))
+        for endpoint, lat, lon in utils.weather_popularity.top(self.top):
+            expires_in = utils.weather_cache_for(endpoint).expires_in((lat, lon))
+            if expires_in is not None and expires_in > self.lead:
+                continue
+            if not self.budget.acquire():
+                self.deferred += 1  # Picked up again next round
+                continue
+            try:
+                utils.refresh_weather_data(endpoint, lat, lon)
+                self.refreshed += 1
+            except Exception:
+                self.failed += 1
+
+    def _run(self):
+        self.warm()
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="prefetch", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def stats(self) -> dict:
+        return {
+            "top": self.top,
+            "tracked": len(utils.weather_popularity),
+            "budget_remaining": self.budget.remaining(),
+            "warmed_countries": self.warmed_countries,
+            "warmed_continents": self.warmed_continents,
+            "refreshed": self.refreshed,
+            "deferred": self.deferred,
+            "failed": self.failed,
+        }
+
+
+# The running prefetcher, None when prefetching is off
+_prefetcher = None
+
+
+# Starts prefetching in the background, replacing a running prefetcher
+def start(**options) -> Prefetcher:
+    global _prefetcher
+    stop()
+    _prefetcher = Prefetcher(**options).start()
+    return _prefetcher
+
+
+def stop():
+    global _prefetcher
+    if _prefetcher is not None:
+        _prefetcher.stop()
+        _prefetcher = None
+
+
+def stats() -> dict:
+    return _prefetcher.stats() if _prefetcher is not None else {}
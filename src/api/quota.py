@@ -0,0 +1,185 @@
+import math
+import threading
+import time
+
+from src.api import metrics
+
+# Client-side rate limiting of the upstream calls. An upstream can get a governor holding a
+# token bucket per API key: every call (and retry) takes a token from the key with the most
+# left, waits for one up to `max_wait` seconds, and is shed with a QuotaExceededError
+# otherwise, which is answered with a 429 and Retry-After instead of burning through the
+# provider's per-minute limit. A key the upstream answered 429 for rests for the Retry-After
+# it sent while the other keys take over.
+
+# Seconds a key rests after a 429 without Retry-After, the length of a provider's window
+DEFAULT_REST = 60
+
+
+class QuotaExceededError(Exception):
+    """Raised instead of calling an upstream whose quota is used up."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Holds up to `burst` tokens (by default `per_minute`), refilled at `per_minute` tokens
+    a minute, or unlimited when `per_minute` is None. Not thread-safe, the governor locks
+    around it."""
+
+    def __init__(self, per_minute: float = None, burst: float = None):
+        self.per_minute = per_minute
+        self.rate = per_minute / 60 if per_minute else None
+        self.burst = burst or per_minute or 1
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.resting_until = 0.0
+        self.taken = 0
+
+    def _refill(self, now: float):
+        if self.rate is not None:
+            elapsed = now - self.updated
+            self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+        self.updated = now
+
+    # Seconds until a token can be taken
+    def wait(self, now: float) -> float:
+        self._refill(now)
+        resting = max(0.0, self.resting_until - now)
+        if self.rate is None or self.tokens >= 1:
+            return resting
+        return max(resting, (1 - self.tokens) / self.rate)
+
+    # Takes a token, ahead of time when there is none yet: callers queued behind wait longer
+    def take(self):
+        self.taken += 1
+        if self.rate is not None:
+            self.tokens -= 1
+
+    def rest(self, seconds: float, now: float):
+        self.resting_until = max(self.resting_until, now + seconds)
+        if self.rate is not None:
+            self.tokens = min(self.tokens, 0)
+
+
+class Governor:
+    """Rate limits the calls to one upstream, rotating over its API keys.
+
+    `key_param` is the query parameter the key is sent in, None for upstreams without keys.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        per_minute: float = None,
+        burst: float = None,
+        keys=(None,),
+        key_param: str = None,
+        max_wait: float = 2,
+    ):
+        self.name = name
+        self.key_param = key_param
+        self.max_wait = max_wait
+        self.buckets = {
+            key: TokenBucket(per_minute, burst)
+            for key in dict.fromkeys(keys or (None,))
+        }
+        # Keys are secrets, stats and metrics refer to them by position
+        self.labels = {key: f"key{i}" for i, key in enumerate(self.buckets)}
+        self.queued = 0
+        self.shed = 0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> tuple:
+        """Returns (key to call with, seconds to wait before calling). Raises
+        QuotaExceededError when no key has a token within `max_wait` seconds."""
+        now = time.monotonic()
+        with self._lock:
+            # The key that is ready first, then the one with the most tokens left
+            key, wait = min(
+                ((key, bucket.wait(now)) for key, bucket in self.buckets.items()),
+                key=lambda item: (
+                    item[1],
+                    -self.buckets[item[0]].tokens,
+                    self.buckets[item[0]].taken,
+                ),
+            )
+            if wait > self.max_wait:
+                self.shed += 1
+            else:
+                self.buckets[key].take()
+                if wait > 0:
+                    self.queued += 1
+
+        if wait > self.max_wait:
+            metrics.quota_shed.inc(self.name)
+            raise QuotaExceededError(
+                f"Quota exhausted for upstream {self.name}, retry in {math.ceil(wait)}s",
+                retry_after=wait,
+            )
+        metrics.quota_calls.inc(self.name, self.labels[key])
+        metrics.quota_wait.observe(wait, self.name)
+        return key, wait
+
+    # The query parameters of a call made with `key`
+    def params(self, params: dict, key) -> dict:
+        if self.key_param is None or key is None:
+            return params
+        return {**(params or {}), self.key_param: key}
+
+    def throttled(self, key, retry_after: str = None):
+        """The upstream answered 429 for `key`: rest it for the Retry-After it sent."""
+        try:
+            seconds = float(retry_after)
+        except (TypeError, ValueError):
+            seconds = DEFAULT_REST
+        with self._lock:
+            self.buckets[key].rest(seconds, time.monotonic())
+        metrics.upstream_throttled.inc(self.name, self.labels[key])
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        keys = {}
+        with self._lock:
+            for key, bucket in self.buckets.items():
+                bucket._refill(now)
+                keys[self.labels[key]] = {
+                    "tokens": (
+                        round(bucket.tokens, 2) if bucket.rate is not None else None
+                    ),
+                    "calls": bucket.taken,
+                    "resting": round(max(0.0, bucket.resting_until - now), 1),
+                }
+            bucket = next(iter(self.buckets.values()))
+            return {
+                "per_minute": bucket.per_minute,
+                "burst": bucket.burst if bucket.rate is not None else None,
+                "max_wait": self.max_wait,
+                "queued": self.queued,
+                "shed": self.shed,
+                "keys": keys,
+            }
+
+
+# The governor of every rate limited upstream, by upstream name
+_governors = {}
+
+
+# Rate limits an upstream to `per_minute` calls per key (None to only rotate the keys),
+# replacing its current governor
+def configure(name: str, **options) -> Governor:
+    _governors[name] = Governor(name, **options)
+    return _governors[name]
+
+
+def governor(name: str):
+    return _governors.get(name)
+
+
+def reset():
+    _governors.clear()
+
+
+def stats() -> dict:
+    return {name: governor.stats() for name, governor in _governors.items()}
@@ -0,0 +1,154 @@
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+from difflib import SequenceMatcher
+
+from src.api import gazetteer
+
+# Local country name resolution over the full REST Countries dataset, instead of the
+# substring matching of its /name endpoint (where "Niger" can be Nigeria). Input is folded
+# (accents, case and punctuation removed) and matched exactly against the common and
+# official names, the ISO 3166 alpha-2/alpha-3 codes and the alternative spellings, in that
+# order of precedence. Unknown names get fuzzy suggestions: a trigram index preselects
+# candidates, which are ranked by edit similarity.
+# A country's canonical name is its REST Countries common name: the key of the country
+# cache and of the favorites.
+
+# Letters Unicode does not decompose into a base letter and accents
+_LETTERS = str.maketrans(
+    {"ø": "o", "æ": "ae", "œ": "oe", "ð": "d", "þ": "th", "ł": "l", "đ": "d", "ı": "i"}
+)
+# Shortest input matched as a part of a name, shorter input has to match exactly
+MIN_PARTIAL = 3
+# Lowest trigram similarity (0 to 1) of a candidate suggestion, and the number of
+# candidates ranked by edit similarity
+MIN_SIMILARITY = 0.2
+CANDIDATES = 10
+# Lowest edit similarity (0 to 1, see `difflib.SequenceMatcher.ratio`) of a suggestion
+MIN_RATIO = 0.6
+
+
+# "Côte d'Ivoire" -> "cote divoire"
+def fold(name: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", name.casefold())
+    letters = "".join(c for c in decomposed if not unicodedata.combining(c))
+    letters = letters.translate(_LETTERS).replace("&", " and ")
+    letters = re.sub(r"['’`]", "", letters)
+    return " ".join(re.sub(r"[\W_]+", " ", letters).split())
+
+
+def trigrams(folded: str) -> set:
+    padded = f"  {folded} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def canonical_name(record: dict) -> str:
+    return record["name"]["common"]
+
+
+class Resolver:
+    """Resolves country names, codes and alternative spellings to REST Countries records."""
+
+    def __init__(self, records: list, produced_at: float = None):
+        self.records = records
+        # When the data was produced, used as Last-Modified of responses built from it
+        self.produced_at = time.time() if produced_at is None else produced_at
+        self._exact = {}  # folded name, code or alt spelling -> record index
+        self._names = []  # (folded name, record index), matched partially and fuzzily
+        self._sizes = []  # number of trigrams of every name in `_names`
+        self._trigrams = {}  # trigram -> positions in `_names`
+
+        for field in ("common", "official", "codes", "altSpellings"):
+            for index, record in enumerate(records):
+                for name in self._names_of(record, field):
+                    folded = fold(name)
+                    if not folded:
+                        continue
+                    # The first country to claim a name keeps it (alt spellings clash)
+                    self._exact.setdefault(folded, index)
+                    if field != "codes":
+                        self._index(folded, index)
+
+    @staticmethod
+    def _names_of(record: dict, field: str) -> list:
+        if field == "codes":
+            return [record.get("cca2") or "", record.get("cca3") or ""]
+        if field == "altSpellings":
+            return record.get("altSpellings") or []
+        return [record["name"].get(field) or ""]
+
+    def _index(self, folded: str, index: int):
+        position = len(self._names)
+        grams = trigrams(folded)
+        self._names.append((folded, index))
+        self._sizes.append(len(grams))
+        for gram in grams:
+            self._trigrams.setdefault(gram, []).append(position)
+
+    def resolve(self, name: str):
+        """Return the record for a country name, code or alternative spelling, or for a
+        part of a name when exactly one country's names contain it. None otherwise."""
+        folded = fold(name)
+        if not folded:
+            return None
+        index = self._exact.get(folded)
+        if index is None and len(folded) >= MIN_PARTIAL:
+            matches = {i for names, i in self._names if folded in names}
+            if len(matches) == 1:
+                index = matches.pop()
+        return self.records[index] if index is not None else None
+
+    def suggest(self, name: str, limit: int = 5) -> list:
+        """Return the canonical names of the countries whose names are most similar to
+        `name`, most similar first."""
+        folded = fold(name)
+        grams = trigrams(folded)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._trigrams.get(gram, ()))
+
+        best = {}  # record index -> (similarity, folded name) of its most similar name
+        for position, count in shared.items():
+            similarity = count / (len(grams) + self._sizes[position] - count)
+            names, index = self._names[position]
+            if similarity >= MIN_SIMILARITY and similarity > best.get(index, (0,))[0]:
+                best[index] = (similarity, names)
+        candidates = sorted(best, key=lambda i: -best[i][0])[:CANDIDATES]
+
+        matcher = SequenceMatcher(b=folded)  # Analyses the input once
+        ratios = {}
+        for i in candidates:
+            matcher.set_seq1(best[i][1])
+            ratios[i] = matcher.ratio()
+        ranked = sorted(
+            (i for i in candidates if ratios[i] >= MIN_RATIO),
+            key=lambda i: (-ratios[i], canonical_name(self.records[i])),
+        )
+        return [canonical_name(self.records[i]) for i in ranked[:limit]]
+
+    def __len__(self):
+        return len(self.records)
+
+
+# The resolver for the current dataset
+_resolver = None
+_lock = threading.Lock()
+
+
+# The resolver over the full dataset (see `gazetteer.dataset`), rebuilt when the dataset
+# is. With `download` False None is returned when the dataset would have to be downloaded.
+def current(max_age: float, download: bool = True):
+    global _resolver
+    dataset = gazetteer.dataset(max_age, download)
+    if dataset is None:
+        return None
+    records, produced_at = dataset
+    resolver = _resolver
+    if resolver is not None and resolver.records is records:
+        return resolver
+    with _lock:
+        if _resolver is None or _resolver.records is not records:
+            _resolver = Resolver(records, produced_at)
+        return _resolver
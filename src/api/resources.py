@@ -1,14 +1,38 @@
-from flask_restx import Namespace, Resource, fields
-from urllib.parse import urlencode
-from flask import request
+from flask_restx import Namespace, Resource, fields, inputs
+from flask import Response, request, url_for
+from werkzeug.exceptions import ServiceUnavailable, TooManyRequests
+from . import (
+    charts,
+    columnar,
+    encoding,
+    lookups,
+    metrics,
+    quota,
+    spatial,
+    streaming,
+    utils,
+)
+from .http_cache import conditional, not_modified_etag
+from .favorites import DEFAULT_USER
 from .models import register_models
+from .prefetch import stats as prefetch_stats
+from .singleflight import stats as coalescing_stats
+from .upstream import pool_stats
 from .utils import (
+    BATCH_FIELDS,
+    batch_lookup,
+    cache_stats,
+    batch_lookup_iter,
+    continent_temperatures,
+    continent_temperatures_iter,
     countries_by_continent,
     country_info,
+    data_timestamp,
     forecast,
     temperature,
     forecast,
     favorites,
+    favorites_count,
     favorite,
     unfavorite,
 )
@@ -16,26 +40,302 @@ from .utils import (
 # Register the models
 api_namespace = Namespace("Api", description="All API operations")
 models = register_models(api_namespace)
+batch_model = models["batch_model"]
+batch_request_model = models["batch_request_model"]
 continent_model = models["continent_model"]
+continent_temperatures_model = models["continent_temperatures_model"]
 country_model = models["country_model"]
+country_query_model = models["country_query_model"]
 favorite_model = models["favorite_model"]
+favorite_list_model = models["favorite_list_model"]
 forecast_model = models["forecast_model"]
+nearby_countries_model = models["nearby_countries_model"]
 temperature_model = models["temperature_model"]
 
-# Each resource calls a method from utils. A 404 is returned at any error
+
+# Each resource calls a method from utils. A 404 is returned at any error, its cause is
+# counted in the metrics. Lookups an overloaded upstream turned away get a 429 (our quota
+# is used up) or 503 (circuit open, upstream rate limited) with Retry-After instead, see
+# `lookups.failure`. GET responses carry ETag, Last-Modified and Cache-Control headers,
+# their max-age follows the TTL of the cache behind them.
+
+
+# Counts a failed lookup and aborts the request, see above for the status
+def _abort_lookup(error: Exception, message: str = None):
+    status, message, retry_after = lookups.failure(error, message)
+    if status == 404:
+        api_namespace.abort(404, message)
+    exception = TooManyRequests if status == 429 else ServiceUnavailable
+    raise exception(message, retry_after=retry_after)
+
+
+# Runs an argument check from `lookups`, returns its value or aborts with a 400
+def _checked(check, *args):
+    try:
+        return check(*args)
+    except ValueError as e:
+        api_namespace.abort(400, str(e))
 
 
 @api_namespace.route("/continents/<string:continent_name>")
 class ContinentResource(Resource):
     @api_namespace.response(200, "Success", models["continent_model"])
     @api_namespace.response(404, "Continent not found")
+    @api_namespace.response(429, "Upstream quota used up, see Retry-After")
+    @api_namespace.response(503, "Upstream unavailable, see Retry-After")
+    @conditional(
+        max_age=lambda: utils.continent_cache.ttl,
+        last_modified=lambda continent_name: data_timestamp(
+            "continent", continent_name
+        ),
+    )
     def get(self, continent_name):
         """Retrieve all countries inside a continent"""
         try:
             countries = countries_by_continent(continent_name)
             return {"continent": continent_name, "countries": countries}, 200
-        except ValueError as e:
-            api_namespace.abort(404, e.__str__())
+        except Exception as e:
+            _abort_lookup(e)
+
+
+# Documents the ?stream= parameter of the resources that can stream their results
+def _stream_param(func):
+    return api_namespace.param(
+        "stream",
+        "Stream each country's result as soon as it is ready, as NDJSON or server-sent "
+        "events (also selected by an Accept header of application/x-ndjson or "
+        "text/event-stream)",
+        _in="query",
+        enum=list(streaming.FORMATS),
+    )(func)
+
+
+# The requested streaming format (see `lookups.stream_format`), 400 if unknown
+def _stream_format(top: int = None):
+    return _checked(
+        lookups.stream_format,
+        request.args.get("stream"),
+        request.headers.get("Accept"),
+        top,
+    )
+
+
+@api_namespace.route("/continents/<string:continent_name>/temperatures")
+class ContinentTemperaturesResource(Resource):
+    @api_namespace.param(
+        "top", "Only return the k warmest countries", _in="query", type=int
+    )
+    @_stream_param
+    @api_namespace.response(200, "Success", continent_temperatures_model)
+    @api_namespace.response(400, "Invalid value for top or stream")
+    @api_namespace.response(404, "Continent not found")
+    @api_namespace.response(429, "Upstream quota used up, see Retry-After")
+    @api_namespace.response(503, "Upstream unavailable, see Retry-After")
+    @conditional(max_age=lambda: utils.weather_cache.ttl)
+    def get(self, continent_name):
+        """Retrieve the temperature of every country inside a continent, warmest first"""
+        top = _checked(lookups.check_top, request.args.get("top", type=int))
+        fmt = _stream_format(top)
+        try:
+            if fmt is not None:
+                return streaming.response(
+                    continent_temperatures_iter(continent_name), fmt
+                )
+            result = continent_temperatures(continent_name, top)
+            return {"continent": continent_name, **result}, 200
+        except Exception as e:
+            _abort_lookup(e)
+
+
+@api_namespace.route("/countries/batch")
+class BatchResource(Resource):
+    # Upper bound on the number of countries in one batch
+    MAX_NAMES = 100
+
+    @api_namespace.expect(batch_request_model)
+    @_stream_param
+    @api_namespace.response(
+        200, "Results per country, with errors per field", batch_model
+    )
+    @api_namespace.response(400, "Invalid batch request")
+    def post(self):
+        """Retrieve information, temperature and/or forecast of several countries at once"""
+        body = request.get_json(silent=True)
+        if body is None:
+            body = {}
+        if not isinstance(body, dict):
+            api_namespace.abort(400, "The request body must be a JSON object")
+        names = body.get("names")
+        include = body.get("include") or ["info"]
+        days = body.get("days", 1)
+
+        if not isinstance(names, list) or not names:
+            api_namespace.abort(400, "Names must be a non-empty list of countries")
+        if len(names) > self.MAX_NAMES:
+            api_namespace.abort(400, f"At most {self.MAX_NAMES} countries per batch")
+        if not all(isinstance(name, str) for name in names):
+            api_namespace.abort(400, "Names must be strings")
+        if not isinstance(include, list) or not all(
+            isinstance(field, str) and field in BATCH_FIELDS for field in include
+        ):
+            api_namespace.abort(
+                400, f"Include must be a list of: {', '.join(BATCH_FIELDS)}"
+            )
+        _checked(lookups.check_days, days)
+
+        include = list(dict.fromkeys(include))
+        fmt = _stream_format()
+        if fmt is not None:
+            return streaming.response(batch_lookup_iter(names, include, days), fmt)
+        return {"results": batch_lookup(names, include, days)}, 200
+
+
+# Documents the min_<field> and max_<field> query parameters of the numeric fields
+def _range_params(func):
+    for field in reversed(columnar.NUMERIC_FIELDS):
+        for bound in ("max", "min"):
+            func = api_namespace.param(
+                f"{bound}_{field}",
+                f"{bound.title()}imum {field} (inclusive)",
+                _in="query",
+                type=float,
+            )(func)
+    return func
+
+
+@api_namespace.route("/countries/query")
+class CountryQueryResource(Resource):
+    @api_namespace.param(
+        "fields",
+        f"Comma-separated fields to return, any of: {', '.join(columnar.FIELDS)}",
+        _in="query",
+    )
+    @api_namespace.param("region", "Only countries in this region or subregion")
+    @_range_params
+    @api_namespace.param(
+        "sort", "Field to sort by, prefixed with - for descending order", _in="query"
+    )
+    @api_namespace.param("offset", "Matches to skip", _in="query", type=int)
+    @api_namespace.param("limit", "Maximum number of countries", _in="query", type=int)
+    @api_namespace.response(200, "Success", country_query_model)
+    @api_namespace.response(400, "Invalid field, range, sort or page")
+    @api_namespace.response(404, "Country data not available")
+    @conditional(
+        max_age=lambda: utils.country_cache.ttl,
+        last_modified=lambda: columnar.built_at(),
+    )
+    def get(self):
+        """Filter, sort and project the data of all countries at once"""
+        fields = request.args.get("fields", default=",".join(columnar.FIELDS))
+        fields = [field.strip() for field in fields.split(",") if field.strip()]
+        if not fields or not set(fields) <= set(columnar.FIELDS):
+            api_namespace.abort(
+                400, f"Fields must be a list of: {', '.join(columnar.FIELDS)}"
+            )
+
+        # Like the other numeric parameters, invalid bounds are ignored
+        ranges = {}
+        for field in columnar.NUMERIC_FIELDS:
+            low = request.args.get(f"min_{field}", type=float)
+            high = request.args.get(f"max_{field}", type=float)
+            if low is not None or high is not None:
+                ranges[field] = (low, high)
+
+        sort = request.args.get("sort")
+        descending = sort is not None and sort.startswith("-")
+        if sort is not None:
+            sort = sort.lstrip("-")
+            if sort not in columnar.FIELDS:
+                api_namespace.abort(
+                    400, f"Sort must be one of: {', '.join(columnar.FIELDS)}"
+                )
+
+        offset = request.args.get("offset", default=0, type=int)
+        limit = request.args.get("limit", default=None, type=int)
+        if offset < 0 or (limit is not None and limit < 1):
+            api_namespace.abort(400, "Offset must be at least 0 and limit at least 1")
+
+        try:
+            table = columnar.table()
+        except Exception as e:
+            _abort_lookup(e, f"Country data not available: {e}")
+        total, countries = table.query(
+            fields,
+            request.args.get("region"),
+            ranges,
+            sort,
+            descending,
+            offset,
+            limit,
+        )
+        return {
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+            "countries": countries,
+        }, 200
+
+
+@api_namespace.route("/countries/near")
+class NearbyCountriesResource(Resource):
+    # Upper bound on the number of countries returned
+    MAX_K = 250
+
+    @api_namespace.param("lat", "Latitude of the point", _in="query", type=float)
+    @api_namespace.param("lon", "Longitude of the point", _in="query", type=float)
+    @api_namespace.param(
+        "radius", "Only countries within this many km", _in="query", type=float
+    )
+    @api_namespace.param(
+        "k",
+        f"Number of countries to return, at most {MAX_K}"
+        f" ({spatial.MAX_WARMEST_CANDIDATES} with warmest)",
+        _in="query",
+        type=int,
+    )
+    @api_namespace.param(
+        "warmest",
+        f"Return the k warmest of the {spatial.MAX_WARMEST_CANDIDATES} nearest"
+        " countries instead of the k nearest",
+        _in="query",
+        type=bool,
+    )
+    @api_namespace.response(200, "Success", nearby_countries_model)
+    @api_namespace.response(400, "Invalid point, radius or k")
+    @api_namespace.response(404, "Country data not available")
+    @conditional(
+        max_age=lambda: (
+            utils.weather_cache.ttl
+            if request.args.get("warmest", type=inputs.boolean)
+            else utils.country_cache.ttl
+        )
+    )
+    def get(self):
+        """Retrieve the countries nearest to a point, or the warmest ones around it"""
+        lat = request.args.get("lat", type=float)
+        lon = request.args.get("lon", type=float)
+        radius = request.args.get("radius", type=float)
+        k = request.args.get("k", default=10, type=int)
+        warmest = request.args.get("warmest", default=False, type=inputs.boolean)
+        if lat is None or lon is None or not -90 <= lat <= 90 or not -180 <= lon <= 180:
+            api_namespace.abort(
+                400, "Lat must be between -90 and 90 and lon between -180 and 180"
+            )
+        if radius is not None and radius <= 0:
+            api_namespace.abort(400, "Radius must be greater than 0")
+        # A warmest query only looks up the temperatures of the nearest candidates
+        max_k = spatial.MAX_WARMEST_CANDIDATES if warmest else self.MAX_K
+        if k < 1 or k > max_k:
+            api_namespace.abort(
+                400,
+                f"K must be between 1 and {max_k}"
+                + (" with warmest" if warmest else ""),
+            )
+
+        try:
+            return spatial.countries_near(lat, lon, radius, k, warmest), 200
+        except Exception as e:
+            _abort_lookup(e, f"Country data not available: {e}")
 
 
 @api_namespace.route("/countries/<string:country_name>")
@@ -46,26 +346,48 @@ class CountryResource(Resource):
         model=country_model,
     )
     @api_namespace.response(404, "Country not found")
+    @conditional(
+        max_age=lambda: utils.country_cache.ttl,
+        last_modified=lambda country_name: data_timestamp("country", country_name),
+    )
     def get(self, country_name):
         """Retrieve information of a specific country"""
         try:
             info = country_info(country_name)
             return info, 200
-        except Exception:
-            api_namespace.abort(404, "Country not found or has no data")
+        except Exception as e:
+            _abort_lookup(e)
 
 
 @api_namespace.route("/countries/<string:country_name>/temperature")
 class TemperatureResource(Resource):
+    @api_namespace.param(
+        "nowcast",
+        "Allow estimating the temperature from the cached forecast",
+        _in="query",
+        type=bool,
+    )
     @api_namespace.response(200, "Success", temperature_model)
     @api_namespace.response(404, "No temperature data found")
+    @api_namespace.response(429, "Upstream quota used up, see Retry-After")
+    @api_namespace.response(503, "Upstream unavailable, see Retry-After")
+    @conditional(
+        max_age=lambda: utils.weather_cache.ttl,
+        # Nowcasts are interpolated at the time of the request, they have no version
+        last_modified=lambda country_name: (
+            None
+            if request.args.get("nowcast", type=inputs.boolean)
+            else data_timestamp("weather", country_name)
+        ),
+    )
     def get(self, country_name):
         """Retrieve the temperature from the capital city"""
+        allow_nowcast = request.args.get("nowcast", default=False, type=inputs.boolean)
         try:
-            temp = temperature(country_name)
+            temp = temperature(country_name, allow_nowcast)
             return {"temperature": temp}, 200
         except Exception as e:
-            api_namespace.abort(404, e.__str__())
+            _abort_lookup(e)
 
 
 @api_namespace.route("/countries/<string:country_name>/forecast")
@@ -73,70 +395,123 @@ class ForecastResource(Resource):
     @api_namespace.param(
         "days", "Number of days to forecast (between 1 and 5)", _in="query"
     )
+    @api_namespace.param(
+        "render",
+        "Render the chart through quickchart.io or locally (served from /charts)",
+        _in="query",
+        enum=list(charts.RENDERERS),
+    )
     @api_namespace.response(200, "Success", forecast_model)
-    @api_namespace.response(400, "Invalid number of days")
+    @api_namespace.response(400, "Invalid number of days or renderer")
     @api_namespace.response(404, "No forecast available")
+    @api_namespace.response(429, "Upstream quota used up, see Retry-After")
+    @api_namespace.response(503, "Upstream unavailable, see Retry-After")
+    @conditional(
+        max_age=lambda: utils.forecast_cache.ttl,
+        last_modified=lambda country_name: data_timestamp("forecast", country_name),
+    )
     def get(self, country_name):
         """Get a graph with forecast information for next n days"""
-        days = request.args.get("days", default=1, type=int)
-        if days < 1 or days > 5:
-            api_namespace.abort(
-                400,
-                "Days must be greater than or equal to 1 and less than or equal to 5",
-            )
+        days = _checked(
+            lookups.check_days, request.args.get("days", default=1, type=int)
+        )
+        renderer = _checked(
+            lookups.check_renderer, request.args.get("render", default=charts.RENDERER)
+        )
         try:
             forecasts = forecast(country_name, days)
-            labels = [f["time"] for f in forecasts]
-            temps = [f["temperature"] for f in forecasts]
-
-            # Create the request for QuickChart
-            chart_config = {
-                "type": "line",
-                "data": {
-                    "labels": labels,
-                    "datasets": [
-                        {
-                            "label": f"3-Hourly Temperature Forecast for {days} Day(s)",
-                            "data": temps,
-                            "fill": 0,
-                            "borderColor": "rgb(75, 192, 192)",
-                            "tension": 0.1,
-                        }
-                    ],
-                },
-                "options": {
-                    "title": {
-                        "display": 1,
-                        "text": f"Temperature Forecast for {country_name.title()}",
-                    }
-                },
-            }
-
-            chart_url = (
-                f"https://quickchart.io/chart?c={urlencode({'c': str(chart_config)})}"
-            )
+            config = charts.chart_config(country_name, days, forecasts)
+            if renderer == "local":
+                chart_hash = charts.store_chart(config)
+                chart_url = url_for(
+                    ChartResource.endpoint, chart_hash=chart_hash, _external=True
+                )
+            else:
+                chart_url = charts.quickchart_url(config)
 
             return {"forecast_url": chart_url}, 200
         except Exception as e:
-            api_namespace.abort(404, e.__str__())
+            _abort_lookup(e)
+
+
+@api_namespace.route("/charts/<string:chart_hash>")
+class ChartResource(Resource):
+    @api_namespace.response(200, "The rendered chart as SVG")
+    @api_namespace.response(304, "Not modified")
+    @api_namespace.response(404, "Chart not found or expired")
+    def get(self, chart_hash):
+        """Retrieve a locally rendered forecast chart by its content hash"""
+        # The hash identifies the content, so a client holding it never needs to revalidate
+        headers = {
+            "ETag": f'"{chart_hash}"',
+            "Cache-Control": "public, max-age=31536000, immutable",
+        }
+        # The image has a single media type, only its coding varies (see `compress_response`)
+        etag = not_modified_etag(
+            encoding.variant_etags(
+                headers["ETag"], None, request.headers.get("Accept-Encoding")
+            ),
+            None,
+            request.headers.get("If-None-Match"),
+            None,
+        )
+        if etag is not None:
+            return Response(status=304, headers={**headers, "ETag": etag})
+
+        image = charts.get_chart(chart_hash)
+        if image is None:
+            api_namespace.abort(404, "Chart not found or expired")
+        return Response(image, mimetype="image/svg+xml", headers=headers)
+
+
+# `user` only separates favorite lists: it is chosen by the client and not authenticated
+USER_PARAM = (
+    "Whose favorites to %s. A label chosen by the client, not an authenticated identity:"
+    " anyone can read or change any user's list"
+)
 
 
 @api_namespace.route("/favorites")
 class FavoriteListResource(Resource):
-    @api_namespace.response(200, "List of favorites", [favorite_model])
+    # Favorites returned per page when the client does not ask for a page size
+    PER_PAGE = 100
+    MAX_PER_PAGE = 1000
+
+    @api_namespace.param("user", USER_PARAM % "list", _in="query")
+    @api_namespace.param("page", "Page to return, starting at 1", _in="query", type=int)
+    @api_namespace.param("per_page", "Favorites per page", _in="query", type=int)
+    @api_namespace.response(200, "List of favorites", favorite_list_model)
+    @api_namespace.response(400, "Invalid page or page size")
+    @conditional(max_age=0, private=True)
     def get(self):
         """Retrieve a list of all favorite countries."""
-        return {"favorites": favorites()}, 200
+        user = request.args.get("user", default=DEFAULT_USER)
+        page = request.args.get("page", default=1, type=int)
+        per_page = request.args.get("per_page", default=self.PER_PAGE, type=int)
+        if page < 1:
+            api_namespace.abort(400, "Page must be greater than or equal to 1")
+        if per_page < 1 or per_page > self.MAX_PER_PAGE:
+            api_namespace.abort(
+                400,
+                f"Per page must be between 1 and {self.MAX_PER_PAGE}",
+            )
+        return {
+            "favorites": favorites(user, (page - 1) * per_page, per_page),
+            "page": page,
+            "per_page": per_page,
+            "total": favorites_count(user),
+        }, 200
 
 
 @api_namespace.route("/favorites/<string:country_name>")
+@api_namespace.param("user", USER_PARAM % "change", _in="query")
 class FavoriteResource(Resource):
     @api_namespace.expect(favorite_model)
     @api_namespace.response(200, "Country favorited")
     @api_namespace.response(404, "Country not found or already favorited")
     def post(self, country_name):
         """Add a country to favorites."""
-        if favorite(country_name):
+        if favorite(country_name, request.args.get("user", default=DEFAULT_USER)):
             return {"message": f"{country_name} has been added to favorites"}, 200
         else:
             api_namespace.abort(404, "Country not found or already favorited")
@@ -145,7 +520,32 @@ class FavoriteResource(Resource):
     @api_namespace.response(404, "Country not found or not in favorites")
     def delete(self, country_name):
         """Remove a country from favorites."""
-        if unfavorite(country_name):
+        if unfavorite(country_name, request.args.get("user", default=DEFAULT_USER)):
             return {"message": f"{country_name} has been removed from favorites"}, 200
         else:
             api_namespace.abort(404, "Country not found or not in favorites")
+
+
+@api_namespace.route("/status")
+class StatusResource(Resource):
+    @api_namespace.response(200, "Upstream connection pool and cache statistics")
+    def get(self):
+        """Retrieve connection pool, cache, request coalescing, prefetch and quota statistics"""
+        return {
+            "upstreams": pool_stats(),
+            "caches": cache_stats(),
+            "coalescing": coalescing_stats(),
+            "prefetch": prefetch_stats(),
+            "quotas": quota.stats(),
+        }, 200
+
+
+@api_namespace.route("/metrics")
+class MetricsResource(Resource):
+    @api_namespace.response(200, "Metrics in the Prometheus text format")
+    def get(self):
+        """Retrieve latency histograms, error counters and cache hit ratios for Prometheus"""
+        body = metrics.render(
+            cache_stats(), coalescing_stats(), pool_stats(), quota.stats()
+        )
+        return Response(body, content_type="text/plain; version=0.0.4; charset=utf-8")
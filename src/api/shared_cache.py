@@ -0,0 +1,218 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from src.api.cache import MISSING, Negative, TTLCache, normalize_key
+
+
+class SQLiteTTLCache:
+    """A `TTLCache` kept in a SQLite file, shared by every worker process on the host.
+
+    Several caches can share one file, each under its own name. The database runs in WAL
+    mode and reads never write, so lookups don't wait for each other or for writers. Once
+    a cache holds more than `maxsize` entries, writes remove the expired entries and then
+    the oldest ones. Hit/miss counters are those of the current process.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        name: str,
+        maxsize: int = 1024,
+        ttl: float = 86400,
+        negative_ttl: float = 300,
+        stale_ttl: float = 0,
+    ):
+        self.path = path
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.stale_ttl = stale_ttl
+        self._local = threading.local()  # One connection per thread and process
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.evictions = 0
+        self.expirations = 0
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries ("
+                " cache TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " value BLOB NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " stale_until REAL NOT NULL,"
+                " stored_at REAL NOT NULL,"
+                " PRIMARY KEY (cache, key)"
+                ")"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS cache_entries_by_age"
+                " ON cache_entries (cache, stored_at)"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        # Connections are not carried over into forked workers
+        pid = os.getpid()
+        if getattr(self._local, "pid", None) != pid:
+            connection = sqlite3.connect(self.path, timeout=10)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection, self._local.pid = connection, pid
+        return self._local.connection
+
+    # Keys are normalized as in `TTLCache`, then stored as their repr: ("a", 1.5) stays a
+    # tuple of a string and a float
+    @staticmethod
+    def _key(key) -> str:
+        return repr(normalize_key(key))
+
+    def _count(self, field: str):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def get(self, key, default=MISSING):
+        """Return the cached value (or a `Negative`), `default` if absent or expired."""
+        value, stale = self.get_stale(key, default, allow_stale=False)
+        return value
+
+    def get_stale(self, key, default=MISSING, allow_stale: bool = True) -> tuple:
+        """Return (value, is_stale); expired entries are returned while in their stale window."""
+        row = (
+            self._connection()
+            .execute(
+                "SELECT value, expires_at, stale_until FROM cache_entries"
+                " WHERE cache = ? AND key = ?",
+                (self.name, self._key(key)),
+            )
+            .fetchone()
+        )
+        now = time.time()
+        if row is None or row[2] <= now or (row[1] <= now and not allow_stale):
+            self._count("misses")
+            return default, False
+        value, stale = pickle.loads(row[0]), row[1] <= now
+        if isinstance(value, Negative):
+            self._count("negative_hits")
+        elif stale:
+            self._count("stale_hits")
+        else:
+            self._count("hits")
+        return value, stale
+
+    def set(self, key, value, ttl: float = None):
+        """Store a value, removing expired and then the oldest entries when full."""
+        if self.maxsize <= 0:
+            return
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        expires_at = now + ttl
+        stale_until = (
+            expires_at if isinstance(value, Negative) else expires_at + self.stale_ttl
+        )
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO cache_entries VALUES (?, ?, ?, ?, ?, ?)",
+                (self.name, self._key(key), data, expires_at, stale_until, now),
+            )
+            (size,) = connection.execute(
+                "SELECT COUNT(*) FROM cache_entries WHERE cache = ?", (self.name,)
+            ).fetchone()
+            if size > self.maxsize:
+                self._trim(connection, size, now)
+
+    def _trim(self, connection: sqlite3.Connection, size: int, now: float):
+        expired = connection.execute(
+            "DELETE FROM cache_entries WHERE cache = ? AND stale_until <= ?",
+            (self.name, now),
+        ).rowcount
+        evicted = 0
+        if size - expired > self.maxsize:
+            evicted = connection.execute(
+                "DELETE FROM cache_entries WHERE cache = ? AND key IN ("
+                " SELECT key FROM cache_entries WHERE cache = ?"
+                " ORDER BY stored_at LIMIT ?)",
+                (self.name, self.name, size - expired - self.maxsize),
+            ).rowcount
+        with self._lock:
+            self.expirations += expired
+            self.evictions += evicted
+
+    def peek(self, key) -> tuple:
+        """Return (value, stored_at) without counting a hit."""
+        row = (
+            self._connection()
+            .execute(
+                "SELECT value, stored_at FROM cache_entries"
+                " WHERE cache = ? AND key = ? AND stale_until > ?",
+                (self.name, self._key(key), time.time()),
+            )
+            .fetchone()
+        )
+        if row is None:
+            return MISSING, None
+        return pickle.loads(row[0]), row[1]
+
+    def expires_in(self, key):
+        """Seconds until the entry expires (negative once stale), None if absent."""
+        now = time.time()
+        row = (
+            self._connection()
+            .execute(
+                "SELECT expires_at FROM cache_entries"
+                " WHERE cache = ? AND key = ? AND stale_until > ?",
+                (self.name, self._key(key), now),
+            )
+            .fetchone()
+        )
+        return None if row is None else row[0] - now
+
+    def set_negative(self, key, message: str):
+        """Remember that a lookup failed, for the (shorter) negative TTL."""
+        self.set(key, Negative(message), ttl=self.negative_ttl)
+
+    def clear(self):
+        with self._connection() as connection:
+            connection.execute(
+                "DELETE FROM cache_entries WHERE cache = ?", (self.name,)
+            )
+
+    def __len__(self):
+        (size,) = (
+            self._connection()
+            .execute("SELECT COUNT(*) FROM cache_entries WHERE cache = ?", (self.name,))
+            .fetchone()
+        )
+        return size
+
+    def stats(self) -> dict:
+        size = len(self)
+        with self._lock:
+            return {
+                "size": size,
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "negative_hits": self.negative_hits,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+# Returns a cache named `name` in the SQLite file at `path`, or an in-memory `TTLCache`
+# without a path
+def create_cache(path: str = None, name: str = None, **options):
+    if path is None:
+        return TTLCache(**options)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    return SQLiteTTLCache(path, name, **options)
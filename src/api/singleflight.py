@@ -0,0 +1,95 @@
+import asyncio
+import threading
+
+# Every single-flight group by name, so their counters can be reported together
+_groups = {}
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Lets concurrent callers asking for the same key share one in-flight call.
+
+    The first caller runs the function, callers arriving while it runs wait for it and
+    receive the same result or exception. Nothing is kept once the call has finished.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+        _groups[name] = self
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except Exception as err:
+            call.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._calls),
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+        }
+
+
+class AsyncSingleFlight:
+    """Asyncio counterpart of `SingleFlight`, `func` returns an awaitable."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls = {}
+        self.calls = 0
+        self.coalesced = 0
+        _groups[name] = self
+
+    async def do(self, key, func):
+        future = self._calls.get(key)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            future = self._calls[key] = asyncio.ensure_future(func())
+            future.add_done_callback(lambda _: self._calls.pop(key, None))
+            self.calls += 1
+        # Shielded, so a cancelled caller does not cancel the call for everyone else
+        return await asyncio.shield(future)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._calls),
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+        }
+
+
+def stats() -> dict:
+    return {name: group.stats() for name, group in _groups.items()}
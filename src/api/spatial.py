@@ -0,0 +1,149 @@
+import math
+import threading
+
+import numpy as np
+
+from src.api import columnar, metrics, utils
+from src.api.fanout import fan_out
+
+# Nearest-neighbour lookups over the coordinates of every country (the ones its weather is
+# looked up for). Countries are bucketed into a grid of `CELL` degree cells, a radius query
+# only measures the countries in the cells overlapping the search circle, with one
+# vectorized haversine computation.
+
+EARTH_RADIUS_KM = 6371.0088
+CELL = 10  # Degrees
+# Upper bound on the nearest countries whose temperature a "warmest" query looks up
+MAX_WARMEST_CANDIDATES = 50
+
+
+# Great-circle distances in km from one point to arrays of points
+def haversine_km(lat: float, lon: float, lats, lons):
+    lat, lon = math.radians(lat), math.radians(lon)
+    lats, lons = np.radians(lats), np.radians(lons)
+    a = (
+        np.sin((lats - lat) / 2) ** 2
+        + math.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class SpatialIndex:
+    """Grid index over points, answering radius and k-nearest queries."""
+
+    def __init__(self, lats, lons, cell: float = CELL):
+        self.cell = cell
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.rows = math.ceil(180 / cell)
+        self.cols = math.ceil(360 / cell)
+        # Points without coordinates are left out of every cell
+        known = np.flatnonzero(~(np.isnan(self.lats) | np.isnan(self.lons)))
+        self.known = known
+        cells = {}
+        for index, row, col in zip(
+            known, self._row(self.lats[known]), self._col(self.lons[known])
+        ):
+            cells.setdefault((int(row), int(col)), []).append(index)
+        self._cells = {key: np.array(indices) for key, indices in cells.items()}
+
+    def _row(self, lat):
+        return np.clip(np.floor((np.asarray(lat) + 90) / self.cell), 0, self.rows - 1)
+
+    def _col(self, lon):
+        return np.floor((np.asarray(lon) + 180) / self.cell) % self.cols
+
+    # Indices of the points in the cells overlapping a circle, a superset of the matches
+    def _candidates(self, lat: float, lon: float, radius_km: float):
+        angle = radius_km / EARTH_RADIUS_KM
+        dlat = math.degrees(angle)
+        first_row = int(self._row(lat - dlat))
+        last_row = int(self._row(lat + dlat))
+
+        # Near the poles, or for very large circles, every longitude can be in range
+        reach = math.sin(angle) / max(math.cos(math.radians(lat)), 1e-12)
+        if angle >= math.pi / 2 or abs(lat) + dlat >= 90 or reach >= 1:
+            columns = range(self.cols)
+        else:
+            dlon = math.degrees(math.asin(reach))
+            first_col = int(math.floor((lon - dlon + 180) / self.cell))
+            last_col = int(math.floor((lon + dlon + 180) / self.cell))
+            columns = {col % self.cols for col in range(first_col, last_col + 1)}
+
+        found = [
+            self._cells[(row, col)]
+            for row in range(first_row, last_row + 1)
+            for col in columns
+            if (row, col) in self._cells
+        ]
+        return np.concatenate(found) if found else np.array([], dtype=np.int64)
+
+    def near(self, lat: float, lon: float, radius_km: float = None, k: int = None):
+        """Returns (indices, distances in km) of the points within `radius_km` (all
+        points without one), nearest first, at most `k` of them."""
+        if radius_km is None:
+            candidates = self.known
+        else:
+            candidates = self._candidates(lat, lon, radius_km)
+        distances = haversine_km(lat, lon, self.lats[candidates], self.lons[candidates])
+        if radius_km is not None:
+            inside = distances <= radius_km
+            candidates, distances = candidates[inside], distances[inside]
+
+        if k is not None and k < len(candidates):
+            nearest = np.argpartition(distances, k - 1)[:k]
+            candidates, distances = candidates[nearest], distances[nearest]
+        order = np.argsort(distances, kind="stable")
+        return candidates[order], distances[order]
+
+
+# The index and the country table it was built for
+_index = None
+_table = None
+_lock = threading.Lock()
+
+
+# The index over the current country table, rebuilt when the table is
+def index() -> tuple:
+    global _index, _table
+    table = columnar.table()
+    with _lock:
+        if _table is not table:
+            _index = SpatialIndex(table.columns["latitude"], table.columns["longitude"])
+            _table = table
+        return _index, table
+
+
+# The countries nearest to a point, optionally within `radius_km`. With `warmest` the
+# temperatures of (at most MAX_WARMEST_CANDIDATES of) them are looked up through the
+# weather cache and the k warmest are returned instead, warmest first.
+def countries_near(
+    lat: float, lon: float, radius_km: float = None, k: int = 10, warmest=False
+) -> dict:
+    spatial_index, table = index()
+    indices, distances = spatial_index.near(
+        lat, lon, radius_km, MAX_WARMEST_CANDIDATES if warmest else k
+    )
+    countries = [
+        {
+            **table.row(i, ("name", "latitude", "longitude")),
+            "distance_km": round(float(distance), 1),
+        }
+        for i, distance in zip(indices, distances)
+    ]
+    if not warmest:
+        return {"countries": countries, "errors": []}
+
+    def country_temperature(country):
+        data = utils.weather_data("weather", country["latitude"], country["longitude"])
+        return data["main"]["temp"]
+
+    found, errors = [], []
+    for country, temp, error in fan_out(country_temperature, countries):
+        if error is None:
+            found.append({**country, "temperature": temp})
+        else:
+            metrics.record_error(error)
+            errors.append({"country": country["name"], "error": str(error)})
+    found.sort(key=lambda country: country["temperature"], reverse=True)
+    return {"countries": found[:k], "errors": errors}
@@ -0,0 +1,67 @@
+import json
+
+from flask import Response, stream_with_context
+
+from src.api import metrics
+
+# Streaming response modes for lookups that fan out over many countries. Every result is
+# written as soon as it is ready, one JSON object per line (NDJSON) or one server-sent
+# event each, so clients see the first countries long before the slowest upstream call.
+
+FORMATS = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+
+# The streaming format asked for with ?stream= or the Accept header, None for plain JSON.
+# Raises ValueError for an unknown ?stream= value.
+def requested_format(stream: str = None, accept: str = "") -> str:
+    if stream:
+        if stream not in FORMATS:
+            raise ValueError(f"Stream must be one of {', '.join(FORMATS)}")
+        return stream
+    for name, mimetype in FORMATS.items():
+        if mimetype in (accept or ""):
+            return name
+    return None
+
+
+# One item as an NDJSON line or as a "result" server-sent event
+def encode_item(item, fmt: str) -> str:
+    if fmt == "ndjson":
+        return json.dumps(item) + "\n"
+    return f"event: result\ndata: {json.dumps(item)}\n\n"
+
+
+# What follows the last item: nothing for NDJSON, an "end" event with the number of
+# results for server-sent events
+def encode_end(count: int, fmt: str) -> str:
+    if fmt == "ndjson":
+        return ""
+    return f"event: end\ndata: {json.dumps({'count': count})}\n\n"
+
+
+def encode(items, fmt: str):
+    count = 0
+    for item in items:
+        count += 1
+        yield encode_item(item, fmt)
+    end = encode_end(count, fmt)
+    if end:
+        yield end
+
+
+# Headers of a streamed response: not cached, and not buffered by proxies such as nginx
+def headers(fmt: str) -> dict:
+    return {
+        "Content-Type": FORMATS[fmt],
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    }
+
+
+# Per-country errors are counted under the request's route, see `metrics.stream_request`
+def response(items, fmt: str) -> Response:
+    chunks = (chunk.encode() for chunk in encode(items, fmt))
+    timing = metrics.current_request()
+    if timing is not None:
+        chunks = metrics.stream_request(timing, chunks)
+    return Response(stream_with_context(chunks), headers=headers(fmt))
@@ -0,0 +1,224 @@
+import math
+import random
+import threading
+import time
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.api import metrics, quota
+
+# Statuses worth retrying, everything else is returned to the caller as is
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+# Seconds to wait before retry `attempt` (from 0): exponential backoff with full jitter, or
+# the upstream's Retry-After when it is short
+def backoff_delay(backoff: float, attempt: int, retry_after: str = None) -> float:
+    delay = random.uniform(0, backoff * 2**attempt)
+    if retry_after is not None:
+        try:
+            delay = max(delay, min(float(retry_after), 5 * backoff * 2**attempt))
+        except ValueError:
+            pass
+    return delay
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of calling an upstream that keeps failing."""
+
+    def __init__(self, message: str, retry_after: float = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Stops calling an upstream after consecutive failures, probing again after a cooldown."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    # Seconds until the next probe is let through
+    def retry_after(self) -> float:
+        opened_at = self.opened_at
+        if opened_at is None:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - opened_at))
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "half-open":
+                # Let a single probe through, everyone else waits for its outcome
+                self.opened_at = time.monotonic()
+            return state != "open"
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            # A failed probe while half-open restarts the cooldown
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                self.opened_at = time.monotonic()
+
+
+class Upstream:
+    """Keep-alive HTTP client for one upstream host with timeouts, retries and a circuit breaker."""
+
+    def __init__(
+        self,
+        name: str,
+        pool_size: int = 20,
+        connect_timeout: float = 3.05,
+        read_timeout: float = 10,
+        retries: int = 2,
+        backoff: float = 0.25,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30,
+    ):
+        self.name = name
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.requests = 0
+        self.retried = 0
+        self.failures = 0
+
+        # Reuse connections instead of paying a TCP+TLS handshake per call
+        self.adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session = requests.Session()
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+
+    def get(self, url: str, params: dict = None) -> requests.Response:
+        """Send a GET request, retrying 429/5xx responses and connection errors. Every
+        attempt goes through the upstream's rate limiter when it has one."""
+        if not self.breaker.allow():
+            metrics.upstream_rejected(self.name)
+            raise CircuitOpenError(
+                f"Circuit open for upstream {self.name}", self.breaker.retry_after()
+            )
+
+        governor = quota.governor(self.name)
+        for attempt in range(self.retries + 1):
+            key, call_params = None, params
+            if governor is not None:
+                key, wait = governor.reserve()
+                time.sleep(wait)
+                call_params = governor.params(params, key)
+            self.requests += 1
+            started = metrics.upstream_started(self.name)
+            try:
+                response = self.session.get(
+                    url, params=call_params, timeout=self.timeout
+                )
+            except (
+                requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+            ) as err:
+                metrics.upstream_finished(self.name, started, error=err)
+                if attempt == self.retries:
+                    self.failures += 1
+                    self.breaker.record_failure()
+                    raise
+                self._sleep(attempt)
+                continue
+
+            metrics.upstream_finished(self.name, started, response.status_code)
+            if response.status_code == 429 and governor is not None:
+                governor.throttled(key, response.headers.get("Retry-After"))
+            if response.status_code in RETRY_STATUSES and attempt < self.retries:
+                self._sleep(attempt, response.headers.get("Retry-After"))
+                continue
+            break
+
+        if response.status_code in RETRY_STATUSES:
+            self.failures += 1
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def _sleep(self, attempt: int, retry_after: str = None):
+        self.retried += 1
+        time.sleep(backoff_delay(self.backoff, attempt, retry_after))
+
+    def stats(self) -> dict:
+        pools = []
+        for key in list(self.adapter.poolmanager.pools.keys()):
+            pool = self.adapter.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            pools.append(
+                {
+                    "host": f"{pool.scheme}://{pool.host}:{pool.port}",
+                    "connections_opened": pool.num_connections,
+                    "requests": pool.num_requests,
+                    "idle": pool.pool.qsize() if pool.pool is not None else 0,
+                }
+            )
+        return {
+            "requests": self.requests,
+            "retries": self.retried,
+            "failures": self.failures,
+            "circuit": self.breaker.state,
+            "pools": pools,
+        }
+
+
+# One shared client per upstream, used by every worker thread
+_upstreams = {
+    "restcountries": Upstream("restcountries"),
+    "openweathermap": Upstream("openweathermap"),
+}
+
+
+# Replaces the upstream clients, e.g. to change timeouts or the number of retries
+def configure(**options):
+    for name in _upstreams:
+        _upstreams[name] = Upstream(name, **options)
+
+
+def get(name: str, url: str, params: dict = None) -> requests.Response:
+    return _upstreams[name].get(url, params)
+
+
+# The status (429 or 503) and Retry-After seconds to answer a lookup with that failed
+# because an upstream is overloaded, None for other failures: 429 when our own quota is
+# used up, 503 while the circuit is open or when the upstream itself still answered 429
+def overload(err: BaseException):
+    cause = err
+    while cause is not None:
+        if isinstance(cause, quota.QuotaExceededError):
+            return 429, math.ceil(cause.retry_after)
+        if isinstance(cause, CircuitOpenError):
+            return 503, math.ceil(cause.retry_after or 0) or None
+        if isinstance(cause, (requests.exceptions.HTTPError, httpx.HTTPStatusError)):
+            response = cause.response
+            if response is not None and response.status_code == 429:
+                retry_after = response.headers.get("Retry-After", "")
+                return 503, int(retry_after) if retry_after.isdigit() else None
+        cause = cause.__cause__ or cause.__context__
+    return None
+
+
+def pool_stats() -> dict:
+    return {name: upstream.stats() for name, upstream in _upstreams.items()}
@@ -1,13 +1,165 @@
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 
-# Global set storing the favorites, will not persist when the api is restarted
-favorite_countries = set()
-API_KEY = None
+from src.api import gazetteer, metrics, resolver, upstream
+from src.api.fanout import fan_out_iter
+from src.api.favorites import DEFAULT_USER, MemoryFavoritesStore, create_store
+from src.api.cache import TTLCache, Negative, MISSING, Popularity, normalize_key
+from src.api.shared_cache import create_cache
+from src.api.singleflight import SingleFlight
 
+# Favorites are kept in memory by default, which does not persist when the api is restarted
+# and is not shared between worker processes. `configure_favorites` can switch to SQLite.
+favorites_store = MemoryFavoritesStore()
+API_KEY = None
 
-def set_api_key(key: str):
+REST_COUNTRIES_URL = "https://restcountries.com/v3.1"
+OPENWEATHERMAP_URL = "http://api.openweathermap.org/data/2.5"
+
+# Country metadata barely changes, so lookups are cached for a day by default.
+# Unknown names (e.g. "ChakaMaka") are cached negatively for a shorter period.
+country_cache = TTLCache(maxsize=512, ttl=86400, negative_ttl=300)
+continent_cache = TTLCache(maxsize=16, ttl=86400, negative_ttl=300)
+
+# Weather is cached per cell of a lat/lon grid (0.1 degrees is roughly 11 km). Current
+# conditions update about every 10 minutes, forecasts every few hours. Past its TTL an
+# entry is still served during its stale window while a background refresh runs.
+WEATHER_GRID = 0.1
+weather_cache = TTLCache(maxsize=2048, ttl=600, stale_ttl=1800)
+forecast_cache = TTLCache(maxsize=2048, ttl=10800, stale_ttl=10800)
+_refresh_executor = ThreadPoolExecutor(
+    max_workers=4, thread_name_prefix="weather-refresh"
+)
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+# How often each (endpoint, lat, lon) weather cell is asked for, so the prefetcher can keep
+# the most popular ones warm
+weather_popularity = Popularity()
+
+# Concurrent requests for the same region, country or coordinates share one upstream call
+upstream_flight = SingleFlight("upstream")
+
+
+# Sets the OpenWeatherMap key, or several: the first is used unless a rate limiter set up
+# with `quota.configure` rotates over them
+def set_api_key(key):
     global API_KEY
-    API_KEY = key
+    API_KEY = key if isinstance(key, str) else key[0]
+
+
+# Points the lookups at other REST Countries / OpenWeatherMap deployments, e.g. local
+# stand-ins for benchmarks
+def set_upstream_urls(rest_countries: str = None, openweathermap: str = None):
+    global REST_COUNTRIES_URL, OPENWEATHERMAP_URL
+    if rest_countries:
+        REST_COUNTRIES_URL = rest_countries.rstrip("/")
+        gazetteer.set_base_url(REST_COUNTRIES_URL)
+    if openweathermap:
+        OPENWEATHERMAP_URL = openweathermap.rstrip("/")
+
+
+# Replaces the country and continent caches, e.g. to change the TTL or size bound. With a
+# `path` they are kept in that SQLite file, shared by all workers (see `shared_cache`).
+def configure_cache(
+    ttl: float = 86400, maxsize: int = 512, negative_ttl: float = 300, path: str = None
+):
+    global country_cache, continent_cache
+    country_cache = create_cache(
+        path, "countries", maxsize=maxsize, ttl=ttl, negative_ttl=negative_ttl
+    )
+    continent_cache = create_cache(
+        path, "continents", maxsize=16, ttl=ttl, negative_ttl=negative_ttl
+    )
+    gazetteer.set_shared_cache(
+        create_cache(path, "datasets", maxsize=4, ttl=ttl) if path else None
+    )
+
+
+# Replaces the weather caches, e.g. to change the grid size, TTLs or stale windows. With a
+# `path` they are kept in that SQLite file, shared by all workers.
+def configure_weather_cache(
+    grid: float = 0.1,
+    weather_ttl: float = 600,
+    forecast_ttl: float = 10800,
+    weather_stale: float = 1800,
+    forecast_stale: float = 10800,
+    maxsize: int = 2048,
+    path: str = None,
+):
+    global WEATHER_GRID, weather_cache, forecast_cache
+    WEATHER_GRID = grid
+    weather_cache = create_cache(
+        path, "weather", maxsize=maxsize, ttl=weather_ttl, stale_ttl=weather_stale
+    )
+    forecast_cache = create_cache(
+        path, "forecasts", maxsize=maxsize, ttl=forecast_ttl, stale_ttl=forecast_stale
+    )
+
+
+# Switches the favorites to a SQLite file shared by all workers, or back to memory with None
+def configure_favorites(path: str = None):
+    global favorites_store
+    favorites_store = create_store(path)
+
+
+# Returns the hit/miss/eviction counters of every cache
+def cache_stats() -> dict:
+    return {
+        "countries": country_cache.stats(),
+        "continents": continent_cache.stats(),
+        "weather": weather_cache.stats(),
+        "forecasts": forecast_cache.stats(),
+    }
+
+
+# When the data behind a response was produced, as a unix timestamp (None if unknown):
+# when country data was downloaded, the observation time of the current weather and when
+# the forecast was fetched, or the start of the current forecast slot if later, since
+# forecasts drop the slots that are over. None for stale weather, which is being refreshed.
+# Only looks at what is cached, never calls an upstream.
+def data_timestamp(kind: str, name: str):
+    if kind == "continent":
+        index = gazetteer.current()
+        if index is not None:
+            return index.loaded_at
+        return continent_cache.peek(name.title())[1]
+
+    try:
+        name, record = resolve_country(name, download=False)
+    except Exception:  # Unknown country
+        return None
+    if record is not None:
+        if kind == "country":
+            index = resolver.current(country_cache.ttl, download=False)
+            return index.produced_at if index is not None else None
+        info = country_details(record, name)
+    else:
+        info, stored_at = country_cache.peek(name)
+        if kind == "country":
+            return stored_at
+    if info is MISSING or isinstance(info, Negative):
+        return None
+    try:
+        point = grid_point(info["latitude"], info["longitude"])
+    except TypeError:  # Coordinates are "Unknown"
+        return None
+
+    cache = weather_cache_for(kind)
+    expires_in = cache.expires_in(point)
+    if expires_in is None or expires_in <= 0:
+        return None
+    data, stored_at = cache.peek(point)
+    if kind == "weather" and data is not MISSING:
+        return data.get("dt", stored_at)
+    if kind == "forecast" and stored_at is not None:
+        now = time.time()
+        return max(stored_at, now - now % FORECAST_SLOT)
+    return stored_at
 
 
 # Returns a list of all continents in a format compatible with the REST Countries API.
@@ -27,132 +179,425 @@ def countries_by_continent(continent_name: str) -> list:
             f"Invalid continent: {continent_name}. Valid continents are: {valid_continents}"
         )
 
+    # Answer from the offline gazetteer when one is loaded
+    index = gazetteer.current()
+    if index is not None:
+        countries = index.region(continent_name)
+        if countries is None:
+            raise Exception(f"An error occurred: Region not found: {continent_name}")
+        return countries
+
+    cached = continent_cache.get(continent_name)
+    if isinstance(cached, Negative):
+        raise Exception(cached.message)
+    if cached is not MISSING:
+        return list(cached)
+
+    return upstream_flight.do(
+        ("region", continent_name), lambda: _fetch_region(continent_name)
+    )
+
+
+def _fetch_region(continent_name: str) -> list:
     # Construct the URL for the API request by appending the continent name to the base region URL.
-    REGION_URL = f"https://restcountries.com/v3.1/region/{continent_name}"
+    REGION_URL = f"{REST_COUNTRIES_URL}/region/{continent_name}"
     try:
-        response = requests.get(
-            REGION_URL
+        response = upstream.get(
+            "restcountries", REGION_URL
         )  # Send a GET request to the constructed URL.
         response.raise_for_status()  # If the response status code indicates an error, raise HTTPError.
         data = response.json()  # Parse the JSON response into a Python dictionary
 
         # Extract the common name of each country from the response data and compile a list of these names.
         countries = [country["name"]["common"] for country in data]
+        continent_cache.set(continent_name, countries)
 
-        return countries  # Return the list of country names.
+        return list(countries)  # Return the list of country names.
     except requests.exceptions.HTTPError as http_err:
-        raise Exception(f"HTTP error occurred: {http_err}")
+        message = f"HTTP error occurred: {http_err}"
+        if http_err.response is not None and http_err.response.status_code == 404:
+            continent_cache.set_negative(continent_name, message)
+        raise Exception(message)
     except Exception as err:
         raise Exception(f"An error occurred: {err}")
 
 
+# Extracts the relevant fields from a REST Countries record
+def country_details(data: dict, country_name: str) -> dict:
+    # A country can have multiple capitals (e.g South Africa), return the first if it exists, default to "Unknown"
+    capital = data.get("capital", ["Unknown"])[0] if data.get("capital") else "Unknown"
+    # Get relevant fields from data, default to "Unknown"
+    population = data.get("population", "Unknown")
+    area = data.get("area", "Unknown")
+
+    latlng = data.get("latlng", ["Unknown", "Unknown"])
+
+    if latlng and len(latlng) == 2:
+        latitude, longitude = latlng
+    else:
+        latitude, longitude = ("Unknown", "Unknown")
+
+    return {
+        "name": country_name,
+        "capital": capital,
+        "population": population,
+        "area": area,
+        "latitude": latitude,
+        "longitude": longitude,
+    }
+
+
+# Resolves a country name, ISO code or alternative spelling to (canonical name, record) with
+# the local resolver, raising for unknown countries with suggestions. When the full dataset
+# cannot be loaded (or, without `download`, is not loaded yet) the input is only
+# title-cased and the record is None: the lookup then goes to REST Countries' /name.
+def resolve_country(country_name: str, download: bool = True) -> tuple:
+    try:
+        index = resolver.current(country_cache.ttl, download)
+    except Exception:
+        index = None
+    if index is None:
+        return country_name.title(), None
+
+    record = index.resolve(country_name)
+    if record is None:
+        message = f"An error occurred: Country not found: {country_name}"
+        suggestions = index.suggest(country_name)
+        if suggestions:
+            message += f". Did you mean: {', '.join(suggestions)}?"
+        raise Exception(message)
+    return resolver.canonical_name(record), record
+
+
 def country_info(country_name: str) -> dict:
-    # Capitalize the first letter of each word to match the API's naming convention
-    country_name = country_name.title()
+    country_name, record = resolve_country(country_name)
+    if record is not None:
+        return country_details(record, country_name)
+
+    cached = country_cache.get(country_name)
+    if isinstance(cached, Negative):
+        raise Exception(cached.message)
+    if cached is not MISSING:
+        return dict(cached)
 
+    return upstream_flight.do(
+        ("country", normalize_key(country_name)), lambda: _fetch_country(country_name)
+    )
+
+
+def _fetch_country(country_name: str) -> dict:
     # Construct the URL for the API request by appending the continent name to the base region URL.
-    COUNTRY_URL = f"https://restcountries.com/v3.1/name/{country_name}"
+    COUNTRY_URL = f"{REST_COUNTRIES_URL}/name/{country_name}"
     try:
-        response = requests.get(
-            COUNTRY_URL
+        response = upstream.get(
+            "restcountries", COUNTRY_URL
         )  # Send a GET request to the constructed URL.
         response.raise_for_status()  # If the response status code indicates an error, raise HTTPError.
         data = response.json()[0]  # Parse the JSON response into a Python dictionary
 
-        # A country can have multiple capitals (e.g South Africa), return the first if it exists, default to "Unknown"
-        capital = (
-            data.get("capital", ["Unknown"])[0] if data.get("capital") else "Unknown"
-        )
-        # Get relevant fields from data, default to "Unknown"
-        population = data.get("population", "Unknown")
-        area = data.get("area", "Unknown")
-
-        latlng = data.get("latlng", ["Unknown", "Unknown"])
+        info = country_details(data, country_name)
+        country_cache.set(country_name, info)
 
-        if latlng and len(latlng) == 2:
-            latitude, longitude = latlng
-        else:
-            latitude, longitude = ("Unknown", "Unknown")
-
-        return {
-            "name": country_name,
-            "capital": capital,
-            "population": population,
-            "area": area,
-            "latitude": latitude,
-            "longitude": longitude,
-        }  # Return the relevant country info as dictionary
+        return dict(info)  # Return the relevant country info as dictionary
     except requests.exceptions.HTTPError as http_err:
-        raise Exception(f"HTTP error occurred: {http_err}")
+        message = f"HTTP error occurred: {http_err}"
+        if http_err.response is not None and http_err.response.status_code == 404:
+            country_cache.set_negative(country_name, message)
+        raise Exception(message)
     except Exception as err:
         raise Exception(f"An error occurred: {err}")
 
 
-def temperature(country_name: str) -> float:
-    country_details = country_info(country_name)
-    lat = country_details["latitude"]
-    lon = country_details["longitude"]
+# Snaps coordinates to the center of their weather grid cell
+def grid_point(lat: float, lon: float) -> tuple:
+    return (
+        round(round(lat / WEATHER_GRID) * WEATHER_GRID, 6),
+        round(round(lon / WEATHER_GRID) * WEATHER_GRID, 6),
+    )
 
-    global API_KEY
-    URL = f"http://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={API_KEY}&units=metric"
 
-    response = requests.get(URL)
+def weather_cache_for(endpoint: str):
+    return weather_cache if endpoint == "weather" else forecast_cache
+
+
+# Calls an OpenWeatherMap endpoint ("weather" or "forecast") for a location, going through
+# the weather cache. Concurrent calls for the same grid cell share one upstream request.
+# Returns the raw current weather, or the parsed series for forecasts.
+def weather_data(endpoint: str, lat: float, lon: float) -> dict:
+    lat, lon = grid_point(lat, lon)
+    weather_popularity.record((endpoint, lat, lon))
+
+    data, stale = weather_cache_for(endpoint).get_stale((lat, lon))
+    if data is not MISSING:
+        if stale:
+            _refresh_in_background(endpoint, lat, lon)
+        return data
+
+    return upstream_flight.do(
+        (endpoint, lat, lon), lambda: _fetch_weather_data(endpoint, lat, lon)
+    )
+
+
+# Fetches a grid cell's weather again whether or not it is cached, sharing a call that is
+# already in flight for it
+def refresh_weather_data(endpoint: str, lat: float, lon: float) -> dict:
+    return upstream_flight.do(
+        (endpoint, lat, lon), lambda: _fetch_weather_data(endpoint, lat, lon)
+    )
+
+
+def _fetch_weather_data(endpoint: str, lat: float, lon: float) -> dict:
+    URL = f"{OPENWEATHERMAP_URL}/{endpoint}"
+    params = {"lat": lat, "lon": lon, "appid": API_KEY, "units": "metric"}
+
+    response = upstream.get("openweathermap", URL, params)
     response.raise_for_status()  # This will raise an exception for HTTP errors
 
     data = response.json()
+    if endpoint == "forecast":
+        data = forecast_series(data)
+    weather_cache_for(endpoint).set((lat, lon), data)
+    return data
+
+
+# Refreshes a stale cache entry without making the caller wait, at most once at a time
+def _refresh_in_background(endpoint: str, lat: float, lon: float):
+    key = (endpoint, lat, lon)
+    with _refreshing_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    def refresh():
+        try:
+            refresh_weather_data(endpoint, lat, lon)
+        except Exception:
+            pass  # The stale entry keeps being served until its window ends
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(key)
+
+    _refresh_executor.submit(refresh)
+
+
+# With `allow_nowcast` the temperature is estimated from the cached forecast series for the
+# location instead of calling the current weather endpoint
+def temperature(country_name: str, allow_nowcast: bool = False) -> float:
+    country_details = country_info(country_name)
+    lat = country_details["latitude"]
+    lon = country_details["longitude"]
+
+    if allow_nowcast:
+        return nowcast_temperature(weather_data("forecast", lat, lon))
+
+    data = weather_data("weather", lat, lon)
     temperature = data["main"]["temp"]
 
     return temperature
 
 
+# The result of one country's temperature lookup, as listed or streamed by the continent
+# temperature endpoints
+def temperature_item(country: str, temp: float, error: Exception = None) -> dict:
+    if error is not None:
+        metrics.record_error(error)
+        return {"country": country, "error": str(error)}
+    return {"country": country, "temperature": temp}
+
+
+# Looks up the temperature of every country in a continent concurrently, yielding each
+# result as soon as its lookup finishes. An unknown continent raises before the first one.
+def continent_temperatures_iter(continent_name: str):
+    countries = countries_by_continent(continent_name)
+    return (
+        temperature_item(country, temp, error)
+        for country, temp, error in fan_out_iter(temperature, countries)
+    )
+
+
+# Looks up the temperature of every country in a continent concurrently, warmest first.
+# Countries without weather data are reported separately instead of failing the whole lookup.
+def continent_temperatures(continent_name: str, top: int = None) -> dict:
+    temperatures = []
+    errors = []
+    for item in continent_temperatures_iter(continent_name):
+        (errors if "error" in item else temperatures).append(item)
+
+    # Sorted on the name too, the lookups finish in any order
+    temperatures.sort(key=lambda t: (-t["temperature"], t["country"]))
+    errors.sort(key=lambda e: e["country"])
+    if top is not None:
+        temperatures = temperatures[:top]
+
+    return {"temperatures": temperatures, "errors": errors}
+
+
+# The fields a batch lookup can include for every country
+BATCH_FIELDS = ("info", "temperature", "forecast")
+# The OpenWeatherMap endpoint behind each weather field
+_FIELD_ENDPOINTS = {"temperature": "weather", "forecast": "forecast"}
+
+
+# Looks up one country of a batch: its info, then each weather field for its grid cell.
+# Failures are reported per field in "errors".
+def _batch_item(name: str, include, days: int) -> dict:
+    item = {"name": name, "errors": {}}
+    try:
+        info = country_info(name)
+        try:
+            point = grid_point(info["latitude"], info["longitude"])
+        except TypeError:  # Coordinates are "Unknown"
+            raise Exception("No coordinates available")
+    except Exception as error:
+        metrics.record_error(error)
+        item["errors"] = {field: str(error) for field in include}
+        return item
+
+    for field in include:
+        if field == "info":
+            item["info"] = dict(info)
+            continue
+        try:
+            data = weather_data(_FIELD_ENDPOINTS[field], *point)
+        except Exception as error:
+            metrics.record_error(error)
+            item["errors"][field] = str(error)
+            continue
+        if field == "temperature":
+            item["temperature"] = data["main"]["temp"]
+        else:
+            item["forecast"] = forecast_entries(data, days)
+    return item
+
+
+# Looks up several countries concurrently, yielding each country's result as soon as it is
+# complete. Countries in the same grid cell share one weather call through the cache and
+# the single-flight group. A name listed twice is yielded twice.
+def batch_lookup_iter(names: list, include=("info",), days: int = 1):
+    occurrences = Counter(names)
+    for name, item, error in fan_out_iter(
+        lambda name: _batch_item(name, include, days), occurrences
+    ):
+        if error is not None:
+            item = {"name": name, "errors": {field: str(error) for field in include}}
+        for _ in range(occurrences[name]):
+            yield dict(item)
+
+
+# Same as `batch_lookup_iter`, but returns the results in the order of `names`
+def batch_lookup(names: list, include=("info",), days: int = 1) -> list:
+    items = {item["name"]: item for item in batch_lookup_iter(names, include, days)}
+    return [dict(items[name]) for name in names]
+
+
 def forecast(country_name: str, days: int) -> list:
     country_details = country_info(country_name)
     lat = country_details["latitude"]
     lon = country_details["longitude"]
 
-    global API_KEY
-    URL = f"http://api.openweathermap.org/data/2.5/forecast?lat={lat}&lon={lon}&appid={API_KEY}&units=metric"
+    return forecast_entries(weather_data("forecast", lat, lon), days)
 
-    response = requests.get(URL)
-    response.raise_for_status()  # This will raise an exception for HTTP errors
 
-    data = response.json()
-    # Calculate how many 3-hour intervals are there in `n` days
-    forecast_limit = 8 * days  # there are 8 intervals of 3 hours in one day
+# Parses the full 5-day/3-hour forecast once into the compact series that is cached per
+# location, so every `days` value and nowcasts are served from a single upstream fetch
+def forecast_series(data: dict) -> list:
+    return [
+        {
+            "dt": forecast_entry["dt"],
+            "time": forecast_entry["dt_txt"],
+            "temperature": forecast_entry["main"]["temp"],
+        }
+        for forecast_entry in data["list"]
+    ]
 
-    forecasts = []
-    for i in range(min(forecast_limit, len(data["list"]))):
-        forecast_entry = data["list"][i]
-        forecasts.append(
-            {
-                "time": forecast_entry["dt_txt"],
-                "temperature": forecast_entry["main"]["temp"],
-            }
-        )
 
-    return forecasts
+# Length of a forecast slot in seconds, slots start at multiples of it (00:00, 03:00 UTC...)
+FORECAST_SLOT = 3 * 3600
+
 
+# Slices the 3-hourly entries covering the next `days` days out of a forecast series
+def forecast_entries(series: list, days: int, now: float = None) -> list:
+    now = time.time() if now is None else now
+    # A cached series can start with slots that are already over
+    upcoming = [entry for entry in series if entry["dt"] + FORECAST_SLOT > now]
+
+    # Calculate how many 3-hour intervals are there in `n` days
+    forecast_limit = 8 * days  # there are 8 intervals of 3 hours in one day
 
-def favorite(country_name: str) -> bool:
+    return [
+        {"time": entry["time"], "temperature": entry["temperature"]}
+        for entry in upcoming[:forecast_limit]
+    ]
+
+
+# Estimates the current temperature by interpolating between the surrounding forecast slots
+def nowcast_temperature(series: list, now: float = None) -> float:
+    now = time.time() if now is None else now
+    if not series:
+        raise Exception("No forecast data available")
+
+    previous = series[0]
+    if now <= previous["dt"]:
+        return previous["temperature"]
+    for entry in series[1:]:
+        if now <= entry["dt"]:
+            weight = (now - previous["dt"]) / (entry["dt"] - previous["dt"])
+            return round(
+                previous["temperature"]
+                + weight * (entry["temperature"] - previous["temperature"]),
+                2,
+            )
+        previous = entry
+    return previous["temperature"]
+
+
+# The name a country is stored under in the favorites, its canonical name, None for
+# unknown countries. Without the resolver the (cached) country lookup validates it.
+def _favorite_name(country_name: str):
+    try:
+        name, record = resolve_country(country_name)
+    except Exception:
+        return None
+    if record is None:
+        try:
+            country_info(name)
+        except Exception:
+            return None
+    return name
+
+
+def favorite(country_name: str, user: str = DEFAULT_USER) -> bool:
     """Mark a country as a favorite."""
-    global favorite_countries
-    country_details = country_info(country_name)
-    if country_details:
-        favorite_countries.add(country_name.title())
-        return True
-    return False
+    name = _favorite_name(country_name)
+    if name is None:
+        return False
+    favorites_store.add(user, name)
+    return True
 
 
-def unfavorite(country_name: str) -> bool:
+def unfavorite(country_name: str, user: str = DEFAULT_USER) -> bool:
     """Remove a country from favorites."""
-    global favorite_countries
-    if country_name in favorite_countries:
-        favorite_countries.remove(country_name.title())
+    try:
+        name, record = resolve_country(country_name)
+    except Exception:
+        name, record = None, None
+    if record is not None and favorites_store.remove(user, name):
         return True
+
+    # Without the resolver, or for a name it does not know (anymore), the input is matched
+    # against the stored names ignoring accents, case and punctuation
+    folded = resolver.fold(country_name)
+    for stored in favorites_store.list(user):
+        if resolver.fold(stored) == folded:
+            return favorites_store.remove(user, stored)
     return False
 
 
-def favorites() -> list:
-    """List all favorited countries."""
-    global favorite_countries
-    return list(favorite_countries)
+def favorites(user: str = DEFAULT_USER, offset: int = 0, limit: int = None) -> list:
+    """List the favorited countries, in the order they were added."""
+    return favorites_store.list(user, offset, limit)
+
+
+def favorites_count(user: str = DEFAULT_USER) -> int:
+    """Count the favorited countries."""
+    return favorites_store.count(user)
@@ -0,0 +1,3 @@
+from src.bench.harness import main
+
+main()
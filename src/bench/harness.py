@@ -0,0 +1,378 @@
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import quote
+
+import requests
+
+from src.bench.mock_upstreams import REGIONS, generate_countries, start_mocks
+
+# Drives every endpoint of a SnowbirdAPI server at fixed concurrency levels, with local
+# stand-ins for the upstreams. The server is restarted for every run, so each run starts
+# from cold caches and the upstream call counts of runs are comparable.
+
+SCENARIOS = ("continents", "country", "temperature", "forecast", "favorites")
+
+
+# The method and path of the i-th request of a worker for a scenario
+def scenario_request(scenario: str, i: int, rng: random.Random, names: list, user):
+    name = quote(rng.choice(names))
+    if scenario == "continents":
+        return "GET", f"/api/continents/{quote(rng.choice(list(REGIONS)))}"
+    if scenario == "country":
+        return "GET", f"/api/countries/{name}"
+    if scenario == "temperature":
+        return "GET", f"/api/countries/{name}/temperature"
+    if scenario == "forecast":
+        return "GET", f"/api/countries/{name}/forecast?days=3"
+    # Favorites: add, list and remove in turn, every worker with a list of its own
+    if i % 3 == 0:
+        return "POST", f"/api/favorites/{name}?user={user}"
+    if i % 3 == 1:
+        return "GET", f"/api/favorites?user={user}"
+    return "DELETE", f"/api/favorites/{name}?user={user}"
+
+
+# Nearest-rank percentile of sorted values
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, math.ceil(q / 100 * len(values)) - 1))
+    return values[index]
+
+
+def summarize(
+    latencies: list, errors: int, elapsed: float, body_bytes: int = 0
+) -> dict:
+    latencies = sorted(latencies)
+    count = len(latencies)
+    return {
+        "requests": count,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(count / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(1000 * sum(latencies) / count, 2) if count else 0.0,
+        "p50_ms": round(1000 * percentile(latencies, 50), 2),
+        "p95_ms": round(1000 * percentile(latencies, 95), 2),
+        "p99_ms": round(1000 * percentile(latencies, 99), 2),
+        "bytes_per_request": round(body_bytes / count) if count else 0,
+    }
+
+
+# Sends `total` requests for a scenario from `concurrency` threads with keep-alive sessions.
+# `headers` are sent with every request, e.g. to ask for compressed or MessagePack bodies.
+def drive(base_url, scenario, concurrency, total, names, seed=0, headers=None) -> dict:
+    latencies = []
+    errors = [0]
+    body_bytes = [0]
+    lock = threading.Lock()
+    counter = iter(range(total))
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        session = requests.Session()
+        session.headers.update(headers or {})
+        own = []
+        failed = 0
+        received = 0
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                break
+            method, path = scenario_request(scenario, i, rng, names, f"bench-{index}")
+            started = time.perf_counter()
+            try:
+                response = session.request(method, base_url + path, timeout=30)
+                # Bytes on the wire: the body as sent, before requests decompresses it
+                received += int(
+                    response.headers.get("Content-Length", len(response.content))
+                )
+                # Favorites answer 404 for an already added / removed country
+                if response.status_code >= 500 or (
+                    response.status_code >= 400 and scenario != "favorites"
+                ):
+                    failed += 1
+            except requests.exceptions.RequestException:
+                failed += 1
+            own.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(own)
+            errors[0] += failed
+            body_bytes[0] += received
+
+    threads = [
+        threading.Thread(target=worker, args=(index,)) for index in range(concurrency)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, errors[0], time.perf_counter() - started, body_bytes[0])
+
+
+# CPU seconds a process has used so far (user and system), None where /proc is missing
+def cpu_seconds(pid: int):
+    try:
+        with open(f"/proc/{pid}/stat") as file:
+            fields = file.read().rpartition(")")[2].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+# The Accept and Accept-Encoding headers of the benchmark's requests. requests asks for
+# gzip (and brotli when installed) by default, "identity" turns compression off.
+def request_headers(args) -> dict:
+    headers = {}
+    if args.accept:
+        headers["Accept"] = args.accept
+    if args.accept_encoding:
+        headers["Accept-Encoding"] = args.accept_encoding
+    return headers
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# Starts the api in its own process, so the load generator does not compete with it for
+# the GIL, and waits until it answers
+def start_server(mode: str, mocks: dict, server_args: list):
+    port = _free_port()
+    command = [
+        sys.executable,
+        "-m",
+        "src.bench.server",
+        "--mode",
+        mode,
+        "--port",
+        str(port),
+        "--api-key",
+        "bench",
+        # The stand-ins have no quota, measure the api rather than the rate limiter
+        "--weather-rate",
+        "0",
+        "--rest-countries-url",
+        mocks["restcountries"].url + "/v3.1",
+        "--openweathermap-url",
+        mocks["openweathermap"].url + "/data/2.5",
+        *server_args,
+    ]
+    process = subprocess.Popen(
+        command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode}")
+        try:
+            requests.get(base_url + "/swagger.json", timeout=1)
+            return process, base_url
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("Server did not start within 30 seconds")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def run(args, server_args: list) -> dict:
+    mocks = start_mocks(
+        countries_latency=args.countries_latency / 1000,
+        weather_latency=args.weather_latency / 1000,
+        jitter=args.jitter / 1000,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    names = [r["name"]["common"] for r in generate_countries(seed=args.seed)]
+    results = []
+    try:
+        for scenario in args.scenarios:
+            for concurrency in args.concurrency:
+                process, base_url = start_server(args.mode, mocks, server_args)
+                try:
+                    for mock in mocks.values():
+                        mock.reset()
+                    cpu_before = cpu_seconds(process.pid)
+                    result = drive(
+                        base_url,
+                        scenario,
+                        concurrency,
+                        args.requests,
+                        names,
+                        args.seed,
+                        request_headers(args),
+                    )
+                    cpu_after = cpu_seconds(process.pid)
+                finally:
+                    stop_server(process)
+                cpu_ms = None
+                if cpu_before is not None and cpu_after is not None:
+                    cpu_ms = round(1000 * (cpu_after - cpu_before) / args.requests, 3)
+                result = {
+                    "scenario": scenario,
+                    "concurrency": concurrency,
+                    **result,
+                    "server_cpu_ms_per_request": cpu_ms,
+                    "upstream_calls": {n: m.calls for n, m in mocks.items()},
+                    "upstream_errors": {n: m.errors for n, m in mocks.items()},
+                }
+                results.append(result)
+                print(_format_row(result), flush=True)
+    finally:
+        for mock in mocks.values():
+            mock.stop()
+
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "version": _git_revision(),
+        "python": platform.python_version(),
+        "options": {**vars(args), "server_args": server_args},
+        "results": results,
+    }
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+HEADER = (
+    f"{'scenario':<12} {'conc':>4} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+    f"{'p99 ms':>8} {'errors':>6} {'upstream calls':>16} {'bytes':>7} {'cpu ms':>7}"
+)
+
+
+def _format_row(result: dict) -> str:
+    calls = "/".join(str(c) for c in result["upstream_calls"].values())
+    return (
+        f"{result['scenario']:<12} {result['concurrency']:>4} "
+        f"{result['requests_per_second']:>8} {result['p50_ms']:>8} "
+        f"{result['p95_ms']:>8} {result['p99_ms']:>8} {result['errors']:>6} "
+        f"{calls:>16} {result['bytes_per_request']:>7} "
+        f"{str(result['server_cpu_ms_per_request']):>7}"
+    )
+
+
+# Prints the change of throughput, tail latency, response size and server CPU time against
+# an earlier run
+def compare(baseline: dict, current: dict):
+    before = {(r["scenario"], r["concurrency"]): r for r in baseline["results"]}
+    print(f"\nCompared to {baseline.get('version')} ({baseline.get('created')}):")
+    for result in current["results"]:
+        old = before.get((result["scenario"], result["concurrency"]))
+        if old is None:
+            continue
+        changes = []
+        for field in (
+            "requests_per_second",
+            "p95_ms",
+            "p99_ms",
+            "bytes_per_request",
+            "server_cpu_ms_per_request",
+        ):
+            if old.get(field) and result.get(field) is not None:
+                change = 100 * (result[field] - old[field]) / old[field]
+                changes.append(f"{field} {change:+.1f}%")
+        print(
+            f"{result['scenario']:<12} {result['concurrency']:>4}  "
+            + ", ".join(changes)
+        )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Benchmark SnowbirdAPI against local upstream stand-ins. Options "
+        "after -- are passed on to the server (e.g. -- --gazetteer countries.json)."
+    )
+    parser.add_argument("--mode", choices=("flask", "asgi"), default="flask")
+    parser.add_argument(
+        "--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS)
+    )
+    parser.add_argument(
+        "--concurrency", nargs="+", type=int, default=[1, 8, 32], help="Client threads"
+    )
+    parser.add_argument(
+        "--requests", type=int, default=300, help="Requests per scenario and level"
+    )
+    parser.add_argument(
+        "--countries-latency",
+        type=float,
+        default=50,
+        help="Milliseconds REST Countries takes to answer",
+    )
+    parser.add_argument(
+        "--weather-latency",
+        type=float,
+        default=100,
+        help="Milliseconds OpenWeatherMap takes to answer",
+    )
+    parser.add_argument(
+        "--jitter", type=float, default=10, help="Latency varies by +/- milliseconds"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="Share of upstream calls failing"
+    )
+    parser.add_argument(
+        "--accept",
+        type=str,
+        help="Accept header of the requests, e.g. application/msgpack",
+    )
+    parser.add_argument(
+        "--accept-encoding",
+        type=str,
+        help="Accept-Encoding header of the requests, e.g. identity, gzip or br",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--output", type=str, default="bench.json", help="Where to save the results"
+    )
+    parser.add_argument(
+        "--compare", type=str, metavar="JSON", help="Earlier results to compare with"
+    )
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    server_args = []
+    if "--" in argv:
+        index = argv.index("--")
+        argv, server_args = argv[:index], argv[index + 1 :]
+    args = build_parser().parse_args(argv)
+
+    print(HEADER)
+    report = run(args, server_args)
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"\nResults saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            compare(json.load(file), report)
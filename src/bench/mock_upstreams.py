@@ -0,0 +1,210 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+# Local stand-ins for REST Countries and OpenWeatherMap. They answer the same paths as the
+# real services from a generated dataset, after a configurable latency, and fail a share
+# of the calls with a 503 so retries and error handling show up in the numbers.
+
+REGIONS = {
+    "Africa": ("Africa", None),
+    "Asia": ("Asia", None),
+    "Europe": ("Europe", None),
+    "North America": ("Americas", "North America"),
+    "South America": ("Americas", "South America"),
+}
+
+
+# A REST Countries-like record for every generated country, the same for the same seed
+def generate_countries(per_region: int = 40, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    records = []
+    for name, (region, subregion) in REGIONS.items():
+        for i in range(1, per_region + 1):
+            common = f"{name.split()[0]}land {i:02d}"
+            records.append(
+                {
+                    "name": {"common": common, "official": f"Republic of {common}"},
+                    "capital": [f"{common} City"],
+                    "population": rng.randint(10_000, 100_000_000),
+                    "area": round(rng.uniform(100, 5_000_000), 1),
+                    "latlng": [
+                        round(rng.uniform(-60, 70), 2),
+                        round(rng.uniform(-180, 180), 2),
+                    ],
+                    "region": region,
+                    "subregion": subregion or region,
+                    "altSpellings": [common[:2].upper() + f"{i:02d}"],
+                    "cca2": common[:2].upper(),
+                    "cca3": common[:3].upper(),
+                }
+            )
+    return records
+
+
+class MockUpstream:
+    """One stand-in service on a background thread, counting the calls it answers."""
+
+    def __init__(
+        self,
+        name: str,
+        routes,
+        latency: float = 0.05,
+        jitter: float = 0.01,
+        error_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        self.name = name
+        self.routes = routes  # (path, query) -> (status, payload)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.calls = 0
+        self.errors = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return "http://%s:%s" % self._server.server_address
+
+    def _handler(self):
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive, like the real services
+
+            def do_GET(self):
+                delay, fail = upstream._draw()
+                time.sleep(delay)
+                url = urlparse(self.path)
+                if fail:
+                    status, payload = 503, {"message": "Service Unavailable"}
+                else:
+                    status, payload = upstream.routes(
+                        unquote(url.path), parse_qs(url.query)
+                    )
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    # The delay and outcome of one call, drawn under the lock so runs are reproducible
+    def _draw(self) -> tuple:
+        with self._lock:
+            self.calls += 1
+            delay = max(
+                0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter)
+            )
+            fail = self._rng.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        return delay, fail
+
+    def reset(self):
+        with self._lock:
+            self.calls = 0
+            self.errors = 0
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def rest_countries_routes(records: list):
+    by_name = {r["name"]["common"].casefold(): r for r in records}
+
+    def route(path: str, query: dict) -> tuple:
+        parts = path.rstrip("/").split("/")  # ["", "v3.1", kind, value]
+        if parts[-1] == "all":
+            return 200, records
+        if len(parts) < 4:
+            return 404, {"status": 404, "message": "Not Found"}
+        kind, value = parts[2], parts[3].casefold()
+        if kind == "region":
+            found = [
+                r
+                for r in records
+                if value in (r["region"].casefold(), r["subregion"].casefold())
+            ]
+        elif kind == "name":
+            exact = by_name.get(value)
+            found = [exact] if exact else [r for n, r in by_name.items() if value in n]
+        else:
+            found = []
+        if not found:
+            return 404, {"status": 404, "message": "Not Found"}
+        return 200, found
+
+    return route
+
+
+def openweathermap_routes(path: str, query: dict) -> tuple:
+    try:
+        lat, lon = float(query["lat"][0]), float(query["lon"][0])
+    except (KeyError, ValueError):
+        return 400, {"cod": "400", "message": "wrong latitude"}
+    temp = round(30 - abs(lat) / 3 + (lon % 7) / 10, 2)
+    if path.endswith("/weather"):
+        return 200, {"main": {"temp": temp}, "dt": int(time.time())}
+    if path.endswith("/forecast"):
+        start = int(time.time()) // 10800 * 10800
+        entries = []
+        for i in range(40):
+            dt = start + i * 10800
+            entries.append(
+                {
+                    "dt": dt,
+                    "dt_txt": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(dt)),
+                    "main": {"temp": round(temp + 3 * ((i % 8) - 4) / 4, 2)},
+                }
+            )
+        return 200, {"cnt": len(entries), "list": entries}
+    return 404, {"cod": "404", "message": "Not found"}
+
+
+# Starts both stand-ins, returns them keyed by the upstream name used in `upstream`
+def start_mocks(
+    countries_latency: float = 0.05,
+    weather_latency: float = 0.1,
+    jitter: float = 0.01,
+    error_rate: float = 0.0,
+    per_region: int = 40,
+    seed: int = 0,
+) -> dict:
+    records = generate_countries(per_region, seed)
+    return {
+        "restcountries": MockUpstream(
+            "restcountries",
+            rest_countries_routes(records),
+            countries_latency,
+            jitter,
+            error_rate,
+            seed,
+        ).start(),
+        "openweathermap": MockUpstream(
+            "openweathermap",
+            openweathermap_routes,
+            weather_latency,
+            jitter,
+            error_rate,
+            seed + 1,
+        ).start(),
+    }
@@ -0,0 +1,27 @@
+import uvicorn
+from werkzeug.serving import run_simple
+
+from src.api.app import build_parser, configure, create_app
+from src.api.asgi import create_asgi_app
+
+# Serves SnowbirdAPI for a benchmark run: the options of run.py / run_asgi.py, without the
+# debugger and reloader, and without access logs.
+
+parser = build_parser("Serve SnowbirdAPI for a benchmark run.")
+parser.add_argument("--mode", choices=("flask", "asgi"), default="flask")
+parser.add_argument("--host", type=str, default="127.0.0.1", help="Interface to bind")
+parser.add_argument("--port", type=int, default=5000, help="Port to listen on")
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    configure(args)
+    if args.mode == "asgi":
+        uvicorn.run(
+            create_asgi_app(),
+            host=args.host,
+            port=args.port,
+            log_level="warning",
+            access_log=False,
+        )
+    else:
+        run_simple(args.host, args.port, create_app(), threaded=True)
@@ -1,24 +1,22 @@
 import requests
 
+from src.client.sdk import ApiError, Client
+
 API_URL = "http://localhost:5000/api"
 
+# One pooled, caching client shared by the helpers below
+client = Client(API_URL)
+
 
 def get_countries_by_continent(continent_name):
-    response = requests.get(f"{API_URL}/continents/{continent_name}")
-    response.raise_for_status()
-    return response.json()
+    return client.continent(continent_name)
 
 
 def get_country_info(country_name):
-    API_URL = (
-        "http://localhost:5000/api"  # This should be replaced with your actual API URL
-    )
     try:
-        response = requests.get(f"{API_URL}/countries/{country_name}")
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.HTTPError as e:
-        print(f"HTTP Error: {e.response.status_code}")
+        return client.country(country_name)
+    except ApiError as e:
+        print(f"HTTP Error: {e.status}")
         return None
     except requests.exceptions.RequestException as e:
         print(f"Request failed: {e}")
@@ -26,54 +24,56 @@ def get_country_info(country_name):
 
 
 def get_temperature(country_name):
-    response = requests.get(f"{API_URL}/countries/{country_name}/temperature")
-    response.raise_for_status()
-    return response.json()
+    return client.temperature(country_name)
+
+
+# Temperatures of several countries, looked up concurrently: (name, temperature, error)
+def get_temperatures(country_names):
+    return client.temperatures(country_names)
+
+
+def get_continent_temperatures(continent_name, top=None):
+    return client.continent_temperatures(continent_name, top)
+
+
+def get_countries_near(lat, lon, radius=None, k=None, warmest=False):
+    return client.countries_near(lat, lon, radius, k, warmest)
 
 
 def favorite_country(country_name):
-    response = requests.post(f"{API_URL}/favorites/{country_name}")
-    if response.status_code == 200:
+    try:
+        client.favorite(country_name)
         print(f"{country_name} has been added to favorites")
-    else:
+    except ApiError:
         print(f"Error favoriting {country_name}")
 
 
 def unfavorite_country(country_name):
-    response = requests.delete(f"{API_URL}/favorites/{country_name}")
-    if response.status_code == 200:
+    try:
+        client.unfavorite(country_name)
         print(f"{country_name} has been removed from favorites")
-    else:
+    except ApiError:
         print(f"Error unfavoriting {country_name}")
 
 
 def list_favorites():
-    response = requests.get(f"{API_URL}/favorites")
-    response.raise_for_status()
-    return response.json()
+    return client.favorites()
 
 
 def get_forecast(country_name, days):
-    response = requests.get(f"{API_URL}/countries/{country_name}/forecast?days={days}")
-    response.raise_for_status()
-    return response.json()
+    return client.forecast(country_name, days)
 
 
 def main():
-    south_american_countries = get_countries_by_continent("South America")["countries"]
-
-    warmest_country = None
-    highest_temp = -float("inf")
+    # The API looks up all temperatures concurrently and sorts them, warmest first
+    temperatures = get_continent_temperatures("South America", top=1)["temperatures"]
 
-    for country in south_american_countries:
-        temp_info = get_temperature(country)
-        if temp_info["temperature"] > highest_temp:
-            highest_temp = temp_info["temperature"]
-            warmest_country = country
-
-    if warmest_country is None:
+    if not temperatures:
         raise Exception("No warmest country found")
 
+    warmest_country = temperatures[0]["country"]
+    highest_temp = temperatures[0]["temperature"]
+
     print(
         f"The warmest country in South America is currently {warmest_country} with a temperature of {highest_temp}°C."
     )
@@ -0,0 +1,471 @@
+import asyncio
+import json
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, urlencode
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+# Client library for the SnowbirdAPI, with a blocking `Client` (requests) and an asyncio
+# `AsyncClient` (httpx). Both keep their connections alive, retry 429/5xx responses and
+# connection errors, cache GET responses for the max-age the server sends and revalidate
+# them with their ETag afterwards, and look up many countries at once with bounded
+# concurrency. Bulk methods return (item, result, error) tuples in the order of the items,
+# exactly one of result and error is None.
+
+DEFAULT_URL = "http://localhost:5000/api"
+# Statuses worth retrying, everything else is returned (or raised) as is
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class ApiError(Exception):
+    """An error response of the api, with its status and Retry-After (in seconds) if sent."""
+
+    def __init__(self, status: int, message: str, retry_after: float = None):
+        super().__init__(f"{status}: {message}")
+        self.status = status
+        self.message = message
+        self.retry_after = retry_after
+
+
+def _retry_after(headers):
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _error(response) -> ApiError:
+    try:
+        message = response.json().get("message", "")
+    except (ValueError, AttributeError):
+        message = response.text
+    return ApiError(response.status_code, message, _retry_after(response.headers))
+
+
+# The directives of a Cache-Control header, "max-age=600, public" -> {"max-age": "600", ...}
+def parse_cache_control(value: str) -> dict:
+    directives = {}
+    for part in (value or "").split(","):
+        name, _, argument = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = argument.strip('"') or None
+    return directives
+
+
+class _Entry:
+    def __init__(self, payload, expires_at: float, etag: str, last_modified: str):
+        self.payload = payload
+        self.expires_at = expires_at
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def fresh(self) -> bool:
+        return time.monotonic() < self.expires_at
+
+    # Headers asking the server to answer 304 if the cached payload is still current
+    def validators(self) -> dict:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """Thread-safe LRU cache of GET responses, following their Cache-Control header.
+
+    Responses are served for their max-age, then revalidated with their ETag or
+    Last-Modified. `no-store` responses are not kept, `no-cache` ones always revalidated.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if entry.fresh():
+                self.hits += 1
+            return entry
+
+    def store(self, key, payload, headers):
+        directives = parse_cache_control(headers.get("Cache-Control"))
+        etag, last_modified = headers.get("ETag"), headers.get("Last-Modified")
+        if "no-store" in directives:
+            return
+        try:
+            max_age = float(directives.get("max-age") or 0)
+        except ValueError:
+            max_age = 0
+        if "no-cache" in directives:
+            max_age = 0
+        if max_age <= 0 and not (etag or last_modified):
+            return  # Could neither be served nor revalidated
+
+        entry = _Entry(payload, time.monotonic() + max_age, etag, last_modified)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    # The server answered 304: the cached payload is current for another max-age
+    def revalidate(self, key, entry: _Entry, headers):
+        with self._lock:
+            self.revalidated += 1
+        headers = {
+            "Cache-Control": headers.get("Cache-Control"),
+            "ETag": headers.get("ETag") or entry.etag,
+            "Last-Modified": headers.get("Last-Modified") or entry.last_modified,
+        }
+        self.store(key, entry.payload, headers)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "revalidated": self.revalidated,
+                "misses": self.misses,
+                "size": len(self._entries),
+            }
+
+
+class _BaseClient:
+    def __init__(
+        self,
+        base_url: str = DEFAULT_URL,
+        timeout: float = 30,
+        retries: int = 2,
+        backoff: float = 0.25,
+        max_retry_wait: float = 30,
+        concurrency: int = 16,
+        cache_size: int = 1024,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_retry_wait = max_retry_wait
+        self.concurrency = concurrency
+        self.cache = ResponseCache(cache_size) if cache_size else None
+
+    def _url(self, *segments) -> str:
+        return "/".join([self.base_url, *(quote(str(s), safe="") for s in segments)])
+
+    @staticmethod
+    def _cache_key(url: str, params: dict) -> str:
+        params = {k: v for k, v in (params or {}).items() if v is not None}
+        return f"{url}?{urlencode(sorted(params.items()))}" if params else url
+
+    # Exponential backoff with full jitter, or the server's Retry-After when it sent one
+    def _delay(self, attempt: int, response=None) -> float:
+        retry_after = _retry_after(response.headers) if response is not None else None
+        if retry_after is not None:
+            return min(retry_after, self.max_retry_wait)
+        return random.uniform(0, self.backoff * 2**attempt)
+
+    def _should_retry(self, attempt: int, response) -> bool:
+        return response.status_code in RETRY_STATUSES and attempt < self.retries
+
+    # The payload of a response, from the cache when the server answered 304
+    def _result(self, key, response, entry):
+        if response.status_code == 304 and entry is not None:
+            self.cache.revalidate(key, entry, response.headers)
+            return entry.payload
+        if response.status_code >= 400:
+            raise _error(response)
+        payload = response.json()
+        if key is not None and self.cache is not None:
+            self.cache.store(key, payload, response.headers)
+        return payload
+
+    @staticmethod
+    def _batch_body(names, include, days) -> dict:
+        return {"names": list(names), "include": list(include), "days": days}
+
+    @staticmethod
+    def _near_params(lat, lon, radius, k, warmest) -> dict:
+        return {"lat": lat, "lon": lon, "radius": radius, "k": k, "warmest": warmest}
+
+
+class Client(_BaseClient):
+    """Blocking client on a pooled requests session, safe to share between threads."""
+
+    def __init__(self, base_url: str = DEFAULT_URL, **options):
+        super().__init__(base_url, **options)
+        adapter = HTTPAdapter(pool_maxsize=self.concurrency)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    def _send(self, method: str, url: str, **kwargs):
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.request(
+                    method, url, timeout=self.timeout, **kwargs
+                )
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    raise
+                time.sleep(self._delay(attempt))
+                continue
+            if not self._should_retry(attempt, response):
+                return response
+            time.sleep(self._delay(attempt, response))
+
+    def _get(self, *segments, params: dict = None):
+        url = self._url(*segments)
+        key = self._cache_key(url, params)
+        entry = self.cache.get(key) if self.cache is not None else None
+        if entry is not None and entry.fresh():
+            return entry.payload
+        headers = entry.validators() if entry is not None else {}
+        response = self._send("GET", url, params=params, headers=headers)
+        return self._result(key, response, entry)
+
+    def _call(self, method: str, *segments, params: dict = None, body=None):
+        response = self._send(method, self._url(*segments), params=params, json=body)
+        return self._result(None, response, None)
+
+    def continent(self, name: str) -> dict:
+        return self._get("continents", name)
+
+    def continent_temperatures(self, name: str, top: int = None) -> dict:
+        return self._get("continents", name, "temperatures", params={"top": top})
+
+    def stream_continent_temperatures(self, name: str):
+        """Yield each country's temperature as soon as the api has it (NDJSON)."""
+        url = self._url("continents", name, "temperatures")
+        response = self._send("GET", url, params={"stream": "ndjson"}, stream=True)
+        with response:
+            if response.status_code >= 400:
+                raise _error(response)
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+
+    def country(self, name: str) -> dict:
+        return self._get("countries", name)
+
+    def temperature(self, name: str, nowcast: bool = False) -> dict:
+        params = {"nowcast": "true"} if nowcast else None
+        return self._get("countries", name, "temperature", params=params)
+
+    def forecast(self, name: str, days: int = 1, render: str = None) -> dict:
+        params = {"days": days, "render": render}
+        return self._get("countries", name, "forecast", params=params)
+
+    def countries_near(self, lat, lon, radius=None, k=None, warmest=False) -> dict:
+        params = self._near_params(lat, lon, radius, k, warmest)
+        return self._get("countries", "near", params=params)
+
+    def query_countries(self, **params) -> dict:
+        """Filter and sort all countries, see GET /countries/query for the parameters."""
+        return self._get("countries", "query", params=params)
+
+    def batch(self, names, include=("info",), days: int = 1) -> list:
+        body = self._batch_body(names, include, days)
+        return self._call("POST", "countries", "batch", body=body)["results"]
+
+    def favorites(self, user: str = None) -> dict:
+        return self._call("GET", "favorites", params={"user": user})
+
+    def favorite(self, name: str, user: str = None) -> dict:
+        return self._call("POST", "favorites", name, params={"user": user})
+
+    def unfavorite(self, name: str, user: str = None) -> dict:
+        return self._call("DELETE", "favorites", name, params={"user": user})
+
+    def status(self) -> dict:
+        return self._call("GET", "status")
+
+    def map(self, func, items) -> list:
+        """Call `func` for every item, at most `concurrency` at a time."""
+        items = list(items)
+
+        def call(item):
+            try:
+                return item, func(item), None
+            except Exception as err:
+                return item, None, err
+
+        if not items:
+            return []
+        workers = min(self.concurrency, len(items))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(call, items))
+
+    def countries(self, names) -> list:
+        return self.map(self.country, names)
+
+    def temperatures(self, names, nowcast: bool = False) -> list:
+        return self.map(lambda n: self.temperature(n, nowcast)["temperature"], names)
+
+    def forecasts(self, names, days: int = 1) -> list:
+        return self.map(lambda n: self.forecast(n, days)["forecast_url"], names)
+
+
+class AsyncClient(_BaseClient):
+    """asyncio client on a pooled httpx client. Use it as `async with AsyncClient() as c`,
+    or call `aclose` when done."""
+
+    def __init__(self, base_url: str = DEFAULT_URL, transport=None, **options):
+        super().__init__(base_url, **options)
+        self.client = httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=httpx.Limits(
+                max_connections=self.concurrency,
+                max_keepalive_connections=self.concurrency,
+            ),
+            transport=transport,
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def _send(self, method: str, url: str, **kwargs):
+        if "params" in kwargs:  # httpx sends None values as empty strings
+            params = kwargs["params"] or {}
+            kwargs["params"] = {k: v for k, v in params.items() if v is not None}
+        for attempt in range(self.retries + 1):
+            try:
+                response = await self.client.request(method, url, **kwargs)
+            except httpx.TransportError:
+                if attempt == self.retries:
+                    raise
+                await asyncio.sleep(self._delay(attempt))
+                continue
+            if not self._should_retry(attempt, response):
+                return response
+            await asyncio.sleep(self._delay(attempt, response))
+
+    async def _get(self, *segments, params: dict = None):
+        url = self._url(*segments)
+        key = self._cache_key(url, params)
+        entry = self.cache.get(key) if self.cache is not None else None
+        if entry is not None and entry.fresh():
+            return entry.payload
+        headers = entry.validators() if entry is not None else {}
+        response = await self._send("GET", url, params=params, headers=headers)
+        return self._result(key, response, entry)
+
+    async def _call(self, method: str, *segments, params: dict = None, body=None):
+        url = self._url(*segments)
+        response = await self._send(method, url, params=params, json=body)
+        return self._result(None, response, None)
+
+    async def continent(self, name: str) -> dict:
+        return await self._get("continents", name)
+
+    async def continent_temperatures(self, name: str, top: int = None) -> dict:
+        return await self._get("continents", name, "temperatures", params={"top": top})
+
+    async def stream_continent_temperatures(self, name: str):
+        """Yield each country's temperature as soon as the api has it (NDJSON)."""
+        url = self._url("continents", name, "temperatures")
+        params = {"stream": "ndjson"}
+        async with self.client.stream("GET", url, params=params) as response:
+            if response.status_code >= 400:
+                await response.aread()
+                raise _error(response)
+            async for line in response.aiter_lines():
+                if line:
+                    yield json.loads(line)
+
+    async def country(self, name: str) -> dict:
+        return await self._get("countries", name)
+
+    async def temperature(self, name: str, nowcast: bool = False) -> dict:
+        params = {"nowcast": "true"} if nowcast else None
+        return await self._get("countries", name, "temperature", params=params)
+
+    async def forecast(self, name: str, days: int = 1, render: str = None) -> dict:
+        params = {"days": days, "render": render}
+        return await self._get("countries", name, "forecast", params=params)
+
+    async def countries_near(self, lat, lon, radius=None, k=None, warmest=False):
+        params = self._near_params(lat, lon, radius, k, warmest)
+        return await self._get("countries", "near", params=params)
+
+    async def query_countries(self, **params) -> dict:
+        """Filter and sort all countries, see GET /countries/query for the parameters."""
+        return await self._get("countries", "query", params=params)
+
+    async def batch(self, names, include=("info",), days: int = 1) -> list:
+        body = self._batch_body(names, include, days)
+        return (await self._call("POST", "countries", "batch", body=body))["results"]
+
+    async def favorites(self, user: str = None) -> dict:
+        return await self._call("GET", "favorites", params={"user": user})
+
+    async def favorite(self, name: str, user: str = None) -> dict:
+        return await self._call("POST", "favorites", name, params={"user": user})
+
+    async def unfavorite(self, name: str, user: str = None) -> dict:
+        return await self._call("DELETE", "favorites", name, params={"user": user})
+
+    async def status(self) -> dict:
+        return await self._call("GET", "status")
+
+    async def map(self, func, items) -> list:
+        """Await `func` for every item, at most `concurrency` at a time."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def call(item):
+            async with semaphore:
+                try:
+                    return item, await func(item), None
+                except Exception as err:
+                    return item, None, err
+
+        return list(await asyncio.gather(*(call(item) for item in items)))
+
+    async def countries(self, names) -> list:
+        return await self.map(self.country, names)
+
+    async def temperatures(self, names, nowcast: bool = False) -> list:
+        async def temperature(name):
+            return (await self.temperature(name, nowcast))["temperature"]
+
+        return await self.map(temperature, names)
+
+    async def forecasts(self, names, days: int = 1) -> list:
+        async def forecast(name):
+            return (await self.forecast(name, days))["forecast_url"]
+
+        return await self.map(forecast, names)
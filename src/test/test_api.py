@@ -26,14 +26,44 @@ class APITestCase(unittest.TestCase):
         response = self.client.get("/api/continents/Europe")
         self.assertEqual(response.status_code, 200)
 
+    def test_continent_temperatures_endpoint(self):
+        response = self.client.get("/api/continents/South America/temperatures?top=3")
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(response.json["temperatures"]), 3)
+
+    def test_continent_temperatures_not_found(self):
+        response = self.client.get("/api/continents/Atlantis/temperatures")
+        self.assertEqual(response.status_code, 404)
+
     def test_country_endpoint(self):
         response = self.client.get("/api/countries/Belgium")
         self.assertEqual(response.status_code, 200)
 
+    def test_batch_endpoint(self):
+        response = self.client.post(
+            "/api/countries/batch",
+            json={
+                "names": ["Belgium", "ChakaMaka"],
+                "include": ["info", "temperature"],
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+        belgium, unknown = response.json["results"]
+        self.assertIn("temperature", belgium)
+        self.assertIn("info", unknown["errors"])
+
+    def test_batch_invalid_request(self):
+        response = self.client.post("/api/countries/batch", json={"names": []})
+        self.assertEqual(response.status_code, 400)
+
     def test_temperature_endpoint(self):
         response = self.client.get("/api/countries/Belgium/temperature")
         self.assertEqual(response.status_code, 200)
 
+    def test_temperature_nowcast_endpoint(self):
+        response = self.client.get("/api/countries/Belgium/temperature?nowcast=true")
+        self.assertEqual(response.status_code, 200)
+
     def test_temperature_invalid_country(self):
         response = self.client.get("/api/countries/ChakaMaka/temperature")
         self.assertEqual(response.status_code, 404)
@@ -70,6 +100,22 @@ class APITestCase(unittest.TestCase):
         response = self.client.get("/api/countries/Belgium/forecast")
         self.assertEqual(response.status_code, 200)
 
+    def test_forecast_local_chart(self):
+        response = self.client.get("/api/countries/Belgium/forecast?render=local")
+        self.assertEqual(response.status_code, 200)
+        chart = self.client.get(response.json["forecast_url"])
+        self.assertEqual(chart.status_code, 200)
+        self.assertEqual(chart.mimetype, "image/svg+xml")
+        cached = self.client.get(
+            response.json["forecast_url"],
+            headers={"If-None-Match": chart.headers["ETag"]},
+        )
+        self.assertEqual(cached.status_code, 304)
+
+    def test_chart_not_found(self):
+        response = self.client.get("/api/charts/0123456789abcdef")
+        self.assertEqual(response.status_code, 404)
+
     def test_favorite_post_endpoint(self):
         response = self.client.post("/api/favorites/Belgium")
         self.assertEqual(response.status_code, 200)
@@ -93,6 +139,12 @@ class APITestCase(unittest.TestCase):
         response = self.client.get("/api/countries/ChakaMaka")
         self.assertEqual(response.status_code, 404)
 
+    def test_status_endpoint(self):
+        self.client.get("/api/countries/Belgium")
+        response = self.client.get("/api/status")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("restcountries", response.json["upstreams"])
+
     def test_continent_not_found(self):
         response = self.client.get("/api/continents/Atlantis")
         self.assertEqual(response.status_code, 404)
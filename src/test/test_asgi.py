@@ -0,0 +1,155 @@
+import asyncio
+import time
+import unittest
+from unittest import mock
+
+import httpx
+
+from src.api import aio, asgi, utils
+from src.api.asgi import create_asgi_app
+from src.api.upstream import CircuitOpenError, backoff_delay
+from src.bench.mock_upstreams import start_mocks
+
+
+class AsgiAppTestCase(unittest.TestCase):
+    def setUp(self):
+        self.mocks = start_mocks(countries_latency=0, weather_latency=0, jitter=0)
+        self.urls = (utils.REST_COUNTRIES_URL, utils.OPENWEATHERMAP_URL)
+        utils.set_api_key("test")
+        utils.set_upstream_urls(
+            self.mocks["restcountries"].url + "/v3.1",
+            self.mocks["openweathermap"].url + "/data/2.5",
+        )
+        utils.configure_cache()
+        utils.configure_weather_cache()
+        aio.configure()
+        self.app = create_asgi_app()
+
+    def tearDown(self):
+        utils.set_upstream_urls(*self.urls)
+        utils.configure_cache()
+        utils.configure_weather_cache()
+        for upstream in self.mocks.values():
+            upstream.stop()
+
+    # Sends GET requests through the ASGI app, returns the responses
+    def get(self, *paths, **headers) -> list:
+        async def send():
+            transport = httpx.ASGITransport(app=self.app)
+            async with httpx.AsyncClient(
+                transport=transport, base_url="http://test"
+            ) as client:
+                responses = [await client.get(path, headers=headers) for path in paths]
+            await aio.close()
+            return responses
+
+        return asyncio.run(send())
+
+    def test_lookups(self):
+        country, temperature, unknown = self.get(
+            "/api/countries/Europeland 01",
+            "/api/countries/Europeland 01/temperature",
+            "/api/countries/Atlantis",
+        )
+        self.assertEqual(country.json()["name"], "Europeland 01")
+        self.assertIn("ETag", country.headers)
+        self.assertIn("temperature", temperature.json())
+        self.assertEqual(unknown.status_code, 404)
+
+    def test_variants_have_their_own_etag(self):
+        (json_response,) = self.get("/api/countries/Europeland 01")
+        etag = json_response.headers["ETag"]
+        (not_modified,) = self.get(
+            "/api/countries/Europeland 01", **{"If-None-Match": etag}
+        )
+        (msgpack,) = self.get(
+            "/api/countries/Europeland 01",
+            **{"If-None-Match": etag, "Accept": "application/msgpack"},
+        )
+        self.assertEqual(msgpack.status_code, 200)
+        self.assertEqual(msgpack.headers["ETag"], etag[:-1] + '-msgpack"')
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_time_dependent_responses_are_versioned_by_time(self):
+        nowcast, forecast = self.get(
+            "/api/countries/Europeland 01/temperature?nowcast=true",
+            "/api/countries/Europeland 01/forecast",
+        )
+        self.assertNotIn("Last-Modified", nowcast.headers)
+        self.assertIn("Last-Modified", forecast.headers)
+        later = time.time() + utils.FORECAST_SLOT
+        clock = mock.Mock(wraps=time)
+        clock.time.return_value = later
+        with mock.patch.object(utils, "time", clock):
+            self.assertEqual(
+                utils.data_timestamp("forecast", "Europeland 01"),
+                later - later % utils.FORECAST_SLOT,
+            )
+
+    def test_known_version_is_answered_without_a_lookup(self):
+        self.get("/api/countries/Europeland 01")
+        (response,) = self.get("/api/countries/Europeland 01")
+        etag = response.headers["ETag"]
+        with mock.patch.object(aio, "country_info") as country_info:
+            (response,) = self.get(
+                "/api/countries/Europeland 01", **{"If-None-Match": etag}
+            )
+        self.assertEqual(response.status_code, 304)
+        country_info.assert_not_called()
+
+    def test_local_chart_and_invalid_days(self):
+        forecast, invalid = self.get(
+            "/api/countries/Europeland 01/forecast?render=local",
+            "/api/countries/Europeland 01/forecast?days=6",
+        )
+        chart_url = forecast.json()["forecast_url"]
+        self.assertTrue(chart_url.startswith("http://test/api/charts/"))
+        (chart,) = self.get(chart_url[len("http://test") :])
+        self.assertTrue(chart.headers["Content-Type"].startswith("image/svg+xml"))
+        self.assertEqual(invalid.status_code, 400)
+        self.assertIn("Days", invalid.json()["message"])
+
+    def test_other_paths_go_to_flask(self):
+        (status,) = self.get("/api/status")
+        self.assertEqual(status.status_code, 200)
+        self.assertIn("caches", status.json())
+
+    def test_country_query_is_not_a_country(self):
+        (response,) = self.get("/api/countries/query?limit=2")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["countries"]), 2)
+
+    def test_countries_near_is_not_a_country(self):
+        (response,) = self.get("/api/countries/near?lat=0&lon=0&k=2")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["countries"]), 2)
+
+    def test_unknown_stream_format(self):
+        (response,) = self.get("/api/continents/Europe/temperatures?stream=bogus")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("ndjson", response.json()["message"])
+
+    def test_open_circuit_is_503(self):
+        error = CircuitOpenError("open", 12.5)
+        with mock.patch.object(aio, "countries_by_continent", side_effect=error):
+            (response,) = self.get("/api/continents/Europe")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers["Retry-After"], "13")
+
+    def test_unexpected_errors_are_logged(self):
+        with mock.patch.object(asgi, "_bool_arg", side_effect=RuntimeError("boom")):
+            with self.assertLogs("src.api.asgi", "ERROR") as logs:
+                (response,) = self.get("/api/countries/Europeland 01/temperature")
+        self.assertEqual(response.status_code, 500)
+        self.assertIn("RuntimeError: boom", logs.output[0])
+
+
+class BackoffTestCase(unittest.TestCase):
+    def test_short_retry_after_is_honoured(self):
+        self.assertEqual(backoff_delay(0.25, 1, "1"), 1.0)
+        self.assertEqual(backoff_delay(0.25, 0, "60"), 1.25)  # Capped
+        self.assertLessEqual(backoff_delay(0.25, 0, "soon"), 0.25)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+
+from src.api import utils
+from src.api.app import create_app
+from src.bench.mock_upstreams import start_mocks
+
+
+class BatchValidationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = create_app().test_client()
+
+    def post(self, body):
+        return self.client.post("/api/countries/batch", json=body)
+
+    def test_body_must_be_an_object(self):
+        response = self.post(["Belgium"])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("JSON object", response.json["message"])
+
+    def test_include_entries_must_be_field_names(self):
+        for include in ([["info"]], [{"info": 1}], ["info", 1], ["weather"]):
+            response = self.post({"names": ["Belgium"], "include": include})
+            self.assertEqual(response.status_code, 400, include)
+
+    def test_days_must_be_a_number(self):
+        for days in (True, "2", 0, 6):
+            response = self.post({"names": ["Belgium"], "days": days})
+            self.assertEqual(response.status_code, 400, days)
+
+
+class BatchLookupTestCase(unittest.TestCase):
+    def setUp(self):
+        self.mocks = start_mocks(countries_latency=0, weather_latency=0, jitter=0)
+        self.urls = (utils.REST_COUNTRIES_URL, utils.OPENWEATHERMAP_URL)
+        utils.set_api_key("test")
+        utils.set_upstream_urls(
+            self.mocks["restcountries"].url + "/v3.1",
+            self.mocks["openweathermap"].url + "/data/2.5",
+        )
+        utils.configure_cache()
+        utils.configure_weather_cache()
+        self.client = create_app().test_client()
+
+    def tearDown(self):
+        utils.set_upstream_urls(*self.urls)
+        utils.configure_cache()
+        utils.configure_weather_cache()
+        for upstream in self.mocks.values():
+            upstream.stop()
+
+    def post(self, body):
+        return self.client.post("/api/countries/batch", json=body)
+
+    def test_partial_results_with_errors_per_item(self):
+        response = self.post(
+            {
+                "names": ["Europeland 01", "Atlantis", "Asialand 02"],
+                "include": ["info", "temperature", "forecast"],
+                "days": 2,
+            }
+        )
+        self.assertEqual(response.status_code, 200)
+        europe, unknown, asia = response.json["results"]
+
+        self.assertEqual(europe["name"], "Europeland 01")
+        self.assertEqual(europe["info"]["name"], "Europeland 01")
+        self.assertIsInstance(europe["temperature"], float)
+        self.assertEqual(len(europe["forecast"]), 16)
+        self.assertEqual(europe["errors"], {})
+        self.assertEqual(asia["errors"], {})
+
+        self.assertEqual(unknown["name"], "Atlantis")
+        self.assertEqual(sorted(unknown["errors"]), ["forecast", "info", "temperature"])
+        self.assertNotIn("info", unknown)
+
+    def test_shared_coordinates_are_fetched_once(self):
+        # The same country under its name, another casing and its alternative spelling
+        names = ["Europeland 01", "europeland 01", "EU01", "Europeland 01"]
+        response = self.post({"names": names, "include": ["temperature", "forecast"]})
+        results = response.json["results"]
+        self.assertEqual([r["name"] for r in results], names)
+        self.assertEqual(len({r["temperature"] for r in results}), 1)
+        # One /weather and one /forecast call for the shared grid cell
+        self.assertEqual(self.mocks["openweathermap"].calls, 2)
+
+    def test_failed_weather_keeps_the_info(self):
+        self.mocks["openweathermap"].error_rate = 1.0
+        response = self.post(
+            {"names": ["Europeland 01"], "include": ["info", "temperature"]}
+        )
+        (item,) = response.json["results"]
+        self.assertEqual(item["info"]["name"], "Europeland 01")
+        self.assertNotIn("temperature", item)
+        self.assertIn("temperature", item["errors"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+
+import requests
+
+from src.bench.harness import percentile, summarize
+from src.bench.mock_upstreams import start_mocks
+
+
+class MockUpstreamsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.mocks = start_mocks(countries_latency=0, weather_latency=0, jitter=0)
+
+    def tearDown(self):
+        for mock in self.mocks.values():
+            mock.stop()
+
+    def test_rest_countries_paths(self):
+        url = self.mocks["restcountries"].url + "/v3.1"
+        region = requests.get(f"{url}/region/North America").json()
+        self.assertEqual(len(region), 40)
+        country = requests.get(f"{url}/name/{region[0]['name']['common']}").json()
+        self.assertEqual(country[0]["name"], region[0]["name"])
+        self.assertEqual(requests.get(f"{url}/name/Atlantis").status_code, 404)
+        self.assertEqual(self.mocks["restcountries"].calls, 3)
+
+    def test_openweathermap_paths(self):
+        url = self.mocks["openweathermap"].url + "/data/2.5"
+        params = {"lat": 50.8, "lon": 4.0, "appid": "bench"}
+        self.assertIn("temp", requests.get(f"{url}/weather", params).json()["main"])
+        self.assertEqual(
+            len(requests.get(f"{url}/forecast", params).json()["list"]), 40
+        )
+
+    def test_error_rate(self):
+        self.mocks["openweathermap"].error_rate = 1.0
+        url = self.mocks["openweathermap"].url + "/data/2.5/weather?lat=0&lon=0"
+        self.assertEqual(requests.get(url).status_code, 503)
+        self.assertEqual(self.mocks["openweathermap"].errors, 1)
+
+
+class SummaryTestCase(unittest.TestCase):
+    def test_percentiles(self):
+        values = [i / 1000 for i in range(1, 101)]
+        self.assertEqual(percentile(values, 50), 0.05)
+        self.assertEqual(percentile(values, 99), 0.099)
+        self.assertEqual(percentile([], 95), 0.0)
+
+    def test_summary(self):
+        summary = summarize([0.2, 0.1], errors=1, elapsed=0.5)
+        self.assertEqual(summary["requests_per_second"], 4.0)
+        self.assertEqual(summary["p50_ms"], 100.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import time
+import unittest
+
+from src.api.cache import TTLCache, Negative, MISSING, Popularity
+
+
+class TTLCacheTestCase(unittest.TestCase):
+    def test_keys_are_case_normalized(self):
+        cache = TTLCache(maxsize=4, ttl=60)
+        cache.set("Belgium", {"name": "Belgium"})
+        self.assertEqual(cache.get("BELGIUM"), {"name": "Belgium"})
+        self.assertEqual(cache.get(" belgium "), {"name": "Belgium"})
+
+    def test_expired_entries_are_misses(self):
+        cache = TTLCache(maxsize=4, ttl=0.01)
+        cache.set("Belgium", 1)
+        time.sleep(0.02)
+        self.assertIs(cache.get("Belgium"), MISSING)
+        self.assertEqual(cache.stats()["expirations"], 1)
+
+    def test_stale_entries_within_window(self):
+        cache = TTLCache(maxsize=4, ttl=0.01, stale_ttl=60)
+        cache.set("Belgium", 1)
+        time.sleep(0.02)
+        self.assertIs(cache.get("Belgium"), MISSING)
+        self.assertEqual(cache.get_stale("Belgium"), (1, True))
+        self.assertEqual(cache.stats()["stale_hits"], 1)
+
+    def test_least_recently_used_is_evicted(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertIs(cache.get("b"), MISSING)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_negative_entries(self):
+        cache = TTLCache(maxsize=4, ttl=60, negative_ttl=60)
+        cache.set_negative("ChakaMaka", "not found")
+        self.assertEqual(cache.get("chakamaka"), Negative("not found"))
+        self.assertEqual(cache.stats()["negative_hits"], 1)
+
+    def test_counters(self):
+        cache = TTLCache(maxsize=4, ttl=60)
+        cache.get("Belgium")
+        cache.set("Belgium", 1)
+        cache.get("Belgium")
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+
+
+class PopularityTestCase(unittest.TestCase):
+    def test_top_keys(self):
+        popularity = Popularity()
+        for key in ["a", "b", "b", "c", "c", "c"]:
+            popularity.record(key)
+        self.assertEqual(popularity.top(2), ["c", "b"])
+
+    def test_decay_forgets_unpopular_keys(self):
+        popularity = Popularity()
+        popularity.record("a", weight=10)
+        popularity.record("b", weight=0.1)
+        popularity.decay(0.1)
+        self.assertEqual(popularity.top(5), ["a"])
+
+    def test_size_is_bounded(self):
+        popularity = Popularity(maxsize=4)
+        for key in range(10):
+            popularity.record(key, weight=key)
+        self.assertLessEqual(len(popularity), 4)
+        self.assertEqual(popularity.top(1), [9])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+
+from src.api.columnar import CountryTable
+from src.bench.mock_upstreams import generate_countries
+
+
+class CountryTableTestCase(unittest.TestCase):
+    def setUp(self):
+        self.records = generate_countries(per_region=10)
+        self.records.append(
+            {"name": {"common": "Nowhere"}, "region": "Antarctic", "latlng": []}
+        )
+        self.table = CountryTable(self.records)
+
+    def test_region_and_range_filters(self):
+        total, rows = self.table.query(
+            ("name", "population"),
+            region="AFRICA",
+            ranges={"population": (10_000_000, None)},
+        )
+        expected = [
+            r["name"]["common"]
+            for r in self.records
+            if r["region"] == "Africa" and r["population"] >= 10_000_000
+        ]
+        self.assertEqual(total, len(expected))
+        self.assertEqual([row["name"] for row in rows], expected)
+
+    def test_subregions_match(self):
+        total, rows = self.table.query(region="north america")
+        self.assertEqual(total, 10)
+
+    def test_sort_and_page(self):
+        total, rows = self.table.query(("name", "area"), sort="area", descending=True)
+        areas = [row["area"] for row in rows]
+        self.assertEqual(areas[-1], "Unknown")  # Unknown values sort last
+        self.assertEqual(areas[:-1], sorted(areas[:-1], reverse=True))
+
+        total, page = self.table.query(
+            ("name",), sort="area", descending=True, offset=2, limit=3
+        )
+        self.assertEqual(total, len(self.records))
+        self.assertEqual(page, [{"name": row["name"]} for row in rows[2:5]])
+
+    def test_unknown_values_do_not_match_ranges(self):
+        total, rows = self.table.query(ranges={"latitude": (-90, 90)})
+        self.assertEqual(total, len(self.records) - 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
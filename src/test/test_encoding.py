@@ -0,0 +1,144 @@
+import gzip
+import json
+import unittest
+from collections import namedtuple
+
+import brotli
+import msgpack
+import numpy as np
+from flask import Flask
+from flask_restx import Api, Resource
+
+from src.api import encoding
+from src.api.http_cache import conditional
+
+Point = namedtuple("Point", "lat lon")
+PAYLOAD = {"country": "Belgium", "latlng": Point(50.8, 4.3), "area": np.float32(0.5)}
+
+
+class EncodingTestCase(unittest.TestCase):
+    def tearDown(self):
+        encoding.configure()
+
+    def test_json_backends_agree(self):
+        for backend in encoding.JSON_BACKENDS:
+            encoding.configure(json_backend=backend)
+            body = encoding.encode(PAYLOAD)
+            self.assertTrue(body.endswith(b"\n"))
+            self.assertEqual(
+                json.loads(body),
+                {"country": "Belgium", "latlng": [50.8, 4.3], "area": 0.5},
+            )
+            self.assertEqual(
+                encoding.canonical({"b": 1, "a": 2}),
+                encoding.canonical({"a": 2, "b": 1}),
+            )
+        with self.assertRaises(ValueError):
+            encoding.configure(json_backend="yaml")
+
+    def test_msgpack(self):
+        body = encoding.encode(PAYLOAD, "application/msgpack")
+        self.assertEqual(msgpack.unpackb(body)["latlng"], [50.8, 4.3])
+
+    def test_negotiation(self):
+        self.assertEqual(
+            encoding.negotiate_type("application/msgpack"), "application/msgpack"
+        )
+        self.assertEqual(
+            encoding.negotiate_type("text/html, */*;q=0.8"), "application/json"
+        )
+        self.assertEqual(encoding.negotiate_type(""), "application/json")
+        self.assertEqual(encoding.negotiate_coding("gzip, deflate, br"), "br")
+        self.assertEqual(encoding.negotiate_coding("br;q=0.5, gzip"), "gzip")
+        self.assertEqual(encoding.negotiate_coding("*"), "br")
+        self.assertIsNone(encoding.negotiate_coding("identity"))
+        self.assertIsNone(encoding.negotiate_coding("gzip;q=0"))
+        self.assertIsNone(encoding.negotiate_coding(None))
+
+    def test_variant_etags(self):
+        self.assertEqual(encoding.variant_etag('"e"'), '"e"')
+        self.assertEqual(
+            encoding.variant_etag('"e"', "application/msgpack", "br"), '"e-msgpack-br"'
+        )
+        self.assertEqual(
+            encoding.variant_etags('"e"', "application/msgpack", "gzip"),
+            ['"e-msgpack-gzip"', '"e-msgpack"'],
+        )
+        self.assertEqual(encoding.variant_etags('"e"', "", None), ['"e"'])
+
+    def test_compressed_above_min_size_and_reused(self):
+        body = encoding.encode({"countries": ["Belgium"] * 200})
+        small, coding = encoding.compressed(b"{}", "application/json", "gzip")
+        self.assertEqual((small, coding), (b"{}", None))
+        first, coding = encoding.compressed(body, "application/json", "gzip", '"e"')
+        self.assertEqual((gzip.decompress(first), coding), (body, "gzip"))
+        again, _ = encoding.compressed(b" " + body, "application/json", "gzip", '"e"')
+        self.assertIs(again, first)
+
+
+class FlaskEncodingTestCase(unittest.TestCase):
+    def setUp(self):
+        app = Flask(__name__)
+        api = Api(app)
+
+        @api.route("/countries")
+        class Countries(Resource):
+            @conditional(max_age=60)
+            def get(self):
+                return {"countries": ["Belgium"] * 200}, 200
+
+        encoding.register(api)
+        app.after_request(encoding.compress_response)
+        self.client = app.test_client()
+
+    def test_representations(self):
+        response = self.client.get("/countries", headers={"Accept-Encoding": "br"})
+        self.assertEqual(response.headers["Content-Encoding"], "br")
+        self.assertEqual(response.headers["Vary"], "Accept, Accept-Encoding")
+        self.assertEqual(
+            len(json.loads(brotli.decompress(response.data))["countries"]), 200
+        )
+
+        response = self.client.get(
+            "/countries",
+            headers={"Accept": "application/msgpack", "Accept-Encoding": "identity"},
+        )
+        self.assertEqual(response.headers["Content-Type"], "application/msgpack")
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertEqual(len(msgpack.unpackb(response.data)["countries"]), 200)
+
+    def test_not_modified_is_not_compressed(self):
+        etag = self.client.get("/countries").headers["ETag"]
+        response = self.client.get(
+            "/countries", headers={"If-None-Match": etag, "Accept-Encoding": "gzip"}
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertEqual(response.headers["ETag"], etag)
+
+    def test_variants_have_their_own_etag(self):
+        json_etag = self.client.get("/countries").headers["ETag"]
+        response = self.client.get(
+            "/countries",
+            headers={"If-None-Match": json_etag, "Accept": "application/msgpack"},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["ETag"], json_etag[:-1] + '-msgpack"')
+
+        br = self.client.get("/countries", headers={"Accept-Encoding": "br"})
+        self.assertEqual(br.headers["ETag"], json_etag[:-1] + '-br"')
+        response = self.client.get(
+            "/countries",
+            headers={"If-None-Match": br.headers["ETag"], "Accept-Encoding": "gzip"},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        response = self.client.get(
+            "/countries",
+            headers={"If-None-Match": br.headers["ETag"], "Accept-Encoding": "br"},
+        )
+        self.assertEqual(response.status_code, 304)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import time
+import unittest
+
+from src.api import fanout, utils
+from src.api.app import create_app
+from src.bench.mock_upstreams import start_mocks
+
+
+class FanOutTestCase(unittest.TestCase):
+    def test_keeps_order_and_reports_errors(self):
+        def square(n):
+            if n == 3:
+                raise ValueError("three")
+            time.sleep(0.01 * (5 - n))
+            return n * n
+
+        results = fanout.fan_out(square, range(5), max_workers=5)
+        self.assertEqual([item for item, _, _ in results], [0, 1, 2, 3, 4])
+        self.assertEqual(results[2], (2, 4, None))
+        self.assertIsNone(results[3][1])
+        self.assertIsInstance(results[3][2], ValueError)
+
+    def test_calls_run_concurrently(self):
+        started = time.perf_counter()
+        fanout.fan_out(lambda _: time.sleep(0.1), range(8), max_workers=8)
+        self.assertLess(time.perf_counter() - started, 0.4)
+
+
+class ContinentTemperaturesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.mocks = start_mocks(countries_latency=0, weather_latency=0.1, jitter=0)
+        self.urls = (utils.REST_COUNTRIES_URL, utils.OPENWEATHERMAP_URL)
+        utils.set_api_key("test")
+        utils.set_upstream_urls(
+            self.mocks["restcountries"].url + "/v3.1",
+            self.mocks["openweathermap"].url + "/data/2.5",
+        )
+        utils.configure_cache()
+        utils.configure_weather_cache()
+        self.client = create_app().test_client()
+
+    def tearDown(self):
+        utils.set_upstream_urls(*self.urls)
+        utils.configure_cache()
+        utils.configure_weather_cache()
+        for upstream in self.mocks.values():
+            upstream.stop()
+
+    def test_top_warmest_first(self):
+        response = self.client.get("/api/continents/Europe/temperatures?top=3")
+        self.assertEqual(response.status_code, 200)
+        temperatures = response.json["temperatures"]
+        self.assertEqual(len(temperatures), 3)
+        values = [t["temperature"] for t in temperatures]
+        self.assertEqual(values, sorted(values, reverse=True))
+        self.assertEqual(response.json["errors"], [])
+
+    def test_lookups_run_concurrently(self):
+        # 40 countries at 100ms each would take 4s one after the other
+        started = time.perf_counter()
+        response = self.client.get("/api/continents/Europe/temperatures")
+        elapsed = time.perf_counter() - started
+        self.assertEqual(len(response.json["temperatures"]), 40)
+        self.assertEqual(self.mocks["openweathermap"].calls, 40)
+        self.assertLess(elapsed, 1.5)
+
+    def test_unknown_continent(self):
+        response = self.client.get("/api/continents/Atlantis/temperatures")
+        self.assertEqual(response.status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
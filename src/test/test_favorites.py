@@ -0,0 +1,108 @@
+import multiprocessing
+import os
+import tempfile
+import unittest
+
+from src.api import gazetteer, utils
+from src.api.favorites import MemoryFavoritesStore, SQLiteFavoritesStore
+from src.bench.mock_upstreams import generate_countries
+
+
+# Runs in a forked worker: adds a favorite, failing if the parent's connection was reused
+def _add_in_child(store, parent_connection):
+    if store._connection() is parent_connection:
+        os._exit(1)
+    store.add("alice", "Brazil")
+
+
+class FavoritesStoreTests:
+    def test_add_is_case_insensitive(self):
+        self.assertTrue(self.store.add("alice", "Belgium"))
+        self.assertFalse(self.store.add("alice", "belgium"))
+        self.assertEqual(self.store.list("alice"), ["Belgium"])
+
+    def test_remove(self):
+        self.store.add("alice", "Belgium")
+        self.assertTrue(self.store.remove("alice", "BELGIUM"))
+        self.assertFalse(self.store.remove("alice", "Belgium"))
+        self.assertEqual(self.store.count("alice"), 0)
+
+    def test_favorites_are_per_user(self):
+        self.store.add("alice", "Belgium")
+        self.store.add("bob", "Brazil")
+        self.assertEqual(self.store.list("alice"), ["Belgium"])
+        self.assertEqual(self.store.list("bob"), ["Brazil"])
+
+    def test_pagination_keeps_insertion_order(self):
+        for country in ["Belgium", "Brazil", "Chile", "Niger"]:
+            self.store.add("alice", country)
+        self.assertEqual(
+            self.store.list("alice", offset=1, limit=2), ["Brazil", "Chile"]
+        )
+        self.assertEqual(self.store.list("alice", offset=3, limit=2), ["Niger"])
+        self.assertEqual(self.store.count("alice"), 4)
+
+
+class MemoryFavoritesStoreTestCase(FavoritesStoreTests, unittest.TestCase):
+    def setUp(self):
+        self.store = MemoryFavoritesStore()
+
+
+class SQLiteFavoritesStoreTestCase(FavoritesStoreTests, unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = SQLiteFavoritesStore(os.path.join(self.directory.name, "fav.db"))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_shared_between_connections(self):
+        self.store.add("alice", "Belgium")
+        other = SQLiteFavoritesStore(self.store.path)
+        self.assertEqual(other.list("alice"), ["Belgium"])
+
+    @unittest.skipUnless(hasattr(os, "fork"), "needs fork")
+    def test_forked_worker_opens_its_own_connection(self):
+        self.store.add("alice", "Belgium")
+        process = multiprocessing.get_context("fork").Process(
+            target=_add_in_child, args=(self.store, self.store._connection())
+        )
+        process.start()
+        process.join(30)
+        self.assertEqual(process.exitcode, 0)
+        self.assertEqual(self.store.list("alice"), ["Belgium", "Brazil"])
+
+
+class FavoriteNamesTestCase(unittest.TestCase):
+    def setUp(self):
+        records = generate_countries(per_region=2)
+        records[0]["name"]["common"] = "Côte d'Ivoire"
+        records[1]["name"]["common"] = "Bosnia and Herzegovina"
+        gazetteer.use(gazetteer.Gazetteer(records))
+        utils.configure_favorites()
+
+    def tearDown(self):
+        gazetteer.use(None)
+        utils.configure_favorites()
+
+    def test_canonical_names_are_removed(self):
+        self.assertTrue(utils.favorite("cote d'ivoire", "alice"))
+        self.assertTrue(utils.favorite("BOSNIA AND HERZEGOVINA", "alice"))
+        self.assertEqual(
+            utils.favorites("alice"), ["Côte d'Ivoire", "Bosnia and Herzegovina"]
+        )
+        self.assertTrue(utils.unfavorite("Cote D'Ivoire", "alice"))
+        self.assertTrue(utils.unfavorite("bosnia and herzegovina", "alice"))
+        self.assertEqual(utils.favorites_count("alice"), 0)
+        self.assertFalse(utils.unfavorite("cote d'ivoire", "alice"))
+
+    def test_names_the_resolver_does_not_know_match_the_stored_ones(self):
+        # Stored while the country dataset was unavailable, under the input name
+        utils.favorites_store.add("alice", "Bosnia & Herzégovine")
+        self.assertTrue(utils.unfavorite("bosnia and herzegovine", "alice"))
+        self.assertEqual(utils.favorites_count("alice"), 0)
+        self.assertFalse(utils.unfavorite("Atlantis", "alice"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+
+from src.api import utils
+from src.api.app import create_app
+from src.bench.mock_upstreams import start_mocks
+
+SLOT = utils.FORECAST_SLOT
+
+
+# A series of `count` slots starting at `start`, 10 degrees warmer every slot
+def series(start: int, count: int = 40) -> list:
+    return [
+        {"dt": start + i * SLOT, "time": f"slot {i}", "temperature": 10.0 * i}
+        for i in range(count)
+    ]
+
+
+class ForecastSeriesTestCase(unittest.TestCase):
+    def test_entries_skip_slots_that_are_over(self):
+        entries = utils.forecast_entries(series(0), 1, now=2 * SLOT + 1)
+        self.assertEqual(len(entries), 8)
+        self.assertEqual(entries[0], {"time": "slot 2", "temperature": 20.0})
+        self.assertEqual(len(utils.forecast_entries(series(0), 5, now=0)), 40)
+        self.assertEqual(len(utils.forecast_entries(series(0), 5, now=30 * SLOT)), 10)
+
+    def test_nowcast_interpolates_between_slots(self):
+        data = series(SLOT)
+        self.assertEqual(utils.nowcast_temperature(data, now=0), 0.0)
+        self.assertEqual(utils.nowcast_temperature(data, now=SLOT + SLOT / 4), 2.5)
+        self.assertEqual(utils.nowcast_temperature(data, now=100 * SLOT), 390.0)
+        with self.assertRaises(Exception):
+            utils.nowcast_temperature([], now=0)
+
+
+class ForecastStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.mocks = start_mocks(countries_latency=0, weather_latency=0, jitter=0)
+        self.urls = (utils.REST_COUNTRIES_URL, utils.OPENWEATHERMAP_URL)
+        utils.set_api_key("test")
+        utils.set_upstream_urls(
+            self.mocks["restcountries"].url + "/v3.1",
+            self.mocks["openweathermap"].url + "/data/2.5",
+        )
+        utils.configure_cache()
+        utils.configure_weather_cache()
+        self.client = create_app().test_client()
+
+    def tearDown(self):
+        utils.set_upstream_urls(*self.urls)
+        utils.configure_cache()
+        utils.configure_weather_cache()
+        for upstream in self.mocks.values():
+            upstream.stop()
+
+    def test_one_fetch_serves_every_days_value(self):
+        for days in (1, 3, 5):
+            forecast = utils.forecast("Europeland 01", days)
+            self.assertEqual(len(forecast), 8 * days)
+        self.assertEqual(self.mocks["openweathermap"].calls, 1)
+
+    def test_nowcast_uses_the_cached_forecast(self):
+        utils.forecast("Europeland 01", 1)
+        temperature = utils.temperature("Europeland 01", allow_nowcast=True)
+        self.assertIsInstance(temperature, float)
+        self.assertEqual(self.mocks["openweathermap"].calls, 1)
+
+        # Without nowcast the current weather endpoint is called
+        utils.temperature("Europeland 01")
+        self.assertEqual(self.mocks["openweathermap"].calls, 2)
+
+    def test_endpoints_share_the_forecast(self):
+        one = self.client.get("/api/countries/Europeland 01/forecast?days=1")
+        five = self.client.get("/api/countries/Europeland 01/forecast?days=5")
+        nowcast = self.client.get(
+            "/api/countries/Europeland 01/temperature?nowcast=true"
+        )
+        self.assertEqual([r.status_code for r in (one, five, nowcast)], [200, 200, 200])
+        self.assertEqual(self.mocks["openweathermap"].calls, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
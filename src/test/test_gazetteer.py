@@ -0,0 +1,75 @@
+import os
+import tempfile
+import unittest
+
+from src.api import gazetteer, utils
+from src.bench.mock_upstreams import generate_countries, start_mocks
+
+
+class GazetteerTestCase(unittest.TestCase):
+    def test_region_and_subregion(self):
+        index = gazetteer.Gazetteer(generate_countries(per_region=3))
+        self.assertEqual(len(index), 15)
+        self.assertEqual(
+            index.region(" EUROPE"), ["Europeland 01", "Europeland 02", "Europeland 03"]
+        )
+        self.assertEqual(len(index.region("Americas")), 6)
+        self.assertEqual(len(index.region("north america")), 3)
+        self.assertIsNone(index.region("Atlantis"))
+        index.region("Europe").clear()  # A copy
+        self.assertEqual(len(index.region("Europe")), 3)
+
+
+class SnapshotTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "countries.json")
+        self.mocks = start_mocks(countries_latency=0, weather_latency=0, jitter=0)
+        self.url = utils.REST_COUNTRIES_URL
+        utils.set_upstream_urls(self.mocks["restcountries"].url + "/v3.1")
+
+    def tearDown(self):
+        gazetteer.use(None)
+        utils.set_upstream_urls(self.url)
+        for upstream in self.mocks.values():
+            upstream.stop()
+        self.directory.cleanup()
+
+    def test_save_and_load(self):
+        records = generate_countries(per_region=2)
+        records[0]["name"]["common"] = "Côte d'Ivoire"
+        gazetteer.save_snapshot(records, self.path)
+        self.assertEqual(gazetteer.load_snapshot(self.path), records)
+        self.assertEqual(os.listdir(self.directory.name), ["countries.json"])
+
+        index = gazetteer.load(self.path)
+        self.assertIs(gazetteer.current(), index)
+        self.assertEqual(index.loaded_at, os.path.getmtime(self.path))
+        self.assertEqual(self.mocks["restcountries"].calls, 0)
+
+    def test_missing_snapshot_is_downloaded(self):
+        index = gazetteer.load(self.path)
+        self.assertEqual(len(index), 200)
+        self.assertEqual(len(gazetteer.load_snapshot(self.path)), 200)
+        self.assertEqual(self.mocks["restcountries"].calls, 1)
+
+    def test_refresh_rewrites_the_snapshot(self):
+        gazetteer.save_snapshot(generate_countries(per_region=1), self.path)
+        old = gazetteer.load(self.path)
+        index = gazetteer.refresh(self.path)
+        self.assertIsNot(index, old)
+        self.assertIs(gazetteer.current(), index)
+        self.assertEqual(len(index.region("Asia")), 40)
+        self.assertEqual(len(gazetteer.load_snapshot(self.path)), 200)
+        self.assertEqual(self.mocks["restcountries"].calls, 1)
+
+    def test_download_is_reused_until_too_old(self):
+        records, downloaded_at = gazetteer.dataset(60)
+        self.assertEqual(len(records), 200)
+        self.assertEqual(gazetteer.dataset(60), (records, downloaded_at))
+        self.assertEqual(self.mocks["restcountries"].calls, 1)
+        self.assertIsNone(gazetteer.dataset(-1, download=False))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import unittest
+
+from flask import Flask
+from flask_restx import Api, Resource
+
+from src.api import charts, encoding
+from src.api.app import create_app
+from src.api.http_cache import (
+    cache_control,
+    conditional,
+    etag_for,
+    http_date,
+    is_not_modified,
+    not_modified_etag,
+)
+
+
+class HTTPCacheTestCase(unittest.TestCase):
+    def test_etag_ignores_key_order(self):
+        self.assertEqual(etag_for({"a": 1, "b": 2}), etag_for({"b": 2, "a": 1}))
+        self.assertNotEqual(etag_for({"a": 1}), etag_for({"a": 2}))
+
+    def test_versioned_etag_does_not_serialize(self):
+        etag = etag_for(object(), 1000.5, "/api/countries/Belgium")
+        self.assertEqual(etag, etag_for(None, 1000.5, "/api/countries/Belgium"))
+        self.assertNotEqual(etag, etag_for(None, 1001.5, "/api/countries/Belgium"))
+        self.assertNotEqual(etag, etag_for(None, 1000.5, "/api/countries/France"))
+
+    def test_not_modified_etag_is_the_matching_variant(self):
+        etags = ['"a-br"', '"a"']
+        self.assertEqual(not_modified_etag(etags, None, '"a"', None), '"a"')
+        self.assertEqual(not_modified_etag(etags, None, "*", None), '"a-br"')
+        self.assertIsNone(not_modified_etag(etags, None, '"a-gzip"', None))
+
+    def test_if_none_match(self):
+        etag = etag_for({"name": "Belgium"})
+        self.assertTrue(is_not_modified(etag, None, etag, None))
+        self.assertTrue(is_not_modified(etag, None, f'"other", W/{etag}', None))
+        self.assertTrue(is_not_modified(etag, None, "*", None))
+        self.assertFalse(is_not_modified(etag, None, '"other"', None))
+
+    def test_if_none_match_takes_precedence(self):
+        etag = etag_for({"name": "Belgium"})
+        self.assertFalse(is_not_modified(etag, 1000, '"other"', http_date(2000)))
+
+    def test_if_modified_since(self):
+        etag = etag_for({"name": "Belgium"})
+        self.assertTrue(is_not_modified(etag, 1000, None, http_date(1000)))
+        self.assertFalse(is_not_modified(etag, 3000, None, http_date(2000)))
+        self.assertFalse(is_not_modified(etag, 1000, None, "not a date"))
+        self.assertFalse(is_not_modified(etag, None, None, http_date(2000)))
+
+    def test_cache_control(self):
+        self.assertEqual(cache_control(600), "public, max-age=600")
+        self.assertEqual(cache_control(0), "no-cache")
+        self.assertEqual(cache_control(60, private=True), "private, max-age=60")
+
+
+class ConditionalTestCase(unittest.TestCase):
+    def setUp(self):
+        app = Flask(__name__)
+        api = Api(app)
+        self.calls = 0
+
+        @api.route("/countries/<string:name>")
+        class Country(Resource):
+            @conditional(max_age=60, last_modified=lambda name: 1000.0)
+            def get(resource, name):
+                self.calls += 1
+                return {"name": name}, 200
+
+        encoding.register(api)
+        self.client = app.test_client()
+
+    def test_known_version_is_answered_without_the_method(self):
+        etag = self.client.get("/countries/Belgium").headers["ETag"]
+        response = self.client.get(
+            "/countries/Belgium", headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers["ETag"], etag)
+        self.assertEqual(self.calls, 1)
+
+        response = self.client.get("/countries/France", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.calls, 2)
+
+
+class ChartTestCase(unittest.TestCase):
+    def test_compressed_chart_is_revalidated(self):
+        forecasts = [{"time": str(i), "temperature": i % 7} for i in range(40)]
+        chart_hash = charts.store_chart(charts.chart_config("Belgium", 5, forecasts))
+        client = create_app().test_client()
+        path = f"/api/charts/{chart_hash}"
+        response = client.get(path, headers={"Accept-Encoding": "br"})
+        self.assertEqual(response.headers["ETag"], f'"{chart_hash}-br"')
+        response = client.get(
+            path,
+            headers={
+                "Accept-Encoding": "br",
+                "If-None-Match": response.headers["ETag"],
+            },
+        )
+        self.assertEqual(response.status_code, 304)
+
+
+if __name__ == "__main__":
+    unittest.main()
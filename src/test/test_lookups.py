@@ -0,0 +1,34 @@
+import unittest
+
+from src.api import lookups
+from src.api.quota import QuotaExceededError
+
+
+class LookupsTestCase(unittest.TestCase):
+    def test_argument_checks(self):
+        self.assertEqual(lookups.check_days(5), 5)
+        for days in (0, 6, True, "2"):
+            with self.assertRaises(ValueError):
+                lookups.check_days(days)
+        self.assertIsNone(lookups.check_top(None))
+        with self.assertRaises(ValueError):
+            lookups.check_top(0)
+        with self.assertRaises(ValueError):
+            lookups.check_renderer("png")
+        self.assertEqual(lookups.stream_format("sse", ""), "sse")
+        with self.assertRaises(ValueError):
+            lookups.stream_format(None, "application/x-ndjson", 3)
+
+    def test_failure(self):
+        self.assertEqual(
+            lookups.failure(Exception("Country not found: Atlantis")),
+            (404, "Country not found: Atlantis", None),
+        )
+        self.assertEqual(
+            lookups.failure(QuotaExceededError("used up", retry_after=2.2)),
+            (429, "used up", 3),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
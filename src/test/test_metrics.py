@@ -0,0 +1,59 @@
+import unittest
+
+import requests
+
+from src.api import metrics
+from src.api.upstream import CircuitOpenError
+
+
+class MetricsTestCase(unittest.TestCase):
+    def test_error_cause_follows_wrapped_exceptions(self):
+        try:
+            try:
+                raise requests.exceptions.ReadTimeout("read timed out")
+            except Exception as err:
+                raise Exception(f"An error occurred: {err}")
+        except Exception as wrapped:
+            self.assertEqual(metrics.error_cause(wrapped), "timeout")
+
+    def test_error_cause_upstream_status(self):
+        response = requests.models.Response()
+        response.status_code = 503
+        error = requests.exceptions.HTTPError("503 Server Error", response=response)
+        self.assertEqual(metrics.error_cause(error), "upstream_http_503")
+        response.status_code = 404
+        self.assertEqual(metrics.error_cause(error), "not_found")
+
+    def test_error_cause_without_upstream_error(self):
+        self.assertEqual(metrics.error_cause(CircuitOpenError("open")), "circuit_open")
+        self.assertEqual(
+            metrics.error_cause(Exception("Country not found: Atlantis")), "not_found"
+        )
+        self.assertEqual(
+            metrics.error_cause(ValueError("Invalid continent")), "invalid"
+        )
+        self.assertEqual(metrics.error_cause(KeyError("main")), "other")
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram("test_seconds", "Test", ("route",))
+        self.addCleanup(metrics._registry.remove, histogram)
+        histogram.observe(0.02, "/a")
+        histogram.observe(3, "/a")
+        lines = histogram.render()
+        self.assertIn('test_seconds_bucket{route="/a",le="0.01"} 0', lines)
+        self.assertIn('test_seconds_bucket{route="/a",le="0.025"} 1', lines)
+        self.assertIn('test_seconds_bucket{route="/a",le="+Inf"} 2', lines)
+        self.assertIn('test_seconds_count{route="/a"} 2', lines)
+
+    def test_upstream_calls_are_attributed_to_the_request(self):
+        timing = metrics.start_request("/test", "GET")
+        metrics.upstream_finished(
+            "test-upstream", metrics.upstream_started("test-upstream"), 200
+        )
+        metrics.finish_request(timing, 200)
+        self.assertEqual(timing.upstreams["test-upstream"][0], 1)
+        self.assertIn("test-upstream;dur=", metrics.server_timing(timing))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+
+from src.api import utils
+from src.api.prefetch import CallBudget, Prefetcher
+from src.bench.mock_upstreams import start_mocks
+
+
+class CallBudgetTestCase(unittest.TestCase):
+    def test_calls_per_minute(self):
+        budget = CallBudget(2)
+        self.assertTrue(budget.acquire())
+        self.assertTrue(budget.acquire())
+        self.assertFalse(budget.acquire())
+        self.assertEqual(budget.remaining(), 0)
+
+
+class PrefetcherTestCase(unittest.TestCase):
+    def setUp(self):
+        self.mocks = start_mocks(countries_latency=0, weather_latency=0, jitter=0)
+        self.urls = (utils.REST_COUNTRIES_URL, utils.OPENWEATHERMAP_URL)
+        utils.set_upstream_urls(
+            self.mocks["restcountries"].url + "/v3.1",
+            self.mocks["openweathermap"].url + "/data/2.5",
+        )
+        utils.configure_cache()
+        utils.configure_weather_cache(weather_ttl=0)
+        utils.weather_popularity.decay(0)
+
+    def tearDown(self):
+        utils.set_upstream_urls(*self.urls)
+        utils.configure_cache()
+        utils.configure_weather_cache()
+        for mock in self.mocks.values():
+            mock.stop()
+
+    def test_warm_fills_countries_and_continents_with_one_call(self):
+        prefetcher = Prefetcher()
+        prefetcher.warm()
+        self.assertEqual(self.mocks["restcountries"].calls, 1)
+        self.assertEqual(prefetcher.warmed_continents, 5)
+        self.assertEqual(len(utils.countries_by_continent("Europe")), 40)
+        self.assertEqual(utils.country_info("asialand 02")["name"], "Asialand 02")
+        self.assertEqual(self.mocks["restcountries"].calls, 1)
+
+    def test_refreshes_the_most_requested_cells_within_budget(self):
+        for name in ["Europeland 01"] * 3 + ["Asialand 02"] * 2 + ["Africaland 03"]:
+            utils.temperature(name)
+        calls = self.mocks["openweathermap"].calls
+
+        prefetcher = Prefetcher(top=2, budget=1)
+        prefetcher.run_once()
+        self.assertEqual(self.mocks["openweathermap"].calls, calls + 1)
+        self.assertEqual((prefetcher.refreshed, prefetcher.deferred), (1, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
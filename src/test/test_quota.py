@@ -0,0 +1,113 @@
+import unittest
+from unittest import mock
+
+import requests
+
+from src.api import metrics, resources
+from src.api.app import create_app
+from src.api.quota import Governor, QuotaExceededError, TokenBucket
+from src.api.upstream import CircuitOpenError, overload
+
+
+class TokenBucketTestCase(unittest.TestCase):
+    def test_refills_up_to_burst(self):
+        bucket = TokenBucket(per_minute=60, burst=2)
+        start = bucket.updated
+        bucket.take()
+        bucket.take()
+        self.assertAlmostEqual(bucket.wait(start), 1.0)
+        self.assertEqual(bucket.wait(start + 1), 0.0)
+        bucket.wait(start + 100)
+        self.assertEqual(bucket.tokens, 2)
+
+    def test_queued_callers_wait_longer(self):
+        bucket = TokenBucket(per_minute=60, burst=1)
+        start = bucket.updated
+        bucket.take()
+        bucket.take()  # Reserved ahead of time
+        self.assertAlmostEqual(bucket.wait(start), 2.0)
+
+    def test_unlimited_bucket_only_waits_while_resting(self):
+        bucket = TokenBucket()
+        start = bucket.updated
+        for _ in range(1000):
+            bucket.take()
+        self.assertEqual(bucket.wait(start), 0.0)
+        bucket.rest(30, start)
+        self.assertAlmostEqual(bucket.wait(start + 10), 20.0)
+
+
+class GovernorTestCase(unittest.TestCase):
+    def test_rotates_over_keys(self):
+        governor = Governor("test", per_minute=60, burst=2, keys=["a", "b"])
+        keys = [governor.reserve()[0] for _ in range(4)]
+        self.assertEqual(sorted(keys), ["a", "a", "b", "b"])
+
+    def test_sheds_when_wait_exceeds_max_wait(self):
+        governor = Governor("test", per_minute=60, burst=1, max_wait=0.5)
+        governor.reserve()
+        with self.assertRaises(QuotaExceededError) as raised:
+            governor.reserve()
+        self.assertGreater(raised.exception.retry_after, 0.5)
+        self.assertEqual(governor.shed, 1)
+
+    def test_burst_defaults_to_the_per_minute_rate(self):
+        governor = Governor("test", per_minute=60, max_wait=2)
+        waits = [governor.reserve()[1] for _ in range(60)]  # A cold continent fan-out
+        self.assertEqual(max(waits), 0.0)
+        self.assertEqual(governor.shed, 0)
+
+    def test_queues_within_max_wait(self):
+        governor = Governor("test", per_minute=60, burst=1, max_wait=2)
+        governor.reserve()
+        key, wait = governor.reserve()
+        self.assertGreater(wait, 0.5)
+        self.assertEqual(governor.queued, 1)
+
+    def test_throttled_key_rests(self):
+        governor = Governor("test", keys=["a", "b"], key_param="appid")
+        governor.throttled("a", "30")
+        self.assertEqual({governor.reserve()[0] for _ in range(3)}, {"b"})
+        self.assertEqual(governor.params({"lat": 1}, "b"), {"lat": 1, "appid": "b"})
+        self.assertEqual(governor.stats()["keys"]["key0"]["calls"], 0)
+
+    def test_stats_hide_keys(self):
+        governor = Governor("test", per_minute=60, keys=["secret"])
+        self.assertNotIn("secret", str(governor.stats()))
+
+
+class OverloadTestCase(unittest.TestCase):
+    def test_quota_exceeded_is_429(self):
+        try:
+            try:
+                raise QuotaExceededError("used up", retry_after=2.2)
+            except Exception as err:
+                raise Exception(f"An error occurred: {err}")
+        except Exception as wrapped:
+            self.assertEqual(overload(wrapped), (429, 3))
+
+    def test_circuit_open_and_upstream_429_are_503(self):
+        self.assertEqual(overload(CircuitOpenError("open", 12.5)), (503, 13))
+        response = requests.models.Response()
+        response.status_code = 429
+        response.headers["Retry-After"] = "7"
+        error = requests.exceptions.HTTPError("429", response=response)
+        self.assertEqual(overload(error), (503, 7))
+
+    def test_other_errors(self):
+        self.assertIsNone(overload(Exception("Country not found: Atlantis")))
+
+
+class ContinentOverloadTestCase(unittest.TestCase):
+    def test_quota_exceeded_is_429(self):
+        error = QuotaExceededError("used up", retry_after=2.2)
+        with mock.patch.object(resources, "countries_by_continent", side_effect=error):
+            response = create_app().test_client().get("/api/continents/Europe")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers["Retry-After"], "3")
+        route = ("/api/continents/<string:continent_name>", "quota_exceeded")
+        self.assertEqual(metrics.lookup_errors._values[route], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+
+from src.api.resolver import Resolver, fold
+
+RECORDS = [
+    {
+        "name": {"common": "Niger", "official": "Republic of Niger"},
+        "cca2": "NE",
+        "cca3": "NER",
+        "altSpellings": ["NE", "Nijar"],
+    },
+    {
+        "name": {"common": "Nigeria", "official": "Federal Republic of Nigeria"},
+        "cca2": "NG",
+        "cca3": "NGA",
+        "altSpellings": ["NG", "Nijeriya"],
+    },
+    {
+        "name": {"common": "Ivory Coast", "official": "Republic of Côte d'Ivoire"},
+        "cca2": "CI",
+        "cca3": "CIV",
+        "altSpellings": ["CI", "Côte d'Ivoire", "Ivory Coast"],
+    },
+    {
+        "name": {"common": "Bosnia and Herzegovina"},
+        "cca2": "BA",
+        "cca3": "BIH",
+        "altSpellings": ["BA", "Bosnia-Herzegovina"],
+    },
+]
+
+
+class ResolverTestCase(unittest.TestCase):
+    def setUp(self):
+        self.resolver = Resolver(RECORDS)
+
+    def resolve(self, name):
+        record = self.resolver.resolve(name)
+        return record["name"]["common"] if record is not None else None
+
+    def test_fold(self):
+        self.assertEqual(fold("  Côte d’Ivoire "), "cote divoire")
+        self.assertEqual(fold("Bosnia & Herzegovina"), "bosnia and herzegovina")
+        self.assertEqual(fold("Bosnia-Herzegovina"), "bosnia herzegovina")
+
+    def test_exact_name_before_partial_match(self):
+        self.assertEqual(self.resolve("niger"), "Niger")
+        self.assertEqual(self.resolve("NIGERIA"), "Nigeria")
+
+    def test_codes_and_alt_spellings(self):
+        self.assertEqual(self.resolve("nga"), "Nigeria")
+        self.assertEqual(self.resolve("CI"), "Ivory Coast")
+        self.assertEqual(self.resolve("Cote d'Ivoire"), "Ivory Coast")
+        self.assertEqual(self.resolve("Bosnia & Herzegovina"), "Bosnia and Herzegovina")
+
+    def test_partial_match_must_be_unambiguous(self):
+        self.assertEqual(self.resolve("herzeg"), "Bosnia and Herzegovina")
+        self.assertIsNone(self.resolve("nige"))
+        self.assertIsNone(self.resolve("ni"))
+        self.assertIsNone(self.resolve(""))
+
+    def test_suggestions(self):
+        self.assertEqual(self.resolver.suggest("Nigerai")[0], "Nigeria")
+        self.assertEqual(self.resolver.suggest("Ivroy Cost"), ["Ivory Coast"])
+        self.assertEqual(self.resolver.suggest("Atlantis"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
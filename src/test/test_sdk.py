@@ -0,0 +1,140 @@
+import asyncio
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+
+from src.client.sdk import ApiError, AsyncClient, Client, parse_cache_control
+
+
+# A stand-in for the api: countries are cached for a minute, temperatures have to be
+# revalidated, "Flaky" fails once with a 503 and "Atlantis" does not exist
+class FakeApi:
+    def __init__(self):
+        self.calls = []
+        self.flaky_failed = False
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return "http://%s:%s/api" % self.server.server_address
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def respond(self, path: str, headers) -> tuple:
+        parts = unquote(path).split("/")  # ["", "api", "countries", name, ...]
+        name = parts[3]
+        self.calls.append((path, headers.get("If-None-Match")))
+        if name == "Atlantis":
+            return 404, {"message": "Country not found: Atlantis"}, {}
+        if name == "Flaky" and not self.flaky_failed:
+            self.flaky_failed = True
+            return 503, {"message": "Unavailable"}, {"Retry-After": "0"}
+        if parts[4:] == ["temperature"]:
+            etag = f'"{name}"'
+            cache = {"ETag": etag, "Cache-Control": "public, max-age=0"}
+            if headers.get("If-None-Match") == etag:
+                return 304, None, cache
+            return 200, {"temperature": float(len(name))}, cache
+        return 200, {"name": name}, {"Cache-Control": "public, max-age=60"}
+
+    def _handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                status, payload, headers = api.respond(
+                    urlparse(self.path).path, self.headers
+                )
+                body = json.dumps(payload).encode() if payload is not None else b""
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+class ClientTestCase(unittest.TestCase):
+    def setUp(self):
+        self.api = FakeApi()
+        self.client = Client(self.api.url, backoff=0)
+
+    def tearDown(self):
+        self.client.close()
+        self.api.stop()
+
+    def test_parse_cache_control(self):
+        self.assertEqual(
+            parse_cache_control("public, max-age=600"),
+            {"public": None, "max-age": "600"},
+        )
+
+    def test_fresh_responses_are_served_from_the_cache(self):
+        self.assertEqual(self.client.country("Belgium"), {"name": "Belgium"})
+        self.assertEqual(self.client.country("Belgium"), {"name": "Belgium"})
+        self.assertEqual(len(self.api.calls), 1)
+        self.assertEqual(self.client.cache.stats()["hits"], 1)
+
+    def test_expired_responses_are_revalidated(self):
+        self.assertEqual(self.client.temperature("Belgium"), {"temperature": 7.0})
+        self.assertEqual(self.client.temperature("Belgium"), {"temperature": 7.0})
+        self.assertEqual(self.api.calls[-1][1], '"Belgium"')
+        self.assertEqual(self.client.cache.stats()["revalidated"], 1)
+
+    def test_retries_and_errors(self):
+        self.assertEqual(self.client.country("Flaky"), {"name": "Flaky"})
+        with self.assertRaises(ApiError) as raised:
+            self.client.country("Atlantis")
+        self.assertEqual(raised.exception.status, 404)
+        self.assertIn("Atlantis", raised.exception.message)
+
+    def test_bulk_keeps_order_and_reports_errors(self):
+        results = self.client.temperatures(["Peru", "Atlantis", "Chile", "Flaky"])
+        self.assertEqual(
+            [name for name, _, _ in results], ["Peru", "Atlantis", "Chile", "Flaky"]
+        )
+        self.assertEqual(results[0][1:], (4.0, None))
+        self.assertIsInstance(results[1][2], ApiError)
+        self.assertEqual(results[3][1], 5.0)
+
+
+class AsyncClientTestCase(unittest.TestCase):
+    def setUp(self):
+        self.api = FakeApi()
+
+    def tearDown(self):
+        self.api.stop()
+
+    def test_bulk_and_cache(self):
+        async def run():
+            async with AsyncClient(self.api.url, backoff=0, concurrency=2) as client:
+                results = await client.countries(["Peru", "Atlantis", "Flaky"])
+                again = await client.country("Peru")
+                return results, again
+
+        results, again = asyncio.run(run())
+        self.assertEqual(results[0], ("Peru", {"name": "Peru"}, None))
+        self.assertEqual(results[1][2].status, 404)
+        self.assertEqual(results[2][1], {"name": "Flaky"})
+        self.assertEqual(again, {"name": "Peru"})
+        self.assertEqual(
+            [path for path, _ in self.api.calls].count("/api/countries/Peru"), 1
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import multiprocessing
+import os
+import tempfile
+import time
+import unittest
+
+from src.api import charts, gazetteer
+from src.api.cache import MISSING, Negative, TTLCache
+from src.api.shared_cache import SQLiteTTLCache, create_cache
+
+
+def _store_in_child(path: str):
+    SQLiteTTLCache(path, "weather").set((50.8, 4.3), {"temperature": 12.5})
+
+
+class SQLiteTTLCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "cache.db")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def cache(self, name: str = "countries", **options) -> SQLiteTTLCache:
+        return SQLiteTTLCache(self.path, name, **options)
+
+    def test_values_and_keys_round_trip(self):
+        cache = self.cache()
+        cache.set("Belgium", {"name": "Belgium", "latlng": (50.8, 4.3)})
+        cache.set((50.8, 4.3), [1, 2])
+        self.assertEqual(
+            cache.get(" BELGIUM"), {"name": "Belgium", "latlng": (50.8, 4.3)}
+        )
+        self.assertEqual(cache.get((50.8, 4.3)), [1, 2])
+        self.assertIs(cache.get((4.3, 50.8)), MISSING)
+
+    def test_shared_between_instances_not_between_names(self):
+        self.cache().set("Belgium", 1)
+        self.assertEqual(self.cache().get("Belgium"), 1)
+        self.assertIs(self.cache("continents").get("Belgium"), MISSING)
+
+    def test_shared_between_processes(self):
+        process = multiprocessing.get_context("spawn").Process(
+            target=_store_in_child, args=(self.path,)
+        )
+        process.start()
+        process.join(30)
+        self.assertEqual(self.cache("weather").get((50.8, 4.3)), {"temperature": 12.5})
+
+    def test_expired_and_stale_entries(self):
+        cache = self.cache(ttl=0.01, stale_ttl=60)
+        cache.set("Belgium", 1)
+        time.sleep(0.02)
+        self.assertIs(cache.get("Belgium"), MISSING)
+        self.assertEqual(cache.get_stale("Belgium"), (1, True))
+        self.assertLess(cache.expires_in("Belgium"), 0)
+        self.assertEqual(cache.stats()["stale_hits"], 1)
+
+    def test_negative_entries_expire_without_stale_window(self):
+        cache = self.cache(negative_ttl=0.01, stale_ttl=60)
+        cache.set_negative("ChakaMaka", "not found")
+        self.assertEqual(cache.get("chakamaka"), Negative("not found"))
+        time.sleep(0.02)
+        self.assertEqual(cache.get_stale("ChakaMaka"), (MISSING, False))
+
+    def test_oldest_entries_are_evicted(self):
+        cache = self.cache(maxsize=2)
+        for key in ["a", "b", "c"]:
+            cache.set(key, key)
+        self.assertIs(cache.get("a"), MISSING)
+        self.assertEqual((cache.get("b"), cache.get("c")), ("b", "c"))
+        self.assertEqual((len(cache), cache.stats()["evictions"]), (2, 1))
+
+    def test_create_cache(self):
+        self.assertIsInstance(create_cache(ttl=60), TTLCache)
+        shared = create_cache(self.path, "weather", ttl=60, stale_ttl=30)
+        self.assertEqual(
+            (shared.name, shared.ttl, shared.stale_ttl), ("weather", 60, 30)
+        )
+
+    def test_charts_are_shared(self):
+        charts.configure_store(self.path)
+        self.addCleanup(charts.configure_store)
+        config = charts.chart_config("Belgium", 1, [{"time": "0", "temperature": 1}])
+        key = charts.store_chart(config)
+        charts.configure_store(self.path)  # Another worker, or after a restart
+        self.assertEqual(charts.get_chart(key), charts.render_svg(config))
+
+    def test_dataset_download_is_shared(self):
+        records = [{"name": {"common": "Belgium"}}]
+        SQLiteTTLCache(self.path, "datasets").set(gazetteer.ALL_URL, (records, 1.0))
+        gazetteer.set_shared_cache(SQLiteTTLCache(self.path, "datasets"))
+        try:
+            self.assertIsNone(gazetteer.dataset(60, download=False))  # Too old
+            self.assertEqual(
+                gazetteer.dataset(time.time(), download=False), (records, 1.0)
+            )
+        finally:
+            gazetteer.set_shared_cache(None)
+
+
+if __name__ == "__main__":
+    unittest.main()
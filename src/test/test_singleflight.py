@@ -0,0 +1,47 @@
+import threading
+import time
+import unittest
+
+from src.api.singleflight import SingleFlight
+
+
+class SingleFlightTestCase(unittest.TestCase):
+    def test_concurrent_callers_share_one_call(self):
+        flight = SingleFlight("test_share")
+        calls = []
+
+        def slow_lookup():
+            calls.append(1)
+            time.sleep(0.05)
+            return 21.5
+
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(flight.do("Brazil", slow_lookup))
+            )
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, [21.5] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flight.stats()["coalesced"], 4)
+
+    def test_errors_are_shared_and_not_kept(self):
+        flight = SingleFlight("test_errors")
+
+        def failing_lookup():
+            raise ValueError("upstream down")
+
+        with self.assertRaises(ValueError):
+            flight.do("Brazil", failing_lookup)
+        self.assertEqual(flight.do("Brazil", lambda: 1), 1)
+        self.assertEqual(flight.stats()["in_flight"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import random
+import unittest
+
+import numpy as np
+
+from src.api.app import create_app
+from src.api.spatial import MAX_WARMEST_CANDIDATES, SpatialIndex, haversine_km
+
+
+class SpatialIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(1)
+        self.lats = [rng.uniform(-90, 90) for _ in range(500)] + [np.nan]
+        self.lons = [rng.uniform(-180, 180) for _ in range(500)] + [0.0]
+        self.index = SpatialIndex(self.lats, self.lons)
+
+    def brute_force(self, lat, lon, radius_km):
+        distances = haversine_km(lat, lon, self.lats, self.lons)
+        return sorted(np.flatnonzero(distances <= radius_km), key=distances.__getitem__)
+
+    def test_haversine(self):
+        # Brussels to Paris
+        distance = haversine_km(
+            50.8503, 4.3517, np.array([48.8566]), np.array([2.3522])
+        )
+        self.assertAlmostEqual(float(distance[0]), 264, delta=2)
+
+    def test_radius_matches_brute_force(self):
+        # Includes points near the poles and across the date line
+        for lat, lon, radius in [
+            (50, 4, 1500),
+            (0, 179.5, 2500),
+            (-85, 30, 1000),
+            (89, -170, 300),
+            (10, -60, 20000),
+        ]:
+            indices, distances = self.index.near(lat, lon, radius)
+            self.assertEqual(list(indices), self.brute_force(lat, lon, radius))
+            self.assertTrue(all(np.diff(distances) >= 0))
+
+    def test_k_nearest(self):
+        indices, distances = self.index.near(20, 20, k=5)
+        self.assertEqual(list(indices), self.brute_force(20, 20, 1e9)[:5])
+
+    def test_unknown_coordinates_are_never_returned(self):
+        indices, _ = self.index.near(0, 0)
+        self.assertNotIn(len(self.lats) - 1, indices)
+        self.assertEqual(len(indices), len(self.lats) - 1)
+
+
+class NearbyValidationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = create_app().test_client()
+
+    def get(self, query):
+        return self.client.get(f"/api/countries/near?lat=50.8&lon=4.3&{query}")
+
+    def test_k_is_capped_by_the_warmest_candidates(self):
+        response = self.get(f"k={MAX_WARMEST_CANDIDATES + 1}&warmest=true")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(
+            f"between 1 and {MAX_WARMEST_CANDIDATES}", response.json["message"]
+        )
+
+    def test_k_bounds(self):
+        for k in (0, 251):
+            self.assertEqual(self.get(f"k={k}").status_code, 400, k)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import json
+import time
+import unittest
+
+from src.api import metrics, streaming
+from src.api.app import create_app
+from src.api.streaming import encode, headers, requested_format
+
+
+class StreamingTestCase(unittest.TestCase):
+    def test_requested_format(self):
+        self.assertEqual(requested_format("ndjson"), "ndjson")
+        self.assertEqual(requested_format(None, "text/event-stream"), "sse")
+        self.assertEqual(requested_format(None, "application/x-ndjson, */*"), "ndjson")
+        self.assertIsNone(requested_format(None, "application/json"))
+        with self.assertRaises(ValueError):
+            requested_format("xml", "text/event-stream")
+
+    def test_ndjson(self):
+        items = [{"country": "Belgium"}, {"country": "France"}]
+        lines = "".join(encode(items, "ndjson")).splitlines()
+        self.assertEqual([json.loads(line) for line in lines], items)
+
+    def test_sse_ends_with_count(self):
+        events = "".join(encode([{"country": "Belgium"}], "sse")).split("\n\n")
+        self.assertEqual(events[0], 'event: result\ndata: {"country": "Belgium"}')
+        self.assertEqual(events[1], 'event: end\ndata: {"count": 1}')
+
+    def test_empty_stream(self):
+        self.assertEqual(list(encode([], "ndjson")), [])
+        self.assertEqual(
+            list(encode([], "sse")), ['event: end\ndata: {"count": 0}\n\n']
+        )
+
+    def test_headers(self):
+        self.assertEqual(headers("sse")["Content-Type"], "text/event-stream")
+        self.assertEqual(headers("ndjson")["Cache-Control"], "no-cache")
+
+
+class StreamedMetricsTestCase(unittest.TestCase):
+    def test_timed_until_closed(self):
+        app = create_app()
+
+        def results():
+            time.sleep(0.2)
+            metrics.record_error(Exception("Country not found: Atlantis"))
+            yield {"country": "Belgium"}
+
+        app.add_url_rule(
+            "/slow-stream",
+            "slow_stream",
+            lambda: streaming.response(results(), "ndjson"),
+        )
+        response = app.test_client().get("/slow-stream")
+        self.assertNotIn("Server-Timing", response.headers)
+        self.assertEqual(response.get_data(), b'{"country": "Belgium"}\n')
+        response.close()
+        series = metrics.request_duration._values[("/slow-stream", "GET", "200")]
+        self.assertGreaterEqual(series[-2], 0.2)
+        self.assertEqual(
+            metrics.lookup_errors._values[("/slow-stream", "not_found")], 1
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
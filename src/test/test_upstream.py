@@ -0,0 +1,126 @@
+import time
+import unittest
+
+import requests
+
+from src.api import upstream, utils
+from src.api.upstream import CircuitBreaker, CircuitOpenError, Upstream
+from src.bench.mock_upstreams import start_mocks
+
+
+class CircuitBreakerTestCase(unittest.TestCase):
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "closed")
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+        self.assertFalse(breaker.allow())
+        self.assertGreater(breaker.retry_after(), 29)
+
+    def test_lets_one_probe_through_after_the_cooldown(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure()
+        time.sleep(0.06)
+        self.assertEqual(breaker.state, "half-open")
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())  # Until the probe's outcome is known
+
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")
+
+
+class UpstreamTestCase(unittest.TestCase):
+    def setUp(self):
+        self.mocks = start_mocks(countries_latency=0, weather_latency=0, jitter=0)
+        self.url = self.mocks["restcountries"].url + "/v3.1/name/Europeland 01"
+
+    def tearDown(self):
+        for mock in self.mocks.values():
+            mock.stop()
+
+    def test_reuses_pooled_connections(self):
+        client = Upstream("restcountries")
+        for _ in range(5):
+            self.assertEqual(client.get(self.url).status_code, 200)
+        stats = client.stats()
+        self.assertEqual(stats["requests"], 5)
+        self.assertEqual(stats["circuit"], "closed")
+        (pool,) = stats["pools"]
+        self.assertEqual(pool["connections_opened"], 1)
+        self.assertEqual(pool["requests"], 5)
+
+    def test_retries_server_errors(self):
+        self.mocks["restcountries"].error_rate = 1.0
+        client = Upstream("restcountries", retries=2, backoff=0)
+        response = client.get(self.url)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.mocks["restcountries"].calls, 3)
+        self.assertEqual((client.retried, client.failures), (2, 1))
+
+    def test_returns_client_errors_without_retrying(self):
+        client = Upstream("restcountries", retries=2, backoff=0)
+        url = self.mocks["restcountries"].url + "/v3.1/name/Atlantis"
+        self.assertEqual(client.get(url).status_code, 404)
+        self.assertEqual(self.mocks["restcountries"].calls, 1)
+        self.assertEqual(client.breaker.failures, 0)
+
+    def test_circuit_opens_after_failures(self):
+        self.mocks["restcountries"].error_rate = 1.0
+        client = Upstream("restcountries", retries=0, failure_threshold=2)
+        client.get(self.url)
+        client.get(self.url)
+        with self.assertRaises(CircuitOpenError) as raised:
+            client.get(self.url)
+        self.assertEqual(self.mocks["restcountries"].calls, 2)
+        self.assertGreater(raised.exception.retry_after, 0)
+        self.assertEqual(client.stats()["circuit"], "open")
+
+    def test_connection_errors_are_retried(self):
+        url = self.mocks["restcountries"].url
+        self.mocks["restcountries"].stop()
+        client = Upstream("restcountries", retries=1, backoff=0, connect_timeout=0.5)
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            client.get(url)
+        self.assertEqual((client.requests, client.failures), (2, 1))
+
+
+class SharedUpstreamsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.mocks = start_mocks(countries_latency=0, weather_latency=0, jitter=0)
+        self.urls = (utils.REST_COUNTRIES_URL, utils.OPENWEATHERMAP_URL)
+        utils.set_upstream_urls(self.mocks["restcountries"].url + "/v3.1")
+        utils.configure_cache()
+        upstream.configure(retries=1, backoff=0)
+
+    def tearDown(self):
+        upstream.configure()
+        utils.set_upstream_urls(*self.urls)
+        utils.configure_cache()
+        for mock in self.mocks.values():
+            mock.stop()
+
+    def test_lookups_go_through_the_shared_clients(self):
+        utils.countries_by_continent("Europe")
+        utils.countries_by_continent("Asia")
+        stats = upstream.pool_stats()
+        self.assertEqual(stats["restcountries"]["requests"], 2)
+        self.assertEqual(stats["restcountries"]["pools"][0]["connections_opened"], 1)
+        self.assertEqual(stats["openweathermap"]["requests"], 0)
+
+    def test_failed_lookup_after_retries(self):
+        self.mocks["restcountries"].error_rate = 1.0
+        with self.assertRaises(Exception):
+            utils.countries_by_continent("Europe")
+        self.assertEqual(self.mocks["restcountries"].calls, 2)
+        self.assertEqual(upstream.pool_stats()["restcountries"]["retries"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()